@@ -4,7 +4,8 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler # Optional: for log rotation
 
-from flask import Flask, jsonify
+import time
+from flask import Flask, jsonify, request, g, Response
 from flask_caching import Cache # Import Cache
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -98,7 +99,9 @@ logger.info("Applying Cache configuration...")
 cache = None
 try:
     # Read cache settings from environment variables or use defaults
-    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    # A configured Redis URL implies the shared Redis backend; SimpleCache is per-process
+    default_cache_type = 'RedisCache' if os.environ.get('CACHE_REDIS_URL') else 'SimpleCache'
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', default_cache_type)
     app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
     logger.info(f"Cache Type set to: {app.config['CACHE_TYPE']}")
     logger.info(f"Cache Default Timeout set to: {app.config['CACHE_DEFAULT_TIMEOUT']}")
@@ -121,19 +124,14 @@ try:
 
     # Initialize Cache AFTER setting app.config
     # This step registers the cache with the app instance
-    
-    config = {
-             "DEBUG": True,          # some Flask specific configs
-             "CACHE_TYPE": "RedisCache",  # Flask-Caching related configs
-             "CACHE_DEFAULT_TIMEOUT": 300,
-             "CACHE_REDIS_URL": "redis://localhost:6379/0"  
-             }
-
-    # tell Flask to use the above defined config
-    app.config.from_mapping(config)
     cache = Cache(app)
     logger.info("Flask-Caching initialized successfully.")
 
+    # In-process L1 in front of a shared (Redis) backend; writes are broadcast so every
+    # worker drops its L1 copy. Reached through app.services.profile_cache.get_cache().
+    from app.services.tiered_cache import init_tiered_cache
+    init_tiered_cache(app, app.extensions['cache'][cache])
+
 except ImportError:
     logger.error("Flask-Caching is not installed (ImportError). Caching disabled. Run: pip install Flask-Caching")
     # cache remains None
@@ -198,13 +196,15 @@ logger.info("Importing and registering blueprints...")
 try:
     from app.api.webhook import webhook as webhook_blueprint
     from app.api.custom_llm import custom_llm as custom_llm_blueprint
+    from app.api.diagnostics import diagnostics as diagnostics_blueprint
     # Import other blueprints here
 
     app.register_blueprint(webhook_blueprint, url_prefix='/api/webhook')
     app.register_blueprint(custom_llm_blueprint, url_prefix='/api/custom_llm')
+    app.register_blueprint(diagnostics_blueprint, url_prefix='/api/diagnostics')
     # Register other blueprints here
 
-    logger.info("Registered blueprints: webhook, custom_llm")
+    logger.info("Registered blueprints: webhook, custom_llm, diagnostics")
 except NameError as ne:
      # This usually means the import failed silently earlier
      logger.error(f"Failed to register blueprints because they were likely not imported successfully: {ne}", exc_info=True)
@@ -213,6 +213,33 @@ except Exception as e:
 # --- End Register Blueprints ---
 
 
+# --- Request Metrics ---
+# Latency per route template (bounded label set), exposed on /metrics with the other
+# in-process metrics (dependency calls, cache hit/miss, SSE streams, job queue depth).
+from app.services.metrics import get_histogram, render_prometheus
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # If set, /metrics requires "Authorization: Bearer <token>"
+
+
+@app.before_request
+def _start_request_timer():
+    g._request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    started = g.get('_request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        histogram = get_histogram("http_request_duration_seconds",
+                                  {"route": route, "method": request.method, "status": str(response.status_code)})
+        # Observed when the server closes the response, so streamed (SSE) bodies count until
+        # their last chunk is written rather than until the headers are sent
+        response.call_on_close(lambda: histogram.observe(time.perf_counter() - started))
+    return response
+# --- End Request Metrics ---
+
+
 # ------------------------------
 # Define Global Routes (if any)
 # ------------------------------
@@ -223,6 +250,14 @@ def index():
     return jsonify({"message": "Server is running..."})
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint for this worker's metrics."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/endpoints')
 def list_endpoints():
     """Lists all registered API endpoints for debugging."""
@@ -1,11 +1,12 @@
 # app/api/custom_llm.py
 
 import os
+import time
 import logging
 import json
 import pandas as pd
 # --- Flask and Extensions Imports ---
-from flask import Blueprint, request, jsonify, Response, current_app
+from flask import Blueprint, request, jsonify, Response
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, decode_token
 # --- ---
 
@@ -15,11 +16,12 @@ from pydantic import ValidationError # Keep for potential future model use
 # Import Supabase functions from the designated DB interaction file
 from app.api.supabase_db import (
     check_if_user_exists,
-    create_supabase_user,
+    upsert_login_user,
+    login_fingerprint,
     get_supabase_user_id_by_email,
     get_supabase_user_data_by_id,
-    update_user_setting,
-    update_user_character_detail,
+    character_op,
+    apply_character_ops,
     get_user_preferences as get_user_preferences_from_db # Rename DB fetch for clarity
 )
 # --- End Database Function Imports ---
@@ -27,7 +29,9 @@ from app.api.supabase_db import (
 # --- Personalization Imports ---
 from app.personalization.user_preferences import (
     get_llm_context_from_session,
-    generate_session_hash
+    get_session_artifact_pointer,
+    generate_session_hash,
+    build_personalized_system_prompt
     # get_user_preferences is handled by db import and cache
 )
 # --- End Personalization Imports ---
@@ -36,10 +40,54 @@ from app.personalization.user_preferences import (
 from app.rag import pinecone_rag # Assuming this module is correctly set up
 # --- End RAG Imports ---
 
+# --- Artifact Store Imports ---
+from app.services.artifact_store import get_artifact_meta, iter_artifact
+# --- End Artifact Store Imports ---
+
+# --- Cache Imports ---
+from app.services.profile_cache import (
+    get_cache,
+    get_cached_profile_entry,
+    profile_etag,
+    get_unchanged_login_user_id,
+    remember_login
+)
+# --- End Cache Imports ---
+
+# --- Login Warm-up ---
+from app.services.warmup import schedule_user_warmup, get_warm_status, get_warm_preferences
+# --- End Login Warm-up ---
+
+# --- Tracing ---
+from app.services.tracing import start_trace, span, hand_off_to_stream
+from app.services.metrics import track_active_stream
+# --- End Tracing ---
+
+# --- Memory Diagnostics ---
+from app.services.memory_diagnostics import register_memory_report, deep_sizeof
+# --- End Memory Diagnostics ---
+
+# --- Filler Mode ---
+from app.services.filler_stream import choose_filler, stream_with_filler
+# --- End Filler Mode ---
+
+# --- Admission Control ---
+from app.services.admission import admit, admission_scope, hold_for_stream, Shed, FALLBACK_REPLY, RETRY_AFTER_S
+# --- End Admission Control ---
+
+# --- Profile Write Coalescing ---
+from app.services.write_coalescer import get_profile_write_coalescer
+# --- End Profile Write Coalescing ---
+
+# --- Background Job Imports ---
+from app.services.job_runner import pop_finished_jobs_for_call, describe_job_outcome
+# --- End Background Job Imports ---
+
 # --- LLM Streaming Imports ---
 from app.functions.get_custom_llm_streaming import (
     client_openai, # Your configured OpenAI client instance
     generate_streaming_response,
+    generate_streaming_text,
     generate_streaming_introduction,
     provide_interaction_assistance,
     augment_system_lists
@@ -66,6 +114,17 @@ except Exception as e:
     atomic_habits_keywords = []
 
 
+def _keyword_index_size():
+    # The DataFrame's numpy buffers aren't gc-tracked, so pandas reports its own size
+    frame = globals().get('df')
+    frame_bytes = int(frame.memory_usage(deep=True).sum()) if frame is not None else 0
+    return {"items": len(atomic_habits_keywords),
+            "bytes": frame_bytes + deep_sizeof(atomic_habits_keywords)["bytes"]}
+
+
+register_memory_report("custom_llm.atomic_habits_keywords", _keyword_index_size)
+
+
 # Initialize Pinecone indexes (ensure pinecone_rag handles initialization)
 try:
     user_index = pinecone_rag.user_index
@@ -120,7 +179,7 @@ def generate_token():
         logger.warning("Token request missing username or email.")
         return jsonify({"error": "Username and email are required."}), 400
 
-    cache = current_app.extensions.get('cache')
+    cache = get_cache()
     if not cache: logger.warning("Cache unavailable in /token. Proceeding without caching.")
 
     supabase_user_id = None
@@ -144,34 +203,32 @@ def generate_token():
             }
         }
 
-        # Check existence and create/update user and profile in one go
-        # create_supabase_user now handles both cases:
+        # Create/update user and profile in one round trip (upsert_login_user RPC):
         # - If user doesn't exist -> Creates user, creates profile, returns NEW ID
-        # - If user exists -> Updates user (if needed), updates profile (upsert), returns EXISTING ID
-        supabase_user_id = create_supabase_user(user_details)
-
-        if not supabase_user_id:
-            # create_supabase_user logs specific reasons (duplicate username/email, DB error)
-            logger.error(f"Failed to get or create Supabase user for {email}.")
-            return jsonify({"error": "User processing failed."}), 500
-        logger.info(f" Ensured Supabase user exists for {email} with ID: {supabase_user_id}")
-
-        # --- Fetch and Cache Preferences ---
-        user_prefs = None
-        cache_key = f"user_prefs_{supabase_user_id}"
-        if cache:
-            try: user_prefs = cache.get(cache_key)
-            except Exception as ce: logger.error(f"Cache get failed: {ce}"); user_prefs = None
-
-        if user_prefs is None:
-            logger.info(f"Cache miss/unavailable for {supabase_user_id}. Fetching prefs.")
-            user_prefs = get_user_preferences_from_db(supabase_user_id)
-            if cache and user_prefs is not None:
-                try: cache.set(cache_key, user_prefs or DEFAULT_PREFERENCES)
-                except Exception as ce: logger.error(f"Cache set failed: {ce}")
-            elif not user_prefs: logger.warning(f"DB pref fetch failed for {supabase_user_id}.")
-        else: logger.info(f"Cache hit for {supabase_user_id}.")
-        # --- End Fetch and Cache ---
+        # - If user exists -> Updates user, updates profile (keeping current_bg/character), returns EXISTING ID
+        # Returning users whose login fields haven't changed skip the DB entirely
+        fingerprint = login_fingerprint(user_details)
+        supabase_user_id = get_unchanged_login_user_id(email, fingerprint)
+        if supabase_user_id:
+            logger.info(f"Login details unchanged for {email}; skipping user upsert.")
+        else:
+            supabase_user_id = upsert_login_user(user_details, fingerprint=fingerprint)
+
+            if not supabase_user_id:
+                # upsert_login_user logs specific reasons (duplicate username/email, DB error)
+                logger.error(f"Failed to get or create Supabase user for {email}.")
+                return jsonify({"error": "User processing failed."}), 500
+            logger.info(f" Ensured Supabase user exists for {email} with ID: {supabase_user_id}")
+            remember_login(email, fingerprint, supabase_user_id)
+
+        # --- Warm Per-User State ---
+        # Preferences, profile and system prompt load in the background (plus this worker's
+        # upstream connections), so the token returns now and the first chat turn finds them cached
+        try:
+            if schedule_user_warmup(supabase_user_id): logger.info(f"Scheduled warm-up for {supabase_user_id}.")
+        except Exception as we:
+            logger.error(f"Failed to schedule warm-up for {supabase_user_id}: {we}")
+        # --- End Warm Per-User State ---
 
         # Create the access token using the retrieved/created Supabase UUID
         access_token = create_access_token(identity=supabase_user_id)
@@ -188,7 +245,11 @@ def generate_token():
 @custom_llm.route('/user')
 @jwt_required()
 def get_user_profile():
-    """Gets combined user and profile data from Supabase using JWT identity."""
+    """
+    Gets combined user and profile data from Supabase using JWT identity.
+    Sends an ETag (hash of the profile); a poll with a matching If-None-Match gets 304,
+    answered from the profile cache without touching Supabase.
+    """
     try:
         supabase_user_uuid = get_jwt_identity() # This is the Supabase UUID
         if not supabase_user_uuid:
@@ -196,15 +257,29 @@ def get_user_profile():
              return jsonify({"error": "Authentication identity missing."}), 401
 
         logger.info(f"Fetching profile for Supabase user ID: {supabase_user_uuid}")
-        user_data = get_supabase_user_data_by_id(supabase_user_uuid)
+        entry = get_cached_profile_entry(supabase_user_uuid, get_supabase_user_data_by_id)
 
-        if not user_data:
+        if not entry:
              logger.warning(f"User profile not found for Supabase ID: {supabase_user_uuid}")
              return jsonify({"error": "User profile not found."}), 404
 
+        etag = entry["etag"]
+        coalescer = get_profile_write_coalescer()
+        if coalescer.has_pending(supabase_user_uuid):
+            # Show /color and /character updates that are acknowledged but not yet written
+            profile = coalescer.overlay(supabase_user_uuid, entry["profile"], apply_character_ops)
+            entry = {"profile": profile, "etag": profile_etag(profile)}
+            etag = entry["etag"]
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if request.if_none_match.contains_weak(etag.strip('"')):
+            logger.debug(f"Profile unchanged for {supabase_user_uuid} (304)")
+            return Response(status=304, headers=headers)
+
         # Data should already be in dictionary format
         logger.debug(f"Returning user data for {supabase_user_uuid}")
-        return jsonify(user=user_data, success=True)
+        response = jsonify(user=entry["profile"], success=True)
+        response.headers.update(headers)
+        return response
 
     except Exception as e:
         # Log the specific exception
@@ -228,28 +303,14 @@ def update_user_color():
         logger.warning(f"Color update request missing/invalid color value for user {supabase_user_uuid}")
         return jsonify({"error": "Valid color value is required."}), 400
 
-    # Access cache via extensions
-    cache = current_app.extensions.get('cache')
-
     logger.info(f"Updating 'current_bg' to '{color}' for Supabase user ID: {supabase_user_uuid}")
     try:
-        success = update_user_setting(supabase_user_uuid, 'current_bg', color)
+        # Coalesced with other quick updates; the profile cache is invalidated when it is written
+        success = get_profile_write_coalescer().submit_settings(supabase_user_uuid, {'current_bg': color})
         if not success:
              logger.error(f"Failed to update color setting in DB for user {supabase_user_uuid}.")
              return jsonify({"error": "Failed to update color setting."}), 500
 
-        # --- Invalidate Cache ---
-        if cache: # Check if cache object is valid
-            try:
-                cache_key = f"user_prefs_{supabase_user_uuid}"
-                cache.delete(cache_key)
-                logger.info(f"Invalidated preferences cache for user {supabase_user_uuid} after color update.")
-            except Exception as cache_err:
-                logger.error(f"Failed to invalidate cache key {cache_key} after color update: {cache_err}")
-        else:
-            logger.warning("Cache not available, skipping cache invalidation for color update.")
-        # --- End Invalidate Cache ---
-
         return jsonify(success=True)
     except Exception as e:
         logger.error(f"Error processing color update for user {supabase_user_uuid}: {e}", exc_info=True)
@@ -262,39 +323,33 @@ def update_user_color():
 @custom_llm.route('/character', methods=['POST'])
 @jwt_required()
 def update_user_character():
-    """Updates character details in the user_profiles JSONB column via Supabase."""
+    """
+    Updates character details in the user_profiles JSONB column via Supabase.
+    Body: {"key": ..., "value": ...} for one field, or {"updates": [{"key", "value"}, ...]}
+    to apply several fields atomically in one round trip.
+    """
     supabase_user_uuid = get_jwt_identity()
     if not supabase_user_uuid: return jsonify({"error": "Authentication identity missing."}), 401
 
-    key = request.json.get('key')
-    value = request.json.get('value') # Value can be string, number, boolean, list item, etc.
-
-    if not key or not isinstance(key, str):
+    updates = request.json.get('updates')
+    if updates is None:
+        # Value can be string, number, boolean, list item, etc.
+        updates = [{"key": request.json.get('key'), "value": request.json.get('value')}]
+    if not isinstance(updates, list) or not updates or \
+            any(not isinstance(u, dict) or not u.get('key') or not isinstance(u.get('key'), str) for u in updates):
         logger.warning(f"Character update request missing/invalid key for user {supabase_user_uuid}")
         return jsonify({"error": "Valid key is required for character update."}), 400
+    keys = ", ".join(u['key'] for u in updates)
 
-    # Access cache via extensions
-    cache = current_app.extensions.get('cache')
-
-    logger.info(f"Updating character field '{key}' for Supabase user ID: {supabase_user_uuid}")
+    logger.info(f"Updating character field(s) '{keys}' for Supabase user ID: {supabase_user_uuid}")
     try:
-        success = update_user_character_detail(supabase_user_uuid, key, value)
+        # Coalesced with other quick updates; the profile cache is invalidated when it is written
+        success = get_profile_write_coalescer().submit_character_ops(
+            supabase_user_uuid, [character_op(u['key'], u.get('value')) for u in updates])
         if not success:
-             logger.error(f"Failed to update character detail '{key}' in DB for user {supabase_user_uuid}.")
+             logger.error(f"Failed to update character detail '{keys}' in DB for user {supabase_user_uuid}.")
              return jsonify({"error": "Failed to update character detail."}), 500
 
-        # --- Invalidate Cache ---
-        if cache: # Check if cache object is valid
-            try:
-                cache_key = f"user_prefs_{supabase_user_uuid}"
-                cache.delete(cache_key)
-                logger.info(f"Invalidated preferences cache for user {supabase_user_uuid} after character update.")
-            except Exception as cache_err:
-                 logger.error(f"Failed to invalidate cache key {cache_key} after character update: {cache_err}")
-        else:
-             logger.warning("Cache not available, skipping cache invalidation for character update.")
-        # --- End Invalidate Cache ---
-
         return jsonify(success=True)
     except Exception as e:
         logger.error(f"Error processing character update for user {supabase_user_uuid}: {e}", exc_info=True)
@@ -302,6 +357,33 @@ def update_user_character():
 # ==============================================================================
 
 
+# ==============================================================================
+# --- Session Artifact Route ---
+# ==============================================================================
+@custom_llm.route('/sessions/<session_id>/artifacts/<kind>')
+@jwt_required()
+def stream_session_artifact(session_id: str, kind: str):
+    """
+    Streams a session's transcript or message array, decompressed, from the artifact store.
+    Artifacts are content-addressed and immutable, so the sha256 doubles as a strong ETag.
+    """
+    supabase_user_uuid = get_jwt_identity()
+    if not supabase_user_uuid: return jsonify({"error": "Authentication identity missing."}), 401
+
+    artifact_id = get_session_artifact_pointer(session_id, supabase_user_uuid, kind)
+    meta = get_artifact_meta(artifact_id) if artifact_id else None
+    if not meta:
+        return jsonify({"error": f"No {kind} stored for this session."}), 404
+
+    etag = f'"{meta.sha256}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable",
+               "Content-Length": str(meta.size)}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={"ETag": etag})
+    logger.info(f"Streaming {kind} artifact {meta.sha256[:12]} ({meta.size} bytes) for session (hash) {session_id[:8]}...")
+    return Response(iter_artifact(meta.sha256), mimetype=meta.content_type, headers=headers)
+# ==============================================================================
+
 # ==============================================================================
 # --- Chat Completions Route ---
 # ==============================================================================
@@ -311,8 +393,142 @@ def openai_advanced_chat_completions_route_new():
     """
     Handle POST requests from Vapi (structured like OpenAI API + call/assistant info)
     for chat completions with personalization and RAG.
-    Logs detailed information about the LLM request context.
+    Each turn is traced: stage timings (and TTFT for streamed replies) are logged per turn
+    and aggregated into the in-process stage histograms.
+    Turns pass admission control after authentication; a streamed turn holds its slot
+    until the stream ends.
+    """
+    with start_trace("chat_completion"), admission_scope():
+        return _handle_chat_completion()
+
+
+def _overload_response(shed: Shed, model: str, stream: bool):
+    """Fast reply for a shed turn: a spoken fallback for streams, 503 otherwise."""
+    headers = {"Retry-After": str(RETRY_AFTER_S), "X-Admission": f"shed_{shed.reason}"}
+    if stream:
+        return Response(generate_streaming_text(FALLBACK_REPLY, model), content_type='text/event-stream', headers=headers)
+    return jsonify({"error": "Server is busy, retry shortly.", "reason": shed.reason}), 503, headers
+
+
+def _prepare_llm_request(query_string, user_preferences, llm_context, call_id,
+                         messages_from_vapi_request, model_name_from_vapi_request,
+                         temperature_from_vapi_request, stream_flag_from_vapi_request,
+                         max_tokens_from_vapi_request, tools_from_vapi_request,
+                         spoken_prefix=None) -> dict:
+    """
+    RAG retrieval plus prompt assembly for one turn; returns the OpenAI request payload.
+    Runs inline, or next to the filler stream when filler mode is on.
     """
+    book_contexts = []
+    if user_index and book_index and atomic_habits_keywords and query_string: # RAG only if there's a query string
+        try:
+            with span("rag.classify", dependency="openai"):
+                classification_result = pinecone_rag.classify(query_string, atomic_habits_keywords)
+            classification_label = classification_result.label
+            logger.info(f"RAG classification for query: {classification_label}")
+            if classification_label == "PERSONAL":
+                with span("rag.query", index="user"):
+                    res = pinecone_rag.query_pinecone_user(query_string, user_index, top_k=1, namespace='user-data-openai-embedding')
+                if res and res.get('matches'): book_contexts.extend([x.get('metadata', {}).get('text', '') for x in res['matches']])
+            elif classification_label == "ATOMIC_HABITS":
+                with span("rag.query", index="book"):
+                    context_strings = pinecone_rag.query_pinecone_book(query_string, top_k=1, namespace='ah-test')
+                book_contexts.extend(context_strings)
+            logger.debug(f"Retrieved {len(book_contexts)} RAG context snippets.")
+        except Exception as rag_e:
+            logger.error(f"Error during RAG query: {rag_e}", exc_info=True)
+            book_contexts = []
+    elif not query_string:
+        logger.info("No query string for RAG (likely an assistant turn with tool_calls or tool_response). Skipping RAG.")
+    else:
+        logger.warning("RAG components not available. Skipping RAG query.")
+    # --- End Process Messages & RAG ---
+
+    # --- Prepare Prompt for LLM ---
+    # Usually pre-built by the /token warm-up
+    system_message_with_prefs = {"role": "system", "content": build_personalized_system_prompt(user_preferences)}
+
+    # Build conversation history for LLM
+    conversation_for_llm = [system_message_with_prefs]
+
+    # RAG and LLM History Context (from Letta/Supabase)
+    all_context_parts = [ctx for ctx in book_contexts + [llm_context] if ctx and ctx.strip()]
+    combined_context_for_llm = "\n---\n".join(all_context_parts) if all_context_parts else "No additional relevant context found."
+    MAX_CONTEXT_LEN = 3000
+    if len(combined_context_for_llm) > MAX_CONTEXT_LEN:
+         logger.warning(f"Combined context length ({len(combined_context_for_llm)}) exceeds limit {MAX_CONTEXT_LEN}, truncating.")
+         combined_context_for_llm = "... (truncated context) ..." + combined_context_for_llm[-MAX_CONTEXT_LEN + 25:] # Keep end part
+
+    # Inject this combined context as a new system message
+    context_injection_message = {"role": "system", 
+                                 "content": f"Consider the following relevant context for the user's query:\n{combined_context_for_llm}"}
+    conversation_for_llm.append(context_injection_message)
+
+    # Background tool jobs (e.g. schedule_clickup) that finished since the last turn
+    # and could not be announced through Vapi's control URL.
+    try:
+        for job in pop_finished_jobs_for_call(call_id):
+            conversation_for_llm.append({"role": "system", "content": describe_job_outcome(job)})
+    except Exception as job_err:
+        logger.error(f"Error checking background jobs for call {call_id}: {job_err}", exc_info=True)
+
+    # Add message history from Vapi's request AFTER your system prompts
+    # This 'messages_from_vapi_request' should already be correctly formatted by Vapi
+    # if it's managing tool calls and results. The OpenAI error indicates it might not be.
+    # We pass it as is; if OpenAI errors, it's likely due to Vapi's structure for tool calls/results.
+    valid_messages = [
+        msg for msg in messages_from_vapi_request
+        if isinstance(msg, dict) and 'role' in msg and ('content' in msg or 'tool_calls' in msg or 'tool_call_id' in msg)
+    ]
+    conversation_for_llm.extend(valid_messages)
+
+    # The caller already heard a filler line (filler mode); the reply has to carry on from it
+    if spoken_prefix:
+        conversation_for_llm.append({"role": "system",
+                                     "content": f"You already began this reply out loud with \"{spoken_prefix.strip()}\" "
+                                                "Continue from there without repeating or acknowledging it."})
+
+    # --- DETAILED LOGGING OF LLM REQUEST ---
+    logger.info("--- Preparing LLM Request ---")
+    logger.info(f"Target Model: {model_name_from_vapi_request}")
+    logger.info("Messages being sent to LLM:")
+    for i, msg_llm in enumerate(conversation_for_llm):
+        role_llm = msg_llm.get('role', 'unknown_role')
+        content_llm = msg_llm.get('content', '')
+        tool_calls_llm = msg_llm.get('tool_calls')
+        tool_call_id_llm = msg_llm.get('tool_call_id')
+
+        log_line = f"  MSG {i+1} | ROLE: {role_llm}"
+        if content_llm is not None: # Content can be null for assistant tool calls
+            content_preview_llm = (str(content_llm)[:150] + '...') if len(str(content_llm)) > 153 else str(content_llm)
+            log_line += f" | CONTENT PREVIEW: {content_preview_llm.replace(os.linesep, ' ')}"
+        if tool_calls_llm:
+            log_line += f" | TOOL_CALLS: {json.dumps(tool_calls_llm)}"
+        if tool_call_id_llm:
+            log_line += f" | TOOL_CALL_ID: {tool_call_id_llm}"
+        logger.info(log_line)
+
+    if tools_from_vapi_request: logger.info(f"Tools for LLM: {json.dumps(tools_from_vapi_request, indent=2)}")
+    logger.info(f"Temperature: {temperature_from_vapi_request}")
+    logger.info(f"Stream: {stream_flag_from_vapi_request}")
+    if max_tokens_from_vapi_request: logger.info(f"Max Tokens: {max_tokens_from_vapi_request}")
+    logger.info("--- End LLM Request Preparation ---")
+    # --- END DETAILED LOGGING ---
+
+    # --- Prepare and Call LLM ---
+    llm_request_data = {
+        "model": model_name_from_vapi_request,
+        "messages": conversation_for_llm,
+        "temperature": temperature_from_vapi_request,
+        "stream": stream_flag_from_vapi_request,
+    }
+    if max_tokens_from_vapi_request: llm_request_data["max_tokens"] = max_tokens_from_vapi_request
+    if tools_from_vapi_request: llm_request_data["tools"] = tools_from_vapi_request
+    return llm_request_data
+
+
+def _handle_chat_completion():
+    """Body of the chat completions route; runs inside the turn's trace."""
     logger.info("Received request for /chat/completions")
     request_data = request.get_json()
     if not request_data:
@@ -373,13 +589,14 @@ def openai_advanced_chat_completions_route_new():
         return jsonify({"error": "Authentication token not found."}), 401
 
     # Access cache
-    cache = current_app.extensions.get('cache')
+    cache = get_cache()
     if not cache:
         logger.warning("Cache unavailable in /chat/completions. Proceeding without preference caching for this request.")
 
     try:
         # Decode token to get Supabase User UUID
-        decoded = decode_token(token)
+        with span("auth"):
+            decoded = decode_token(token)
         user_id = decoded['sub'] # Supabase UUID string
         logger.info(f"Authenticated Supabase user ID for chat: {user_id}")
     except Exception as e:
@@ -387,6 +604,14 @@ def openai_advanced_chat_completions_route_new():
         return jsonify({"error": "Invalid or expired token."}), 401
     # --- End Authentication & Core Data Extraction ---
 
+    # --- Admission Control ---
+    try:
+        with span("admission"):
+            admit(user_id)
+    except Shed as shed:
+        return _overload_response(shed, model_name_from_vapi_request, stream_flag_from_vapi_request)
+    # --- End Admission Control ---
+
     try:
         # --- Generate Session Hash ---
         session_id_hash = generate_session_hash(call_id, user_id)
@@ -398,31 +623,18 @@ def openai_advanced_chat_completions_route_new():
 
         # --- Retrieve Context and CACHED Preferences ---
         try:
-            llm_context = get_llm_context_from_session(session_id_hash, max_turns=5)
+            with span("session_context"):
+                llm_context = get_llm_context_from_session(session_id_hash, max_turns=5)
         except Exception as context_err:
             logger.error(f"Error fetching LLM context for session {session_id_hash}: {context_err}", exc_info=True)
             llm_context = "Error retrieving past interactions."
 
-        user_preferences = None
-        cache_key = f"user_prefs_{user_id}"
-        if cache:
-            try:
-                user_preferences = cache.get(cache_key)
-                if user_preferences is not None: logger.info(f"Preferences cache HIT for {user_id}")
-            except Exception as cache_err:
-                logger.error(f"Error getting from cache for user {user_id}: {cache_err}")
-                user_preferences = None
-
-        if user_preferences is None:
-            log_msg = f"Preferences cache MISS for user {user_id}." if cache else "Cache unavailable."
-            logger.info(f"{log_msg} Fetching fallback from DB.")
-            user_preferences = get_user_preferences_from_db(user_id)
-            if cache and user_preferences is not None:
-                 try:
-                     cache.set(cache_key, user_preferences or DEFAULT_PREFERENCES)
-                     logger.info(f"Cached preferences for user {user_id} after fallback fetch.")
-                 except Exception as cache_err: logger.error(f"Error setting cache for user {user_id} after fallback: {cache_err}")
-            elif not user_preferences: logger.warning(f"Fallback preference fetch failed for user {user_id}. Using defaults.")
+        # Cached (served stale while one refresh runs); concurrent misses share one DB fetch.
+        # While the /token warm-up is still loading them here, the turn joins it instead.
+        warm_status = get_warm_status(user_id) or "cold"
+        with span("preferences", warm=warm_status):
+            user_preferences = get_warm_preferences(user_id, get_user_preferences_from_db, warm_status)
+        if not user_preferences: logger.warning(f"Preference fetch failed for user {user_id}. Using defaults.")
 
         user_preferences = user_preferences or DEFAULT_PREFERENCES
         logger.info(f"Using preferences for chat: {user_preferences}")
@@ -444,104 +656,29 @@ def openai_advanced_chat_completions_route_new():
             assistance_text = provide_interaction_assistance()
             return Response(generate_streaming_introduction(assistance_text), content_type='text/event-stream')
 
-        book_contexts = []
-        if user_index and book_index and atomic_habits_keywords and query_string: # RAG only if there's a query string
-            try:
-                classification_result = pinecone_rag.classify(query_string, atomic_habits_keywords)
-                classification_label = classification_result.label
-                logger.info(f"RAG classification for query: {classification_label}")
-                if classification_label == "PERSONAL":
-                    res = pinecone_rag.query_pinecone_user(query_string, user_index, top_k=1, namespace='user-data-openai-embedding')
-                    if res and res.get('matches'): book_contexts.extend([x.get('metadata', {}).get('text', '') for x in res['matches']])
-                elif classification_label == "ATOMIC_HABITS":
-                    context_strings = pinecone_rag.query_pinecone_book(query_string, top_k=1, namespace='ah-test')
-                    book_contexts.extend(context_strings)
-                logger.debug(f"Retrieved {len(book_contexts)} RAG context snippets.")
-            except Exception as rag_e:
-                logger.error(f"Error during RAG query: {rag_e}", exc_info=True)
-                book_contexts = []
-        elif not query_string:
-            logger.info("No query string for RAG (likely an assistant turn with tool_calls or tool_response). Skipping RAG.")
-        else:
-            logger.warning("RAG components not available. Skipping RAG query.")
-        # --- End Process Messages & RAG ---
-
-        # --- Prepare Prompt for LLM ---
-        base_system_prompt = (
-            "You are a helpful assistant knowledgeable about Atomic Habits. "
-            "Tailor your responses based on the user's preferences and past conversation history provided below. "
-            "Avoid using special characters like #,*,&,^,%,$,! unless part of necessary code or examples."
-        )
-        try:
-            prefs_to_serialize = {k: str(v) for k, v in user_preferences.items()}
-            prefs_json = json.dumps(prefs_to_serialize)
-        except TypeError:
-            logger.warning("Could not serialize user preferences to JSON. Using raw dict string.")
-            prefs_json = str(user_preferences)
-        system_message_with_prefs = {"role": "system", "content": f"{base_system_prompt}\nUser Preferences: {prefs_json}"}
-
-        # Build conversation history for LLM
-        conversation_for_llm = [system_message_with_prefs]
-
-        # RAG and LLM History Context (from Letta/Supabase)
-        all_context_parts = [ctx for ctx in book_contexts + [llm_context] if ctx and ctx.strip()]
-        combined_context_for_llm = "\n---\n".join(all_context_parts) if all_context_parts else "No additional relevant context found."
-        MAX_CONTEXT_LEN = 3000
-        if len(combined_context_for_llm) > MAX_CONTEXT_LEN:
-             logger.warning(f"Combined context length ({len(combined_context_for_llm)}) exceeds limit {MAX_CONTEXT_LEN}, truncating.")
-             combined_context_for_llm = "... (truncated context) ..." + combined_context_for_llm[-MAX_CONTEXT_LEN + 25:] # Keep end part
-
-        # Inject this combined context as a new system message
-        context_injection_message = {"role": "system", 
-                                     "content": f"Consider the following relevant context for the user's query:\n{combined_context_for_llm}"}
-        conversation_for_llm.append(context_injection_message)
-
-        # Add message history from Vapi's request AFTER your system prompts
-        # This 'messages_from_vapi_request' should already be correctly formatted by Vapi
-        # if it's managing tool calls and results. The OpenAI error indicates it might not be.
-        # We pass it as is; if OpenAI errors, it's likely due to Vapi's structure for tool calls/results.
-        valid_messages = [
-            msg for msg in messages_from_vapi_request
-            if isinstance(msg, dict) and 'role' in msg and ('content' in msg or 'tool_calls' in msg or 'tool_call_id' in msg)
-        ]
-        conversation_for_llm.extend(valid_messages)
-
-        # --- DETAILED LOGGING OF LLM REQUEST ---
-        logger.info("--- Preparing LLM Request ---")
-        logger.info(f"Target Model: {model_name_from_vapi_request}")
-        logger.info("Messages being sent to LLM:")
-        for i, msg_llm in enumerate(conversation_for_llm):
-            role_llm = msg_llm.get('role', 'unknown_role')
-            content_llm = msg_llm.get('content', '')
-            tool_calls_llm = msg_llm.get('tool_calls')
-            tool_call_id_llm = msg_llm.get('tool_call_id')
-
-            log_line = f"  MSG {i+1} | ROLE: {role_llm}"
-            if content_llm is not None: # Content can be null for assistant tool calls
-                content_preview_llm = (str(content_llm)[:150] + '...') if len(str(content_llm)) > 153 else str(content_llm)
-                log_line += f" | CONTENT PREVIEW: {content_preview_llm.replace(os.linesep, ' ')}"
-            if tool_calls_llm:
-                log_line += f" | TOOL_CALLS: {json.dumps(tool_calls_llm)}"
-            if tool_call_id_llm:
-                log_line += f" | TOOL_CALL_ID: {tool_call_id_llm}"
-            logger.info(log_line)
-
-        if tools_from_vapi_request: logger.info(f"Tools for LLM: {json.dumps(tools_from_vapi_request, indent=2)}")
-        logger.info(f"Temperature: {temperature_from_vapi_request}")
-        logger.info(f"Stream: {stream_flag_from_vapi_request}")
-        if max_tokens_from_vapi_request: logger.info(f"Max Tokens: {max_tokens_from_vapi_request}")
-        logger.info("--- End LLM Request Preparation ---")
-        # --- END DETAILED LOGGING ---
-
-        # --- Prepare and Call LLM ---
-        llm_request_data = {
-            "model": model_name_from_vapi_request,
-            "messages": conversation_for_llm,
-            "temperature": temperature_from_vapi_request,
-            "stream": stream_flag_from_vapi_request,
-        }
-        if max_tokens_from_vapi_request: llm_request_data["max_tokens"] = max_tokens_from_vapi_request
-        if tools_from_vapi_request: llm_request_data["tools"] = tools_from_vapi_request
+        llm_args = (query_string, user_preferences, llm_context, call_id, messages_from_vapi_request,
+                    model_name_from_vapi_request, temperature_from_vapi_request,
+                    stream_flag_from_vapi_request, max_tokens_from_vapi_request, tools_from_vapi_request)
+
+        # --- Filler Mode ---
+        # Speak a short filler right away and run RAG + the LLM request behind it
+        filler = None
+        if stream_flag_from_vapi_request and client_openai and last_message_from_vapi.get('role') == 'user':
+            filler = choose_filler(query_string, user_preferences, atomic_habits_keywords)
+        if filler:
+            llm_started = time.perf_counter()
+
+            def start_completion():
+                filler_request_data = _prepare_llm_request(*llm_args, spoken_prefix=filler)
+                with span("llm.request", dependency="openai", model=str(model_name_from_vapi_request)):
+                    return client_openai.chat.completions.create(**filler_request_data)
+
+            logger.info(f"Streaming filler for user {user_id} while the reply is prepared: {filler.strip()!r}")
+            body = stream_with_filler(filler, model_name_from_vapi_request, start_completion, llm_started)
+            return Response(hold_for_stream(track_active_stream(body)), content_type='text/event-stream')
+        # --- End Filler Mode ---
+
+        llm_request_data = _prepare_llm_request(*llm_args)
 
         if not client_openai:
              logger.error("OpenAI client (client_openai) is not initialized.")
@@ -549,8 +686,13 @@ def openai_advanced_chat_completions_route_new():
 
         if stream_flag_from_vapi_request:
             try:
-                chat_completion_stream = client_openai.chat.completions.create(**llm_request_data)
-                return Response(generate_streaming_response(chat_completion_stream), content_type='text/event-stream')
+                llm_started = time.perf_counter()
+                with span("llm.request", dependency="openai", model=str(model_name_from_vapi_request)):
+                    chat_completion_stream = client_openai.chat.completions.create(**llm_request_data)
+                # The trace finishes when the stream does; llm.ttft = call start to first SSE chunk
+                body = hand_off_to_stream(generate_streaming_response(chat_completion_stream), llm_started)
+                # The admission slot is released when the stream finishes or is closed
+                return Response(hold_for_stream(track_active_stream(body)), content_type='text/event-stream')
             except Exception as llm_err:
                  logger.error(f"Error during LLM streaming call: {llm_err}", exc_info=True)
                  # Try to return the error message from OpenAI if available
@@ -561,7 +703,8 @@ def openai_advanced_chat_completions_route_new():
                  return jsonify({"error": "Failed to get streaming response from LLM.", "detail": error_detail}), 500
         else:
             try:
-                chat_completion = client_openai.chat.completions.create(**llm_request_data)
+                with span("llm.completion", dependency="openai", model=str(model_name_from_vapi_request)):
+                    chat_completion = client_openai.chat.completions.create(**llm_request_data)
                 return Response(chat_completion.model_dump_json(indent=2), content_type='application/json')
             except Exception as llm_err:
                 logger.error(f"Error during LLM non-streaming call: {llm_err}", exc_info=True)
@@ -0,0 +1,270 @@
+# app/api/diagnostics.py
+
+import os
+import hmac
+import logging
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, Response
+
+from app.services.profiler import (
+    run_profile,
+    list_saved_profiles,
+    read_saved_profile,
+    is_profile_name,
+    DEFAULT_INTERVAL_S
+)
+from app.services.memory_diagnostics import (
+    start_tracing,
+    stop_tracing,
+    take_snapshot,
+    list_snapshots,
+    snapshot_summary,
+    diff_snapshots,
+    cache_sizes,
+    process_memory
+)
+
+logger = logging.getLogger(__name__)
+
+# Admin-only worker diagnostics. Every route needs "Authorization: Bearer <DIAGNOSTICS_TOKEN>";
+# without a configured token the blueprint answers 404 to everything.
+diagnostics = Blueprint('diagnostics', __name__)
+DIAGNOSTICS_TOKEN = os.environ.get('DIAGNOSTICS_TOKEN')
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not DIAGNOSTICS_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {DIAGNOSTICS_TOKEN}".encode()):
+            logger.warning(f"Rejected diagnostics request to {request.path} from {request.remote_addr}")
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ==============================================================================
+# --- Sampling Profiler ---
+# ==============================================================================
+@diagnostics.route('/profile', methods=['POST'])
+@admin_required
+def profile_worker():
+    """
+    Samples every thread of this worker for ?seconds=N (default 10, max PROFILE_MAX_DURATION_S)
+    every ?interval_ms (default 10); ?idle=1 keeps threads parked on I/O or locks.
+    Returns collapsed stacks (flamegraph.pl / speedscope input), or JSON with ?format=json.
+    The profile is also saved and can be opened in the viewer.
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_s = float(request.args.get('interval_ms', DEFAULT_INTERVAL_S * 1000)) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers."}), 400
+    include_idle = request.args.get('idle', '0').lower() in ('1', 'true', 'yes')
+
+    logger.info(f"Starting {seconds:g}s sampling profile (interval {interval_s * 1000:g} ms) of worker {os.getpid()}")
+    result = run_profile(seconds, interval_s, include_idle)
+    if result is None:
+        return jsonify({"error": "A profile is already running on this worker."}), 409
+
+    headers = {"X-Profile-Name": result["name"], "X-Profile-Samples": str(result["samples"])}
+    if request.args.get('format') == 'json':
+        return jsonify(result), 200, headers
+    return Response(result["collapsed"], mimetype='text/plain', headers=headers)
+
+
+@diagnostics.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """Saved profiles of this host, newest first."""
+    return jsonify(profiles=list_saved_profiles())
+
+
+@diagnostics.route('/profiles/<name>', methods=['GET'])
+@admin_required
+def get_profile(name: str):
+    collapsed = read_saved_profile(name)
+    if collapsed is None:
+        return jsonify({"error": "Profile not found."}), 404
+    return Response(collapsed, mimetype='text/plain')
+
+
+@diagnostics.route('/profiles/<name>/view', methods=['GET'])
+def view_profile(name: str):
+    """
+    Interactive flame graph of a saved profile (click a frame to zoom, type to highlight).
+    The page holds no profile data: it asks for the diagnostics token (kept in sessionStorage)
+    and fetches the stacks from /profiles/<name> with it, since a browser can't send the header.
+    """
+    if not DIAGNOSTICS_TOKEN or not is_profile_name(name):
+        return jsonify({"error": "Not found"}), 404
+    return Response(FLAMEGRAPH_VIEWER.replace("__TITLE__", name), mimetype='text/html')
+
+
+FLAMEGRAPH_VIEWER = """<!doctype html>
+<html><head><meta charset="utf-8"><title>__TITLE__</title>
+<style>
+ body { font: 12px monospace; margin: 8px; }
+ #graph div { position: absolute; height: 17px; overflow: hidden; white-space: nowrap; box-sizing: border-box;
+              border: 1px solid #fff; padding: 1px 3px; cursor: pointer; }
+ #graph { position: relative; }
+ .hit { background: #e040fb !important; }
+</style></head>
+<body>
+<div>__TITLE__ &mdash; <span id="info"></span>
+ <input id="search" placeholder="highlight (regex)"> <button id="reset">reset zoom</button></div>
+<div id="graph"></div>
+<script>
+const root = {name: "all", value: 0, children: {}};
+function load(folded) {
+  for (const line of folded.split("\\n")) {
+    const cut = line.lastIndexOf(" ");
+    if (cut < 0) continue;
+    const count = parseInt(line.slice(cut + 1), 10);
+    let node = root;
+    root.value += count;
+    for (const frame of line.slice(0, cut).split(";")) {
+      node = node.children[frame] = node.children[frame] || {name: frame, value: 0, children: {}};
+      node.value += count;
+    }
+  }
+  render(root);
+}
+const graph = document.getElementById("graph"), info = document.getElementById("info");
+function color(name) {
+  let h = 0; for (const c of name) h = (h * 31 + c.charCodeAt(0)) | 0;
+  return `hsl(${20 + Math.abs(h) % 40}, 85%, ${60 + Math.abs(h >> 8) % 15}%)`;
+}
+function render(focus) {
+  graph.innerHTML = "";
+  const width = graph.clientWidth || window.innerWidth - 16;
+  let depth = 0;
+  (function draw(node, x, level, w) {
+    if (w < 1) return;
+    depth = Math.max(depth, level);
+    const el = document.createElement("div");
+    el.style.left = x + "px"; el.style.top = level * 17 + "px"; el.style.width = w + "px";
+    el.style.background = color(node.name);
+    el.textContent = node.name;
+    el.title = `${node.name}\\n${node.value} samples (${(100 * node.value / root.value).toFixed(2)}%)`;
+    el.dataset.name = node.name;
+    el.onclick = () => render(node);
+    graph.appendChild(el);
+    let cx = x;
+    for (const child of Object.values(node.children).sort((a, b) => b.value - a.value)) {
+      const cw = w * child.value / node.value;
+      draw(child, cx, level + 1, cw);
+      cx += cw;
+    }
+  })(focus, 0, 0, width);
+  graph.style.height = (depth + 1) * 17 + "px";
+  info.textContent = `${root.value} samples; showing ${focus.name} (${focus.value})`;
+  highlight();
+}
+function highlight() {
+  const q = document.getElementById("search").value;
+  let re = null; try { re = q ? new RegExp(q) : null; } catch (e) {}
+  for (const el of graph.children) el.classList.toggle("hit", !!re && re.test(el.dataset.name));
+}
+document.getElementById("search").oninput = highlight;
+document.getElementById("reset").onclick = () => render(root);
+const token = sessionStorage.getItem("diagnosticsToken") || prompt("Diagnostics token");
+fetch(location.pathname.replace(/\\/view$/, ""), {headers: {Authorization: "Bearer " + token}})
+  .then(r => { if (!r.ok) { sessionStorage.removeItem("diagnosticsToken"); throw new Error(r.status); } return r.text(); })
+  .then(text => { sessionStorage.setItem("diagnosticsToken", token); load(text); })
+  .catch(e => { info.textContent = "Could not load profile: " + e.message; });
+</script></body></html>
+"""
+
+
+# ==============================================================================
+# --- Memory Growth ---
+# ==============================================================================
+# Typical use on a worker that keeps growing: POST /memory/tracing, let traffic run,
+# POST /memory/snapshots a few times, then GET /memory/diff?from=1&to=<latest>.
+# Like the profiler these act on the worker that served the request.
+def _int_arg(name: str, default=None):
+    value = request.args.get(name)
+    return default if value is None else int(value)
+
+
+@diagnostics.route('/memory', methods=['GET'])
+@admin_required
+def memory_overview():
+    """RSS, tracemalloc state, stored snapshots and the registered caches by byte size."""
+    return jsonify(process=process_memory(), snapshots=list_snapshots(), caches=cache_sizes())
+
+
+@diagnostics.route('/memory/caches', methods=['GET'])
+@admin_required
+def memory_caches():
+    return jsonify(caches=cache_sizes())
+
+
+@diagnostics.route('/memory/tracing', methods=['POST', 'DELETE'])
+@admin_required
+def memory_tracing():
+    """POST starts tracemalloc (?frames=N, default 10) with a baseline snapshot; DELETE stops it."""
+    if request.method == 'DELETE':
+        return jsonify(stopped=stop_tracing())
+    try:
+        frames = _int_arg('frames', 10)
+    except ValueError:
+        return jsonify({"error": "frames must be an integer."}), 400
+    started = start_tracing(frames)
+    return jsonify(started=started, snapshots=list_snapshots()), 201 if started else 200
+
+
+@diagnostics.route('/memory/snapshots', methods=['GET', 'POST'])
+@admin_required
+def memory_snapshots():
+    if request.method == 'GET':
+        return jsonify(snapshots=list_snapshots())
+    try:
+        return jsonify(take_snapshot(label=request.args.get('label'))), 201
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+@diagnostics.route('/memory/snapshots/<int:snapshot_id>', methods=['GET'])
+@admin_required
+def memory_snapshot(snapshot_id: int):
+    """Top allocation sites (?group_by=lineno|filename|traceback, ?limit=N) and object types."""
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "group_by must be lineno, filename or traceback."}), 400
+    try:
+        summary = snapshot_summary(snapshot_id, limit=_int_arg('limit', 25), group_by=group_by)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    if summary is None:
+        return jsonify({"error": "Snapshot not found."}), 404
+    return jsonify(summary)
+
+
+@diagnostics.route('/memory/diff', methods=['GET'])
+@admin_required
+def memory_diff():
+    """
+    Growth between snapshots ?from and ?to (default: oldest and newest stored) by allocation
+    site and by object type.
+    """
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "group_by must be lineno, filename or traceback."}), 400
+    stored = list_snapshots()
+    try:
+        older = _int_arg('from', stored[0]["id"] if stored else None)
+        newer = _int_arg('to', stored[-1]["id"] if stored else None)
+        limit = _int_arg('limit', 25)
+    except ValueError:
+        return jsonify({"error": "from, to and limit must be integers."}), 400
+    if older is None or newer is None or older == newer:
+        return jsonify({"error": "Need two snapshots; take one with POST /memory/snapshots."}), 409
+    diff = diff_snapshots(older, newer, limit=limit, group_by=group_by)
+    if diff is None:
+        return jsonify({"error": "Snapshot not found."}), 404
+    return jsonify(diff)
@@ -1,21 +1,23 @@
-import asyncio
-from app.api.tool_registry import get_tool_handler
+from app.services.tool_executor import ToolCallRequest, execute_tool_call
 
 async def invoke_tool(tool_call: dict):
     """
     Invoke a tool based on the provided tool_call data.
-    Expected tool_call structure: 
+    Expected tool_call structure:
       {
         "tool": "<tool_name>",
-        "parameters": { ... }
+        "parameters": { ... },
+        "id": "<optional tool call id>"
       }
+    Runs through the shared tool executor, so registered deadlines and
+    concurrency caps apply.
     """
     tool_name = tool_call.get("tool")
     parameters = tool_call.get("parameters", {})
-    handler = get_tool_handler(tool_name)
-    if not handler:
+    outcome = await execute_tool_call(
+        ToolCallRequest(tool_call.get("id", f"{tool_name}_direct"), tool_name, parameters))
+    if outcome.status == "not_found":
         return {"error": f"No handler registered for tool {tool_name}"}
-    try:
-        return await handler(**parameters)
-    except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+    if outcome.status != "success":
+        return {"error": outcome.message}
+    return outcome.result
@@ -1,12 +1,37 @@
 # app/api/supabase_db.py
 
 import os
+import json
+import hashlib
 import logging
 import secrets
 from typing import Optional, Dict, Any, List
 from supabase import create_client, Client, PostgrestAPIResponse
 from dotenv import load_dotenv
 
+from app.services.profile_cache import invalidate_user_profile
+from app.services.metrics import httpx_event_hooks
+from app.services.memory_diagnostics import register_memory_report, http_client_size
+
+
+def _supabase_operation(path: str) -> str:
+    """Metric name for a PostgREST path: the table, or rpc/<function>."""
+    parts = [part for part in path.split("/") if part]  # ['rest', 'v1', <table> | 'rpc', <fn>]
+    if len(parts) >= 3 and parts[0] == "rest":
+        return "/".join(parts[2:4]) if parts[2] == "rpc" else parts[2]
+    return parts[0] if parts else "/"
+
+
+def instrument_supabase_client(client) -> None:
+    """Adds latency / error metrics (dependency="supabase") to the client's PostgREST session."""
+    try:
+        session = client.postgrest.session
+        hooks = httpx_event_hooks("supabase", _supabase_operation)
+        session.event_hooks = {event: list(session.event_hooks.get(event, [])) + hooks[event]
+                               for event in ("request", "response")}
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Supabase client metrics unavailable: {e}")
+
 # --- Initialize Supabase Client ---
 load_dotenv()
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
@@ -21,6 +46,7 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 else:
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        instrument_supabase_client(supabase)
         # Set logger after basicConfig potentially called by Flask app
         logger = logging.getLogger(__name__)
         logger.info(
@@ -32,6 +58,8 @@ else:
             exc_info=True)
 # Get logger instance - relies on Flask app having configured basicConfig
 logger = logging.getLogger(__name__)
+if supabase:
+    register_memory_report("supabase_db.client.postgrest", lambda: http_client_size(supabase.postgrest.session))
 # --- End Initialize Supabase Client ---
 
 # ==============================================================================
@@ -82,11 +110,33 @@ def get_supabase_user_id_by_email(email: str) -> Optional[str]:
     return None
 
 
+USER_DATA_COLUMNS = "user_id, username, email, first_name, last_name, signup_date, last_login, account_status, email_verified"
+USER_PROFILE_COLUMNS = "birth_date, primary_language, secondary_languages, timezone, profile_picture_url, bio, current_bg, character"
+
+# Set once PostgREST rejects the embedded user_profiles select (no FK relationship,
+# see migrations/002_user_profiles_fk.sql); later calls go straight to two queries.
+_profile_embed_unavailable = False
+
+
+def _fetch_user_profile_row(user_id: str) -> Optional[Dict[str, Any]]:
+    """Second round trip, used only when the embedded select isn't available."""
+    logger.debug(f"Fetching profile data from 'user_profiles' for user ID: {user_id}")
+    profile_response: PostgrestAPIResponse = supabase.table("user_profiles") \
+        .select(USER_PROFILE_COLUMNS) \
+        .eq("user_id", user_id).limit(1).execute()
+    if hasattr(profile_response, 'error') and profile_response.error:
+        logger.error(f"Supabase API error fetching profile: {profile_response.error}")
+        return None
+    return profile_response.data[0] if profile_response.data else None
+
+
 def get_supabase_user_data_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     """
     Retrieves combined user data. Assumes 'users' table is primary source for
     username, email, first_name, last_name. 'user_profiles' for other details.
+    Both come back in one round trip via a PostgREST embedded select.
     """
+    global _profile_embed_unavailable
     if not supabase:
         logging.error(
             "get_supabase_user_data_by_id: Supabase client not available.")
@@ -97,11 +147,24 @@ def get_supabase_user_data_by_id(user_id: str) -> Optional[Dict[str, Any]]:
 
     user_info = {}
     try:
-        # Get primary user data from 'users' table
         logger.debug(f"Fetching user data from 'users' for ID: {user_id}")
-        user_response: PostgrestAPIResponse = supabase.table("users") \
-            .select("user_id, username, email, first_name, last_name, signup_date, last_login, account_status, email_verified") \
-            .eq("user_id", user_id).limit(1).execute() # Select specific fields
+        columns = USER_DATA_COLUMNS
+        if not _profile_embed_unavailable:
+            columns = f"{USER_DATA_COLUMNS}, user_profiles({USER_PROFILE_COLUMNS})"
+        try:
+            user_response: PostgrestAPIResponse = supabase.table("users") \
+                .select(columns) \
+                .eq("user_id", user_id).limit(1).execute()
+        except Exception as embed_err:
+            # Only a missing relationship switches this worker to two queries; timeouts and
+            # 5xx are ordinary failures of this call
+            if _profile_embed_unavailable or "PGRST200" not in str(embed_err):
+                raise
+            logger.warning(f"Embedded user_profiles select unavailable, using two queries: {embed_err}")
+            _profile_embed_unavailable = True
+            user_response = supabase.table("users") \
+                .select(USER_DATA_COLUMNS) \
+                .eq("user_id", user_id).limit(1).execute()
 
         if hasattr(user_response, 'error') and user_response.error:
             logger.error(
@@ -110,26 +173,18 @@ def get_supabase_user_data_by_id(user_id: str) -> Optional[Dict[str, Any]]:
         if not user_response.data:
             logger.warning(f"No user found in 'users' table for ID: {user_id}")
             return None
-        user_info.update(user_response.data[0])
-        # user_info.pop('password', None) # Password not selected
+        row = dict(user_response.data[0])
 
-        # Get additional profile data from 'user_profiles'
-        logger.debug(
-            f"Fetching profile data from 'user_profiles' for user ID: {user_id}"
-        )
-        # Select fields NOT already taken from 'users' table primarily, plus others
-        profile_response: PostgrestAPIResponse = supabase.table("user_profiles") \
-            .select("birth_date, primary_language, secondary_languages, timezone, profile_picture_url, bio, current_bg, character") \
-            .eq("user_id", user_id).limit(1).execute()
+        if "user_profiles" in row:
+            # One-to-one relationships embed as an object, one-to-many as a list
+            embedded = row.pop("user_profiles")
+            profile = embedded[0] if isinstance(embedded, list) and embedded else embedded
+        else:
+            profile = _fetch_user_profile_row(user_id)
+        user_info.update(row)
 
-        if hasattr(profile_response, 'error') and profile_response.error:
-            logger.error(
-                f"Supabase API error fetching profile: {profile_response.error}"
-            )
-        elif profile_response.data:
-            user_info.update(
-                profile_response.data[0]
-            )  # Add profile data, potentially overwriting if keys overlap
+        if isinstance(profile, dict):
+            user_info.update(profile)  # Add profile data, potentially overwriting if keys overlap
         else:
             logger.info(
                 f"No additional profile found in 'user_profiles' for user ID: {user_id}."
@@ -311,58 +366,209 @@ def create_supabase_user(user_details: Dict[str, Any]) -> Optional[str]:
                 f"Exception upserting profile for user {profile_user_id}: {e}",
                 exc_info=True)
 
+    if profile_user_id:
+        invalidate_user_profile(profile_user_id)
     return profile_user_id
 
 
-def update_user_setting(user_id: str, setting_key: str, setting_value: Any) -> bool:
-    """Updates a specific setting in the user's profile (user_profiles table)."""
-    # ... (implementation remains the same as previous version) ...
+# Set once the upsert_login_user RPC is missing (migrations/005_upsert_login_user.sql).
+_login_rpc_unavailable = False
+# Set once the RPC predates migrations/006_login_fingerprint.sql.
+_login_fingerprint_unsupported = False
+
+# Login fields that upsert_login_user writes; a change to any of them changes the fingerprint.
+LOGIN_FINGERPRINT_FIELDS = ('email', 'username', 'first_name', 'last_name', 'email_verified', 'picture')
+
+
+def login_fingerprint(user_details: Dict[str, Any]) -> str:
+    """sha256 over the login fields, stable across key order and whitespace."""
+    normalized = {key: user_details.get(key) for key in LOGIN_FINGERPRINT_FIELDS}
+    normalized['email'] = (normalized['email'] or '').strip().lower()
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def upsert_login_user(user_details: Dict[str, Any], fingerprint: Optional[str] = None) -> Optional[str]:
+    """
+    Login path for /token: creates or updates the user in 'users' and 'user_profiles'
+    in a single round trip (upsert_login_user RPC) and returns the user_id.
+    With `fingerprint`, the RPC skips all writes when it matches the stored
+    users.login_fingerprint. Falls back to create_supabase_user when the RPC isn't installed.
+    """
+    global _login_rpc_unavailable, _login_fingerprint_unsupported
     if not supabase:
-        logging.error("update_user_setting: Supabase client not available.")
+        logging.error("upsert_login_user: Supabase client not available.")
+        return None
+    if not user_details.get('email') or not user_details.get('username'):
+        logging.error("upsert_login_user: Missing required keys (email, username).")
+        return None
+    if _login_rpc_unavailable:
+        return create_supabase_user(user_details)
+
+    params = {
+        "p_email": user_details['email'],
+        "p_username": user_details['username'],
+        "p_password": f"external_auth_{secrets.token_hex(32)}",
+        "p_first_name": user_details.get('first_name'),
+        "p_last_name": user_details.get('last_name'),
+        "p_email_verified": user_details.get('email_verified'),
+        "p_picture": user_details.get('picture'),
+        "p_current_bg": user_details.get('current_bg', 'black'),
+        "p_character": user_details.get('character', {}),
+    }
+    if fingerprint and not _login_fingerprint_unsupported:
+        params["p_fingerprint"] = fingerprint
+    try:
+        logger.info(f"Upserting login user {user_details['email']} via RPC")
+        response = supabase.rpc("upsert_login_user", params).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error(f"Supabase RPC error upserting login user {user_details['email']}: {response.error}")
+            return None
+        user_id = response.data
+        if isinstance(user_id, list):  # Some client versions wrap scalar results
+            user_id = user_id[0] if user_id else None
+        if isinstance(user_id, dict):
+            user_id = user_id.get('upsert_login_user') or user_id.get('user_id')
+        if not user_id:
+            logger.error(f"upsert_login_user returned no user_id for {user_details['email']}.")
+            return None
+        invalidate_user_profile(str(user_id))
+        return str(user_id)
+    except Exception as e:
+        if "PGRST202" in str(e):  # No function with these parameters in the schema cache
+            if "p_fingerprint" in params:
+                # 005 installed without 006: call the older signature from now on
+                logger.warning("upsert_login_user has no p_fingerprint parameter; logging in without change detection.")
+                _login_fingerprint_unsupported = True
+                return upsert_login_user(user_details)
+            logger.warning("upsert_login_user RPC not installed; falling back to create_supabase_user.")
+            _login_rpc_unavailable = True
+            return create_supabase_user(user_details)
+        logger.error(f"Exception upserting login user {user_details['email']}: {e}", exc_info=True)
+        return None
+
+
+def update_user_settings(user_id: str, settings: Dict[str, Any]) -> bool:
+    """Updates several user_profiles columns for a user in one request."""
+    if not supabase:
+        logging.error("update_user_settings: Supabase client not available.")
         return False
-    if not user_id or not setting_key:
+    if not user_id or not settings:
         logging.warning(
-            "update_user_setting: user_id and setting_key required.")
+            "update_user_settings: user_id and settings required.")
         return False
     try:
-        logging.info(
-            f"Updating setting '{setting_key}' to '{setting_value}' for user {user_id}"
-        )
+        logging.info(f"Updating settings {settings} for user {user_id}")
         response: PostgrestAPIResponse = supabase.table(
-            "user_profiles").update({
-                setting_key: setting_value
-            }).eq("user_id", user_id).execute()
+            "user_profiles").update(settings).eq("user_id", user_id).execute()
         if hasattr(response, 'error') and response.error:
             logging.error(
-                f"Error updating setting '{setting_key}' for user {user_id}: {response.error}"
+                f"Error updating settings {list(settings)} for user {user_id}: {response.error}"
             )
             return False
         logging.debug(
-            f"Setting '{setting_key}' updated successfully for user {user_id}."
+            f"Settings {list(settings)} updated successfully for user {user_id}."
         )
+        invalidate_user_profile(user_id)
         return True
     except Exception as e:
         logging.error(
-            f"Exception updating setting '{setting_key}' for user {user_id}: {e}",
+            f"Exception updating settings {list(settings)} for user {user_id}: {e}",
             exc_info=True)
         return False
 
 
-def update_user_character_detail(user_id: str, key: str, value: Any) -> bool:
-    """Updates a detail within the 'character' JSONB column in user_profiles."""
-    # ... (implementation remains the same as previous version, using fetch-modify-update) ...
+def update_user_setting(user_id: str, setting_key: str, setting_value: Any) -> bool:
+    """Updates a specific setting in the user's profile (user_profiles table)."""
+    if not setting_key:
+        logging.warning(
+            "update_user_setting: user_id and setting_key required.")
+        return False
+    return update_user_settings(user_id, {setting_key: setting_value})
+
+
+# Character keys that hold lists; updates append (if absent) rather than replace.
+CHARACTER_APPEND_KEYS = ('powers', 'equipments')
+
+# Set once the patch_user_character RPC is missing (migrations/004_patch_user_character.sql).
+_character_rpc_unavailable = False
+
+
+def character_op(key: str, value: Any) -> Dict[str, Any]:
+    """The patch operation a single /character key/value update maps to."""
+    return {"op": "append" if key in CHARACTER_APPEND_KEYS else "set", "key": key, "value": value}
+
+
+def apply_character_ops(character_data: Optional[Dict[str, Any]], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Applies set/append ops to a character dict in Python (same semantics as the RPC)."""
+    character_data = dict(character_data) if isinstance(character_data, dict) else {}
+    for op in ops:
+        key, value = op["key"], op.get("value")
+        if op["op"] == "append":  # Array appends
+            items = list(character_data[key]) if isinstance(character_data.get(key), list) else []
+            if value not in items:
+                items.append(value)
+            character_data[key] = items
+        else:  # Simple key-value updates
+            character_data[key] = value
+    return character_data
+
+
+def patch_user_character(user_id: str, ops: List[Dict[str, Any]]) -> bool:
+    """
+    Applies a batch of character edits ({"op": "set"|"append", "key", "value"}) in a
+    single atomic round trip via the patch_user_character RPC.
+    """
+    global _character_rpc_unavailable
     if not supabase:
-        logging.error(
-            "update_user_character_detail: Supabase client not available.")
+        logging.error("patch_user_character: Supabase client not available.")
+        return False
+    if not user_id or not ops:
+        logging.warning("patch_user_character: user_id and ops required.")
         return False
+    if any(op.get("op") not in ("set", "append") or not op.get("key") for op in ops):
+        logging.warning(f"patch_user_character: invalid ops for user {user_id}: {ops}")
+        return False
+    if _character_rpc_unavailable:
+        return _update_character_fetch_modify(user_id, ops)
+
+    try:
+        logging.info(f"Patching character ({', '.join(op['key'] for op in ops)}) for user {user_id}")
+        response = supabase.rpc("patch_user_character", {"p_user_id": user_id, "p_ops": ops}).execute()
+        if hasattr(response, 'error') and response.error:
+            logging.error(f"Error patching character data for user {user_id}: {response.error}")
+            return False
+        if response.data is None:
+            logging.warning(f"No user_profiles row to patch for user {user_id}.")
+        invalidate_user_profile(user_id)
+        return True
+    except Exception as e:
+        if "PGRST202" in str(e):  # Function not found in the schema cache
+            logging.warning("patch_user_character RPC not installed; falling back to fetch-modify-update.")
+            _character_rpc_unavailable = True
+            return _update_character_fetch_modify(user_id, ops)
+        logging.error(f"Exception patching character for user {user_id}: {e}", exc_info=True)
+        return False
+
+
+def update_user_character_detail(user_id: str, key: str, value: Any) -> bool:
+    """Updates a detail within the 'character' JSONB column in user_profiles."""
     if not user_id or not key:
         logging.warning(
             "update_user_character_detail: user_id and key required.")
         return False
+    return patch_user_character(user_id, [character_op(key, value)])
+
+
+def _update_character_fetch_modify(user_id: str, ops: List[Dict[str, Any]]) -> bool:
+    """Fallback for databases without patch_user_character: fetch, modify, write back (not atomic)."""
+    if not supabase:
+        logging.error(
+            "_update_character_fetch_modify: Supabase client not available.")
+        return False
     try:
         # 1. Fetch existing character data
         logging.debug(
-            f"Fetching character data for user {user_id} to update key '{key}'"
+            f"Fetching character data for user {user_id} to apply {len(ops)} change(s)"
         )
         fetch_response: Optional[PostgrestAPIResponse] = supabase.table(
             "user_profiles").select("character").eq(
@@ -377,19 +583,7 @@ def update_user_character_detail(user_id: str, key: str, value: Any) -> bool:
         if character_data is None or not isinstance(character_data, dict):
             character_data = {}
         # 2. Modify data
-        if key in ['powers', 'equipments']:  # Array appends
-            if not isinstance(character_data.get(key), list):
-                character_data[key] = []
-            if value not in character_data[key]:
-                character_data[key].append(value)
-                logging.debug(f"Appended '{value}' to character.{key}")
-            else:
-                logging.debug(
-                    f"Value '{value}' already exists in character.{key}.")
-                return True  # Already correct state
-        else:  # Simple key-value updates
-            character_data[key] = value
-            logging.debug(f"Set character.{key} to '{value}'")
+        character_data = apply_character_ops(character_data, ops)
         # 3. Update entire character JSONB column
         logging.info(f"Updating full character data for user {user_id}")
         update_response: PostgrestAPIResponse = supabase.table(
@@ -402,15 +596,101 @@ def update_user_character_detail(user_id: str, key: str, value: Any) -> bool:
             )
             return False
         logging.info(
-            f"Successfully updated character.{key} for user {user_id}")
+            f"Successfully updated character ({', '.join(op['key'] for op in ops)}) for user {user_id}")
+        invalidate_user_profile(user_id)
         return True
     except Exception as e:
         logging.error(
-            f"Exception updating character detail for user {user_id}, key '{key}': {e}",
+            f"Exception updating character detail for user {user_id}: {e}",
             exc_info=True)
         return False
 
 
+# --- Preferences ---
+# Resolved preferences = stored value when present and not null, else these defaults.
+PREFERENCE_DEFAULTS: Dict[str, str] = {
+    "speaking_rate": "normal",
+    "interaction_style": "friendly",
+    "explanation_detail_level": "standard",
+    "discussion_depth": "moderate",
+    "learning_style": "visual",
+    "reading_pace": "normal",
+    "preferred_complexity_level": "medium",
+    "preferred_interaction_frequency": "regular"
+    # Add any other preferences your application uses with their defaults
+}
+VOICE_PREFERENCE_KEYS = ["speaking_rate", "interaction_style", "explanation_detail_level", "discussion_depth"]
+COGNITIVE_PREFERENCE_KEYS = ["learning_style", "reading_pace", "preferred_complexity_level",
+                             "preferred_interaction_frequency"]
+# Both tables joined per user (migrations/003_user_preferences_view.sql)
+PREFERENCES_VIEW = "user_preferences_view"
+PREFERENCES_BULK_CHUNK = 200  # user ids per request, keeps the in.(...) filter well under URL limits
+
+# Set once the view is missing; later loads use one bulk query per table instead.
+_preferences_view_unavailable = False
+
+
+def resolve_preferences(row: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Applies PREFERENCE_DEFAULTS to a (possibly missing) row of stored preference values."""
+    row = row or {}
+    return {key: str(row[key]) if row.get(key) is not None else default
+            for key, default in PREFERENCE_DEFAULTS.items()}
+
+
+def _select_in(table: str, columns: str, user_ids: List[str]) -> List[Dict[str, Any]]:
+    response: PostgrestAPIResponse = supabase.table(table).select(columns).in_("user_id", user_ids).execute()
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Supabase API error reading {table}: {response.error}")
+    return response.data or []
+
+
+def _load_preference_rows(user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Stored preference values by user_id for one chunk of ids."""
+    global _preferences_view_unavailable
+    columns = ",".join(["user_id"] + VOICE_PREFERENCE_KEYS + COGNITIVE_PREFERENCE_KEYS)
+    if not _preferences_view_unavailable:
+        try:
+            return {str(row["user_id"]): row for row in _select_in(PREFERENCES_VIEW, columns, user_ids)}
+        except Exception as e:
+            if "PGRST205" in str(e):  # View not in the schema cache; stop trying it on this worker
+                logger.warning(f"{PREFERENCES_VIEW} unavailable, loading preference tables separately: {e}")
+                _preferences_view_unavailable = True
+            else:
+                logger.warning(f"{PREFERENCES_VIEW} query failed, loading preference tables for this call: {e}")
+
+    rows: Dict[str, Dict[str, Any]] = {}
+    for table, keys in (("voice_agent_preferences", VOICE_PREFERENCE_KEYS),
+                        ("cognitive_preferences", COGNITIVE_PREFERENCE_KEYS)):
+        for row in _select_in(table, ",".join(["user_id"] + keys), user_ids):
+            rows.setdefault(str(row["user_id"]), {}).update({k: row.get(k) for k in keys})
+    return rows
+
+
+def get_user_preferences_bulk(user_ids: List[str]) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Resolved preferences for many users in one query (per PREFERENCES_BULK_CHUNK ids).
+    Every requested id is present in the result; users without stored rows get the
+    defaults. Returns None if Supabase is unavailable or the query fails.
+    """
+    if not supabase:
+        logging.error("get_user_preferences_bulk: Supabase client not available.")
+        return None
+    unique_ids = list(dict.fromkeys(str(uid) for uid in user_ids if uid))
+    if not unique_ids:
+        return {}
+
+    try:
+        stored: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(unique_ids), PREFERENCES_BULK_CHUNK):
+            chunk = unique_ids[start:start + PREFERENCES_BULK_CHUNK]
+            logging.debug(f"Fetching preferences for {len(chunk)} user(s)")
+            stored.update(_load_preference_rows(chunk))
+    except Exception as e:
+        logging.error(f"Unexpected error fetching preferences for {len(unique_ids)} user(s): {e}", exc_info=True)
+        return None
+    return {uid: resolve_preferences(stored.get(uid)) for uid in unique_ids}
+
+
 def get_user_preferences(user_id: str) -> Optional[Dict[str, str]]:
     """
     Retrieves user preferences from Supabase voice_agent_preferences and cognitive_preferences.
@@ -422,104 +702,13 @@ def get_user_preferences(user_id: str) -> Optional[Dict[str, str]]:
     Returns:
         A dictionary of preferences, or None if a critical error occurs.
     """
-    if not supabase:
-        logging.error("get_user_preferences: Supabase client not available.")
-        return None
     if not user_id:
         logging.warning("get_user_preferences: No user_id provided.")
         return None
-
-    preferences: Dict[str, Any] = {}
-
-    # --- Define the ACTUAL defaults here ---
-    defaults = {
-        "speaking_rate": "normal",
-        "interaction_style": "friendly",
-        "explanation_detail_level": "standard",
-        "discussion_depth": "moderate",
-        "learning_style": "visual",
-        "reading_pace": "normal",
-        "preferred_complexity_level": "medium",
-        "preferred_interaction_frequency": "regular"
-        # Add any other preferences your application uses with their defaults
-    }
-    # --- End defaults definition ---
-
-    try:
-        # --- Query voice agent preferences ---
-        logging.debug(f"Fetching voice agent preferences for user: {user_id}")
-        # Define keys expected from this table
-        voice_pref_keys = [
-            "speaking_rate", "interaction_style", "explanation_detail_level",
-            "discussion_depth"
-        ]
-        agent_resp: PostgrestAPIResponse = supabase.table("voice_agent_preferences") \
-            .select(",".join(voice_pref_keys)) \
-            .eq("user_id", user_id).limit(1).execute()
-
-        if hasattr(agent_resp, 'error') and agent_resp.error:
-            # Log error but continue to cognitive prefs
-            error_info = agent_resp.error.message if hasattr(
-                agent_resp.error, 'message') else str(agent_resp.error)
-            logging.error(
-                f"Supabase API error fetching voice prefs for user {user_id}: {error_info}"
-            )
-        elif agent_resp.data:
-            row = agent_resp.data[0]
-            # Update only the keys fetched
-            for key in voice_pref_keys:
-                if key in row and row[
-                        key] is not None:  # Check if key exists and is not null
-                    preferences[key] = row[key]
-        else:
-            logging.info(
-                f"No voice agent preferences found for user: {user_id}.")
-        # --- End query voice agent preferences ---
-
-        # --- Query cognitive preferences ---
-        logging.debug(f"Fetching cognitive preferences for user: {user_id}")
-        # Define keys expected from this table
-        cognitive_pref_keys = [
-            "learning_style", "reading_pace", "preferred_complexity_level",
-            "preferred_interaction_frequency"
-        ]
-        cognitive_resp: Optional[PostgrestAPIResponse] = supabase.table("cognitive_preferences") \
-            .select(",".join(cognitive_pref_keys)).eq("user_id", user_id).limit(1).execute()
-
-        if hasattr(cognitive_resp, 'error') and cognitive_resp.error:
-            error_info = cognitive_resp.error.message if hasattr(
-                cognitive_resp.error, 'message') else str(cognitive_resp.error)
-            logging.error(
-                f"Supabase API error fetching cognitive preferences for user {user_id}: {error_info}"
-            )
-        elif cognitive_resp.data:
-            row = cognitive_resp.data[0]
-            # Update only the keys fetched
-            for key in cognitive_pref_keys:
-                if key in row and row[
-                        key] is not None:  # Check if key exists and is not null
-                    preferences[key] = row[key]
-        else:
-            logging.info(
-                f"No cognitive preferences found for user: {user_id}.")
-        # --- End query cognitive preferences ---
-
-    except Exception as e:
-        logging.error(
-            f"Unexpected error fetching user preferences for user {user_id}: {e}",
-            exc_info=True)
-        # Return None on major error, let caller handle defaults
+    preferences = get_user_preferences_bulk([user_id])
+    if preferences is None:
         return None
-
-    # Consolidate and apply defaults, converting to string as per type hint
-    final_preferences: Dict[str, str] = {}
-    for key, default_value in defaults.items():
-        # Get value from fetched preferences dict, falling back to default if key is missing
-        value = preferences.get(key, default_value)
-        # Ensure final value is string, handle potential None values from DB get/default
-        final_preferences[key] = str(value) if value is not None else str(
-            default_value)
-
+    final_preferences = preferences[str(user_id)]
     logging.debug(f"Final preferences for user {user_id}: {final_preferences}")
     return final_preferences
 
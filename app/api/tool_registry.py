@@ -1,19 +1,71 @@
-tool_handlers = {}
+# app/api/tool_registry.py
 
-def register_tool_handler(name):
+import os
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from app.services.memory_diagnostics import register_memory_report
+
+logger = logging.getLogger(__name__)
+
+# Deadline applied to a tool call when its registration does not set one.
+DEFAULT_TOOL_TIMEOUT_S = float(os.environ.get("TOOL_DEFAULT_TIMEOUT_S", 10))
+
+
+@dataclass
+class ToolSpec:
+    """Registration record for a Vapi tool handler."""
+    name: str
+    handler: Callable
+    timeout: float = DEFAULT_TOOL_TIMEOUT_S
+    max_concurrency: Optional[int] = None  # None = unlimited
+    requires_user: bool = False  # Executor injects the caller's Supabase user_id
+    background: bool = False  # Run on the job runner; the call gets an immediate "accepted" result
+
+
+# Single registry shared by every webhook blueprint.
+tool_specs: Dict[str, ToolSpec] = {}
+# name -> handler view of the same registry, kept for existing callers.
+tool_handlers: Dict[str, Callable] = {}
+register_memory_report("tool_registry.tool_specs", lambda: tool_specs)
+
+
+def register_tool_handler(name: str, timeout: Optional[float] = None,
+                          max_concurrency: Optional[int] = None,
+                          requires_user: bool = False, background: bool = False):
     """
     Decorator to register a tool handler function.
-    The decorated function will be stored in the tool_handlers dictionary.
+    Handlers may be sync or async; they receive `tool_call_id` plus the parsed
+    tool arguments (and `user_id` when `requires_user` is set).
+    Background tools return a job id at once; `timeout` does not apply to them.
     """
     def decorator(func):
+        if name in tool_specs and tool_specs[name].handler is not func:
+            logger.warning(f"Tool handler '{name}' re-registered; replacing {tool_specs[name].handler.__qualname__}.")
+        tool_specs[name] = ToolSpec(
+            name=name,
+            handler=func,
+            timeout=timeout if timeout is not None else DEFAULT_TOOL_TIMEOUT_S,
+            max_concurrency=max_concurrency,
+            requires_user=requires_user,
+            background=background,
+        )
         tool_handlers[name] = func
         return func
     return decorator
 
-def get_tool_handler(name):
+
+def get_tool_spec(name: str) -> Optional[ToolSpec]:
+    """Retrieve a registered tool spec by name."""
+    return tool_specs.get(name)
+
+
+def get_tool_handler(name: str) -> Optional[Callable]:
     """Retrieve a registered tool handler by name."""
     return tool_handlers.get(name)
 
-def list_registered_tools():
+
+def list_registered_tools() -> List[str]:
     """List all registered tool handler names."""
-    return list(tool_handlers.keys())
\ No newline at end of file
+    return list(tool_specs.keys())
@@ -1,10 +1,10 @@
 # app/api/webhook.py
 import logging
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from pydantic import ValidationError
 from typing import List, Optional, Dict, Any # Added Dict, Any
 import os
-from pathlib import Path
 import asyncio
 import json
 # Removed sqlite3 as we are moving away from it for this handler's core logic
@@ -37,137 +37,92 @@ logger = logging.getLogger(__name__)
 # Initialize the Blueprint.
 webhook = Blueprint('webhook', __name__)
 
-# A dictionary to register tool handlers (if this pattern is still used elsewhere)
-tool_handlers = {}
-
-# --- Register Tool Handlers ---
-def register_tool_handler(tool_name):
-    def decorator(func):
-        tool_handlers[tool_name] = func
-        return func
-    return decorator
+# Tool handlers live in the shared registry; execution goes through the tool executor.
+from app.api.tool_registry import register_tool_handler
+from app.services.tool_executor import (
+    parse_tool_calls,
+    any_requires_user,
+    execute_tool_calls
+)
+from app.services.job_runner import get_job
+from app.services.artifact_store import ArtifactRef, put_artifact, put_json_artifact
+from app.services.profile_cache import invalidate_user_preferences
+from app.services.streaming_ingest import ingest_json_stream
+from app.services.tracing import start_trace, span, set_trace_name
+import app.tools.various_tool_handlers  # noqa: F401 - registers shared tools (schedule_clickup, ...)
 
 # ... (init_database_directory, ensure_db_directory, store_in_database - keep if other tools use them) ...
 # ... (webhook_route, extract_tool_calls, other handlers as before) ...
 
-# --- NEW TOOL HANDLER for Updating Preferences ---
-async def tool_call_handler(payload: Dict[str, Any]) -> Dict[str, Any]: # Vapi expects a single tool_results object for function-call
-    """
-    Generalized handler for processing 'function-call' or 'tool-calls' events from Vapi.
-    Extracts tool call information, finds the Supabase user UUID,
-    dispatches to the registered handler, and prepares the result for Vapi.
-    Vapi's 'function-call' event sends a single 'functionCall' object.
-    """
-    logger.info(f"Processing tool_call_handler for payload type: {payload.get('type')}")
-
-    # For Vapi's 'function-call' event type, the tool call is under 'functionCall'
-    tool_call_data = payload.get('functionCall') 
-    # If it were an OpenAI-style 'tool_calls' array, you'd iterate,
-    # but Vapi's 'function-call' is singular.
-    # tool_calls_list = payload.get('tool_calls', []) 
-
-    if not tool_call_data or not isinstance(tool_call_data, dict):
-        logger.error(f"Invalid or missing 'functionCall' data in payload: {str(payload)[:300]}")
-        return {"toolCallResult": json.dumps({"status": "error", "message": "Invalid tool call structure in request."})}
-
-
-    # --- Extract User Context (Supabase User UUID) ---
-    # This is crucial for tools that operate on user-specific data, like preference updates.
-    # Vapi's 'function-call' payload should still contain the 'call' object with metadata.
-    call_context = payload.get('call', {})
-    user_email_from_payload = None
+def _extract_user_email(payload: Dict[str, Any]) -> Optional[str]:
+    """Finds the caller's email in call.assistantOverrides or assistant metadata."""
     try:
-        user_email_from_payload = call_context.get('assistantOverrides',{}).get('metadata',{}).get('data',{}).get('user',{}).get('email')
-        if not user_email_from_payload and payload.get('assistant',{}).get('metadata'): # Fallback
-            user_email_from_payload = payload.get('assistant',{}).get('metadata',{}).get('data',{}).get('user',{}).get('email')
+        user_email = payload.get('call', {}).get('assistantOverrides', {}).get('metadata', {}).get('data', {}).get('user', {}).get('email')
+        if not user_email and payload.get('assistant', {}).get('metadata'): # Fallback
+            user_email = payload.get('assistant', {}).get('metadata', {}).get('data', {}).get('user', {}).get('email')
+        return user_email
     except Exception as e:
         logger.warning(f"Could not extract user_email for tool call context: {e}")
+        return None
 
-    supabase_user_uuid_for_tool = None
-    if user_email_from_payload:
-        supabase_user_uuid_for_tool = get_supabase_user_id_by_email(user_email_from_payload)
-
-    if not supabase_user_uuid_for_tool:
-        logger.warning(f"Could not determine Supabase user ID for tool call. Some tools may fail if they require user_id.")
-        # For update_user_preferences_tool, this is a critical failure.
 
+async def tool_call_handler(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generalized handler for 'tool-calls' (and legacy 'function-call') events from Vapi.
+    All tool calls in the event run concurrently through the tool executor, so a
+    multi-tool turn finishes in the time of its slowest tool.
 
-    # --- Process the single tool call from 'functionCall' ---
-    # Vapi 'function-call' has `toolCallId` at the top level of the payload
-    # and the function details under `functionCall`.
-    tool_call_id_from_vapi = payload.get("toolCallId", 
-                                         f"unknown_tool_call_{generate_session_hash(payload.get('call',{}).get('id','call'),
-                                                                                    str(payload.get('timestamp','time')))[:8]}")
+    Returns {"results": [{"toolCallId", "result"}, ...]} for 'tool-calls' events and
+    {"toolCallResult": {...}} for the singular 'functionCall' form.
+    """
+    logger.info(f"Processing tool_call_handler for payload type: {payload.get('type')}")
 
-    function_details = tool_call_data # This is the content of 'functionCall'
-    tool_name = function_details.get("name")
-    arguments_str = function_details.get("arguments", "{}") # Arguments are a JSON string
+    raw_calls = payload.get('toolCallList') or payload.get('toolCalls')
+    if not raw_calls and payload.get('toolWithToolCallList'):
+        raw_calls = [item.get('toolCall') for item in payload['toolWithToolCallList'] if isinstance(item, dict)]
+    singular = False
+    if not raw_calls:
+        # Vapi's 'function-call' event sends a single 'functionCall' object,
+        # with `toolCallId` at the top level of the payload.
+        tool_call_data = payload.get('functionCall')
+        if not tool_call_data or not isinstance(tool_call_data, dict):
+            logger.error(f"Invalid or missing tool call data in payload: {str(payload)[:300]}")
+            return {"toolCallResult": json.dumps({"status": "error", "message": "Invalid tool call structure in request."})}
+        call_ref = payload.get('call', {}).get('id', 'call')
+        fallback_id = f"unknown_tool_call_{generate_session_hash(call_ref, str(payload.get('timestamp', 'time')))[:8]}"
+        raw_calls = [{"id": payload.get("toolCallId", fallback_id), "function": tool_call_data}]
+        singular = True
+
+    calls = parse_tool_calls(raw_calls)
+
+    # --- Call context: background tools report back through the call's control URL ---
+    call_context = payload.get('call', {}) or {}
+    context: Dict[str, Any] = {
+        "call_id": call_context.get('id'),
+        "control_url": (call_context.get('monitor') or {}).get('controlUrl')
+    }
 
-    arguments_dict = {}
-    try:
-        arguments_dict = json.loads(arguments_str)
-        logger.info(f"Executing tool: {tool_name} with ID: {tool_call_id_from_vapi}, Args: {arguments_dict}")
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON in arguments for tool {tool_name}: {arguments_str}")
-        tool_result_content = json.dumps({"status": "error", "message": "Invalid arguments format."})
-        return {"toolCallResult": {"toolCallId": tool_call_id_from_vapi, "result": tool_result_content}}
+    # --- Extract User Context (Supabase User UUID) only if a tool needs it ---
+    if any_requires_user(calls):
+        user_email_from_payload = _extract_user_email(payload)
+        if user_email_from_payload:
+            context["user_id"] = await asyncio.to_thread(get_supabase_user_id_by_email, user_email_from_payload)
+        if not context.get("user_id"):
+            logger.warning("Could not determine Supabase user ID for tool call. Tools requiring user_id will fail.")
 
+    for call in calls:
+        logger.info(f"Executing tool: {call.name} with ID: {call.tool_call_id}, Args: {call.arguments}")
+    outcomes = await execute_tool_calls(calls, context)
+    results = [outcome.to_vapi_result() for outcome in outcomes]
 
-    handler = tool_handlers.get(tool_name)
-    tool_result_content = "" # This will be the JSON string content for the tool result
-
-    if handler:
-        try:
-            # Prepare arguments for the specific handler
-            handler_args = {"tool_call_id": tool_call_id_from_vapi} # Vapi expects this ID back
-
-            if tool_name == "update_user_preferences_tool":
-                if not supabase_user_uuid_for_tool:
-                    msg = "User context (user_id) not found for update_user_preferences_tool."
-                    logger.error(msg)
-                    tool_result_content = json.dumps({"status": "error", "message": msg})
-                else:
-                    # Extract specific args for this tool
-                    handler_args["user_id"] = supabase_user_uuid_for_tool
-                    handler_args["preference_key"] = arguments_dict.get("preference_key")
-                    handler_args["preference_value"] = arguments_dict.get("preference_value")
-                    # handler_args["preference_type"] = arguments_dict.get("preference_type") # If you use it
-
-                    if not (handler_args["preference_key"] and handler_args["preference_value"] is not None):
-                        msg = "Missing preference_key or preference_value for update_user_preferences_tool."
-                        logger.error(f"{msg} Args: {arguments_dict}")
-                        tool_result_content = json.dumps({"status": "error", "message": msg})
-                    else:
-                        # Call the handler (which itself returns a dict with tool_call_id and content)
-                        # The handler's returned 'content' is already a JSON string.
-                        # So, the result_dict from the handler will be like:
-                        # {"tool_call_id": "...", "content": "{\"status\": \"success\", ...}"}
-                        result_dict_from_handler = await handler(**handler_args) if asyncio.iscoroutinefunction(handler) else handler(**handler_args)
-                        tool_result_content = result_dict_from_handler.get("content", 
-                                                                           json.dumps({"status":"error", "message":"Handler did not return content."}))
-            else:
-                # Generic handler call for other tools, passing all parsed arguments
-                if asyncio.iscoroutinefunction(handler):
-                    result_dict_from_handler = await handler(**handler_args, **arguments_dict)
-                else:
-                    result_dict_from_handler = handler(**handler_args, **arguments_dict)
-                tool_result_content = result_dict_from_handler.get("content", json.dumps({"status":"error", "message":"Handler did not return content."}))
-        except Exception as e:
-            logger.error(f"Error during execution of tool {tool_name}: {e}", exc_info=True)
-            tool_result_content = json.dumps({"status": "error", "message": f"Execution error in tool {tool_name}: {str(e)}"})
-    else:
-        logger.warning(f"No handler registered for tool {tool_name}")
-        tool_result_content = json.dumps({"status": "error", "message": f"No handler for tool {tool_name}."})
-
-    # Vapi expects a specific response format for 'function-call' results
-    # It's typically a top-level object with a 'toolCallResult' key
-    # containing the 'toolCallId' and 'result' (which is the JSON string content).
-    return {"toolCallResult": {"toolCallId": tool_call_id_from_vapi, "result": tool_result_content}}
+    if singular:
+        return {"toolCallResult": results[0]}
+    return {"results": results}
 
 # --- End New Tool Handler ---
 
 # --- Modify tool_call_handler to correctly extract arguments for the new tool ---
-@register_tool_handler("update_user_preferences_tool")
+@register_tool_handler("update_user_preferences_tool", timeout=5, requires_user=True)
 async def handle_update_user_preferences(tool_call_id: str, user_id: str,
                                          preference_key: str, preference_value: Any) -> Dict[str, Any]:
     """
@@ -207,15 +162,7 @@ async def handle_update_user_preferences(tool_call_id: str, user_id: str,
     response_content_dict: Dict[str, Any]
     if success:
         logger.info(f"Successfully updated preference '{preference_key}' for user {user_id}.")
-        cache = current_app.extensions.get('cache')
-        if cache:
-            cache_key = f"user_prefs_{user_id}"
-            try:
-                cache.delete(cache_key)
-                logger.info(f"Invalidated preferences cache for user {user_id} after tool update.")
-            except Exception as cache_err:
-                logger.error(f"Failed to invalidate cache for user {user_id}: {cache_err}")
-        else: logger.warning("Cache not available, skipping cache invalidation for preference update.")
+        invalidate_user_preferences(user_id)
         response_content_dict = {"status": "success", "message": f"Preference '{preference_key}' updated to '{preference_value}'."}
     else:
         logger.error(f"Failed to update preference '{preference_key}' for user {user_id} in database.")
@@ -226,13 +173,39 @@ async def handle_update_user_preferences(tool_call_id: str, user_id: str,
 # ------------------------------
 # Webhook Route and Core Logic
 # ------------------------------
+# Bodies at least this large (or chunked, without a length) are parsed incrementally,
+# with message arrays spooled straight to compressed storage (app/services/streaming_ingest.py).
+STREAMING_INGEST_MIN_BYTES = int(os.environ.get("STREAMING_INGEST_MIN_BYTES", 1024 * 1024))
+
+def _should_stream_body() -> bool:
+    if not request.is_json:
+        return False
+    return request.content_length is None or request.content_length >= STREAMING_INGEST_MIN_BYTES
+
 @webhook.route('/', methods=['POST'])
 async def webhook_route():
     """
     Main webhook route handler.
     Processes incoming JSON payloads from VAPI.
+    Traced as webhook.<event type> (stage timings logged and aggregated per event).
     """
-    payload = request.get_json()
+    with start_trace("webhook"):
+        return await _handle_webhook()
+
+
+async def _handle_webhook():
+    """Body of the webhook route; runs inside the event's trace."""
+    ingested = None
+    with span("ingest"):
+        if _should_stream_body():
+            try:
+                ingested = await asyncio.to_thread(ingest_json_stream, request.stream)
+            except ValueError as e:
+                logger.warning(f"Webhook received an unparseable streamed JSON body: {e}")
+                return jsonify({"error": "Invalid JSON payload"}), 400
+            payload = ingested.payload
+        else:
+            payload = request.get_json()
     if not payload:
         logger.warning("Webhook received no JSON payload.")
         return jsonify({"error": "No JSON payload"}), 400
@@ -240,9 +213,17 @@ async def webhook_route():
     event_payload = payload.get('message', payload)
     if not event_payload or not isinstance(event_payload, dict):
         logger.error(f"Webhook: 'message' field missing or not a dict: {str(payload)[:200]}")
+        if ingested: ingested.discard()
         return jsonify({"error": "Invalid payload structure."}), 400
 
     event_type = event_payload.get('type')
+    if ingested and ingested.spools:
+        if event_type == "end-of-call-report":
+            # The report only needs the transcript and artifact.messages, and only as stored artifacts
+            event_payload['_ingested_artifacts'] = await asyncio.to_thread(
+                ingested.commit, ("messages", "transcript", "artifact_transcript"))
+        else:
+            await asyncio.to_thread(ingested.rehydrate)
     logger.info(f"Webhook: Received event type '{event_type or 'N/A'}'")
     logger.debug(f"Webhook Full Event Payload for type '{event_type}': {str(event_payload)[:500]}") # Log snippet
 
@@ -260,16 +241,19 @@ async def webhook_route():
         "model-output": model_output_handler
     }
     handler = handlers.get(event_type)
+    # Trace names label the stage histograms, so event types without a handler share one name
+    set_trace_name(f"webhook.{event_type if event_type in handlers else 'unknown'}")
 
     response_data: Dict[str, Any] = {} # Ensure response_data is always a dict
     status_code = 200 # Default success acknowledgement
 
     if handler:
         try:
-            if asyncio.iscoroutinefunction(handler):
-                response_data = await handler(event_payload)
-            else:
-                response_data = handler(event_payload)
+            with span("handler"):
+                if asyncio.iscoroutinefunction(handler):
+                    response_data = await handler(event_payload)
+                else:
+                    response_data = handler(event_payload)
 
             # Ensure handler returned a dict
             if not isinstance(response_data, dict):
@@ -296,6 +280,18 @@ async def webhook_route():
 
     return jsonify(response_data), status_code
 
+@webhook.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def background_job_status(job_id: str):
+    """Status of a background tool job (e.g. schedule_clickup) by job id, for the app's signed-in user."""
+    job = get_job(job_id)
+    # A job started for a known user is only visible to that user
+    if not job or (job.get("user_id") and job["user_id"] != get_jwt_identity()):
+        return jsonify({"error": "Job not found."}), 404
+    for internal in ("control_url", "owner", "heartbeat"):
+        job.pop(internal, None)
+    return jsonify(job), 200
+
 # ------------------------------
 # Specific VAPI Message Handlers
 # ------------------------------
@@ -333,7 +329,8 @@ def conversation_update_handler(payload: dict) -> Dict[str, Any]: # Changed from
              logger.error("User email not found in conversation-update payload. Cannot link to Supabase user.")
              return {"status": "acknowledged_with_error", "message": "User email missing for DB operations."}
 
-        supabase_user_uuid = get_supabase_user_id_by_email(user_email)
+        with span("supabase.user_lookup"):
+            supabase_user_uuid = get_supabase_user_id_by_email(user_email)
         if not supabase_user_uuid:
             logger.error(f"Supabase user UUID not found for email: {user_email} (from webhook).")
             return {"status": "acknowledged_with_error", "message": "User not found in Supabase."}
@@ -345,7 +342,8 @@ def conversation_update_handler(payload: dict) -> Dict[str, Any]: # Changed from
              return {"status": "acknowledged_with_error", "message": "Call ID missing."}
 
         book_id = None # Determine if/how book_id is available in this payload
-        session_id_hash = get_or_create_voice_session(call_uuid=call_id, user_id=supabase_user_uuid, book_id=book_id)
+        with span("supabase.session"):
+            session_id_hash = get_or_create_voice_session(call_uuid=call_id, user_id=supabase_user_uuid, book_id=book_id)
         if not session_id_hash:
             logger.error(f"Failed to get/create voice session for call {call_id}")
             return {"status": "acknowledged_with_error", "message": "Session handling failed."}
@@ -363,10 +361,11 @@ def conversation_update_handler(payload: dict) -> Dict[str, Any]: # Changed from
                     if last_user_speech is not None and last_agent_response is not None: break
         else: logger.info(f"Webhook: Conversation list empty for session {session_id_hash[:8]}...")
 
-        if last_user_speech:
-            store_voice_interaction(session_id_hash, supabase_user_uuid, "user_utterance", user_speech=last_user_speech)
-        if last_agent_response:
-            store_voice_interaction(session_id_hash, supabase_user_uuid, "agent_response", agent_response=last_agent_response)
+        with span("supabase.store_interaction"):
+            if last_user_speech:
+                store_voice_interaction(session_id_hash, supabase_user_uuid, "user_utterance", user_speech=last_user_speech)
+            if last_agent_response:
+                store_voice_interaction(session_id_hash, supabase_user_uuid, "agent_response", agent_response=last_agent_response)
         if not last_user_speech and not last_agent_response:
             logger.info(f"Webhook: No new user/assistant turns found to store for session {session_id_hash[:8]}...")
 
@@ -420,6 +419,38 @@ async def assistant_request_handler(payload: Dict[str, Any]) -> Optional[Dict[st
     # The example code to return an assistant config can be kept if needed.
     return {"message": "Assistant request received, no dynamic change implemented."} # Or return assistant config
 
+def _store_call_artifacts(transcript: Optional[str], messages: Optional[List[Any]],
+                          ingested: Optional[Dict[str, ArtifactRef]] = None) -> Dict[str, Any]:
+    """
+    Writes the transcript and message array to the artifact store and returns the
+    session columns pointing at them. Falls back to the inline transcript column if
+    the store is unavailable, so a report is never lost. `ingested` holds artifacts
+    already written while a large body was streamed in.
+    """
+    columns: Dict[str, Any] = {}
+    ingested = ingested or {}
+    transcript_ref = ingested.get("transcript") or ingested.get("artifact_transcript")
+    if transcript_ref:
+        columns.update(transcript_artifact=transcript_ref.sha256, transcript_size=transcript_ref.size)
+        transcript = None
+    if ingested.get("messages"):
+        columns.update(messages_artifact=ingested["messages"].sha256, messages_size=ingested["messages"].size)
+        messages = None
+    if transcript:
+        try:
+            ref = put_artifact(transcript, "transcript")
+            columns.update(transcript_artifact=ref.sha256, transcript_size=ref.size)
+        except Exception as e:
+            logger.error(f"Could not store transcript artifact, keeping it inline: {e}", exc_info=True)
+            columns["full_transcript"] = transcript
+    if messages:
+        try:
+            ref = put_json_artifact(messages, "messages")
+            columns.update(messages_artifact=ref.sha256, messages_size=ref.size)
+        except Exception as e:
+            logger.error(f"Could not store messages artifact: {e}", exc_info=True)
+    return columns
+
 async def end_of_call_report_handler(payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Handles 'end-of-call-report' and updates the corresponding voice_agent_session
@@ -450,13 +481,16 @@ async def end_of_call_report_handler(payload: Dict[str, Any]) -> Dict[str, Any]:
             }
             # Extract recording URLs from the 'artifact' object
             artifact = payload.get('artifact', {})
-            if isinstance(artifact, dict):
-                # Check for recording URLs
-                update_payload["recording_url"] = artifact.get('recording_url') or artifact.get('recordingUrl')
-                update_payload["stereo_recording_url"] = artifact.get('stereo_recording_url') or artifact.get('stereoRecordingUrl')
-
-            if payload.get('transcript'):
-                update_payload["full_transcript"] = payload.get('transcript')
+            if not isinstance(artifact, dict):
+                artifact = {}
+            # Check for recording URLs
+            update_payload["recording_url"] = artifact.get('recording_url') or artifact.get('recordingUrl')
+            update_payload["stereo_recording_url"] = artifact.get('stereo_recording_url') or artifact.get('stereoRecordingUrl')
+
+            # Transcript and messages go to the compressed artifact store; the row keeps pointer + size
+            update_payload.update(await asyncio.to_thread(
+                _store_call_artifacts, payload.get('transcript') or artifact.get('transcript'), artifact.get('messages'),
+                payload.get('_ingested_artifacts')))
 
             if supabase:  # Ensure Supabase client is initialized
                 try:
@@ -17,9 +17,8 @@ from app.personalization.user_preferences import (
     store_voice_interaction,
     update_session_end_time
 )
-# Example imports for additional functionalities.
-# These should exist in your project; if not, create stub modules.
-from app.functions.schedule_clickup import generate_schedule, process_schedule, transform_llm_output
+# Registers schedule_clickup and other shared tools in the tool registry.
+import app.tools.various_tool_handlers  # noqa: F401
 # from app.vapi_message_handlers.conversation_update import ConversationUpdate
 from app.vapi_message_handlers.end_of_call_report import EndOfCallReport
 from app.vapi_message_handlers.model_output import ModelOutput
@@ -36,8 +35,9 @@ logger = logging.getLogger(__name__)
 # Initialize the Blueprint.
 webhook = Blueprint('webhook', __name__)
 
-# A dictionary to register tool handlers.
-tool_handlers = {}
+# Tool handlers are registered in the shared registry (app/api/tool_registry.py).
+from app.api.tool_registry import register_tool_handler
+from app.services.tool_executor import parse_tool_calls, execute_tool_calls
 
 
 # ------------------------------
@@ -181,21 +181,6 @@ async def webhook_route():
         return jsonify({"error": "An unexpected error occurred."}), 500
 
 
-# ------------------------------
-# Tool handler registration
-# ------------------------------
-def register_tool_handler(tool_name):
-    """
-    Decorator to register tool handlers.
-    """
-
-    def decorator(func):
-        tool_handlers[tool_name] = func
-        return func
-
-    return decorator
-
-
 def extract_tool_calls(payload):
     """
     Extract tool call data from the payload and categorize it by tool type.
@@ -247,37 +232,14 @@ def extract_tool_calls(payload):
 async def tool_call_handler(payload):
     """
     Generalized handler for processing tool calls in a payload.
+    Independent tool calls run concurrently through the shared tool executor.
     """
     artifact_messages = payload.get("artifact", {}).get("messages", [])
-    results = []
-
-    for message in artifact_messages:
-        tool_calls = message.get("toolCalls", [])
-        for call in tool_calls:
-            tool_call_id = call.get("id", "")
-            function = call.get("function", {})
-            tool_name = function.get("name")
-            arguments = function.get("arguments", {})
-
-            if isinstance(arguments, str):
-                try:
-                    arguments = json.loads(arguments)
-                except json.JSONDecodeError:
-                    logging.error(
-                        f"Invalid JSON in arguments for tool {tool_name}")
-                    continue
-
-            handler = tool_handlers.get(tool_name)
-            if handler:
-                if asyncio.iscoroutinefunction(handler):
-                    result = await handler(tool_call_id, **arguments)
-                else:
-                    result = handler(tool_call_id, **arguments)
-                results.append(result)
-            else:
-                logging.warning(f"No handler registered for tool {tool_name}")
-
-    return results
+    raw_calls = [call for message in artifact_messages for call in message.get("toolCalls", [])]
+    outcomes = await execute_tool_calls(parse_tool_calls(raw_calls))
+    return [outcome.result if outcome.status == "success" else
+            {"tool": outcome.name, "status": outcome.status, "message": outcome.message}
+            for outcome in outcomes]
 
 
 async def process_tool_calls(payload):
@@ -397,40 +359,6 @@ async def handle_get_character_inspiration(tool_call_id,
     return {"tool": "getCharacterInspiration", "inspiration": inspiration}
 
 
-@register_tool_handler("schedule_clickup")
-async def handle_schedule_clickup(tool_call_id,
-                                  goal,
-                                  timeline,
-                                  resources,
-                                  space_id=90112974722):
-    """
-    Handler for schedule_clickup tool.
-    Generates a schedule using an LLM and integrates it with ClickUp.
-    """
-    try:
-        prompt = goal + timeline + resources
-        raw_schedule = await generate_schedule(prompt)
-        validated_schedule = transform_llm_output(raw_schedule)
-        await process_schedule(space_id=space_id, schedule=validated_schedule)
-        return {
-            "tool":
-            "schedule_clickup",
-            "status":
-            "success",
-            "schedule_name":
-            validated_schedule.schedule_name,
-            "message":
-            f"Schedule '{validated_schedule.schedule_name}' successfully created in ClickUp."
-        }
-    except Exception as e:
-        logging.error(f"Error in handle_schedule_clickup: {e}")
-        return {
-            "tool": "schedule_clickup",
-            "status": "error",
-            "message": str(e)
-        }
-
-
 # ------------------------------
 # Other VAPI Message Handlers
 # ------------------------------
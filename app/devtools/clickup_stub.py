@@ -0,0 +1,186 @@
+# app/devtools/clickup_stub.py
+"""
+Local stand-in for the subset of the ClickUp v2 API used by the schedule tools.
+
+    python -m app.devtools.clickup_stub --port 8765 --latency-ms 80 --rate-limit-per-min 100
+    export CLICKUP_BASE_URL=http://127.0.0.1:8765/api/v2
+
+Objects are kept in memory; GET /api/v2/_stub/state dumps them for inspection.
+"""
+
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+
+class ClickUpStubState:
+    """In-memory folders, lists, tasks and dependencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1000)
+        self.folders: Dict[str, Dict[str, Any]] = {}
+        self.lists: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.dependencies: list = []
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._window: list = []  # Timestamps of accepted requests in the last minute
+
+    def new_id(self) -> str:
+        return str(next(self._ids))
+
+    def dump(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"folders": self.folders, "lists": self.lists, "tasks": self.tasks,
+                    "dependencies": self.dependencies, "request_count": self.request_count,
+                    "rate_limited_count": self.rate_limited_count}
+
+    def admit(self, limit_per_min: int) -> Optional[float]:
+        """Sliding one-minute window like ClickUp's; returns seconds until a slot frees, or None."""
+        now = time.time()
+        with self.lock:
+            self._window = [t for t in self._window if now - t < 60.0]
+            if limit_per_min and len(self._window) >= limit_per_min:
+                self.rate_limited_count += 1
+                return self._window[0] + 60.0 - now
+            self._window.append(now)
+            return None
+
+
+class ClickUpStubHandler(BaseHTTPRequestHandler):
+    state: ClickUpStubState = None
+    latency_s: float = 0.0
+    rate_limit_per_min: int = 0  # 0 disables 429 simulation
+    api_prefix = "/api/v2"
+
+    def log_message(self, format, *args):  # Keep stdout quiet under load
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except json.JSONDecodeError:
+            return {}
+
+    def _route(self) -> Tuple[str, list]:
+        path = self.path.split("?", 1)[0]
+        if path.startswith(self.api_prefix):
+            path = path[len(self.api_prefix):]
+        return path, [part for part in path.split("/") if part]
+
+    def _before_request(self) -> bool:
+        """Hook for latency / admission; returns False if a response was already sent."""
+        with self.state.lock:
+            self.state.request_count += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if not self.headers.get("Authorization"):
+            self._send(401, {"err": "Token invalid", "ECODE": "OAUTH_025"})
+            return False
+        retry_after = self.state.admit(self.rate_limit_per_min)
+        if retry_after is not None:
+            reset = time.time() + retry_after
+            self._send(429, {"err": "Rate limit reached", "ECODE": "APP_002"}, headers={
+                "Retry-After": f"{retry_after:.3f}",
+                "X-RateLimit-Limit": str(self.rate_limit_per_min),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": str(int(reset) + 1)})
+            return False
+        return True
+
+    def do_GET(self):
+        path, parts = self._route()
+        if path == "/_stub/state":
+            return self._send(200, self.state.dump())
+        if not self._before_request():
+            return
+        with self.state.lock:
+            if len(parts) == 3 and parts[0] == "space" and parts[2] == "folder":
+                folders = [f for f in self.state.folders.values() if f["space_id"] == parts[1]]
+                return self._send(200, {"folders": folders})
+            if len(parts) == 3 and parts[0] == "folder" and parts[2] == "list":
+                lists = [l for l in self.state.lists.values() if l["folder_id"] == parts[1]]
+                return self._send(200, {"lists": lists})
+            if len(parts) == 3 and parts[0] == "list" and parts[2] == "task":
+                tasks = [t for t in self.state.tasks.values() if t["list_id"] == parts[1]]
+                return self._send(200, {"tasks": tasks})
+        self._send(404, {"err": f"Route not found: GET {path}"})
+
+    def do_POST(self):
+        path, parts = self._route()
+        if not self._before_request():
+            return
+        body = self._read_json()
+        with self.state.lock:
+            if len(parts) == 3 and parts[0] == "space" and parts[2] == "folder":
+                folder = {"id": self.state.new_id(), "name": body.get("name"), "space_id": parts[1]}
+                self.state.folders[folder["id"]] = folder
+                return self._send(200, folder)
+            if len(parts) == 3 and parts[0] == "folder" and parts[2] == "list":
+                if parts[1] not in self.state.folders:
+                    return self._send(404, {"err": "Folder not found"})
+                task_list = {"id": self.state.new_id(), "name": body.get("name"), "folder_id": parts[1]}
+                self.state.lists[task_list["id"]] = task_list
+                return self._send(200, task_list)
+            if len(parts) == 3 and parts[0] == "list" and parts[2] == "task":
+                if parts[1] not in self.state.lists:
+                    return self._send(404, {"err": "List not found"})
+                task = {**body, "id": self.state.new_id(), "list_id": parts[1]}
+                self.state.tasks[task["id"]] = task
+                return self._send(200, task)
+            if len(parts) == 3 and parts[0] == "task" and parts[2] == "dependency":
+                if parts[1] not in self.state.tasks:
+                    return self._send(404, {"err": "Task not found"})
+                self.state.dependencies.append({"task_id": parts[1], "depends_on": body.get("depends_on")})
+                return self._send(200, {})
+        self._send(404, {"err": f"Route not found: POST {path}"})
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                      rate_limit_per_min: int = 0):
+    """
+    Starts the stand-in on a daemon thread. Returns (server, base_url);
+    call server.shutdown() when done. Port 0 picks a free port.
+    """
+    handler = type("BoundClickUpStubHandler", (ClickUpStubHandler,),
+                   {"state": ClickUpStubState(), "latency_s": latency_ms / 1000.0,
+                    "rate_limit_per_min": rate_limit_per_min})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="clickup-stub", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}{ClickUpStubHandler.api_prefix}"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ClickUp API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added delay per request")
+    parser.add_argument("--rate-limit-per-min", type=int, default=0, help="Answer 429 above this rate (0 = off)")
+    args = parser.parse_args()
+    server, base_url = start_stub_server(args.host, args.port, args.latency_ms, args.rate_limit_per_min)
+    print(f"ClickUp stand-in listening; export CLICKUP_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,119 @@
+# app/devtools/ingest_benchmark.py
+"""
+Compares end-of-call-report ingestion paths on synthetic long calls.
+
+    python -m app.devtools.ingest_benchmark --hours 1 2 4
+
+"buffered" is the request.get_json() path: read the whole body, parse it, then write
+the transcript and messages to the artifact store. "streaming" is
+ingest_json_stream(): incremental parse with message arrays spooled compressed as
+they are read. Peak memory is measured with tracemalloc (Python allocations).
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from app.services import artifact_store
+from app.services.artifact_store import put_artifact, put_json_artifact
+from app.services.streaming_ingest import ingest_json_stream
+
+SYSTEM_PROMPT = ("You are a highly skilled assistant, deeply knowledgeable about the principles and "
+                 "strategies outlined in \"Atomic Habits\" by James Clear. ") * 60
+WORDS = ("habit identity system cue craving response reward environment friction streak "
+         "tiny improvement compound stack plateau motivation reflection review").split()
+
+
+def synthesize_report(hours: float, seconds_per_turn: float = 8.0, seed: int = 7) -> Dict[str, Any]:
+    """An end-of-call-report shaped like Vapi's, for a call of `hours` hours."""
+    rng = random.Random(seed)
+    turns = int(hours * 3600 / seconds_per_turn)
+    start_ms = 1746364524445
+    messages: List[Dict[str, Any]] = [{"role": "system", "message": SYSTEM_PROMPT, "time": start_ms, "secondsFromStart": 0}]
+    openai_messages: List[Dict[str, Any]] = [{"role": "system", "content": SYSTEM_PROMPT}]
+    transcript = []
+    for turn in range(turns):
+        for role in ("user", "bot"):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 60))).capitalize() + "."
+            seconds = turn * seconds_per_turn + (0 if role == "user" else seconds_per_turn / 2)
+            messages.append({"role": role, "message": text, "time": start_ms + int(seconds * 1000),
+                             "endTime": start_ms + int((seconds + 3) * 1000), "secondsFromStart": seconds,
+                             "duration": 3000, "source": "" if role == "user" else "model"})
+            openai_messages.append({"role": "user" if role == "user" else "assistant", "content": text})
+            transcript.append(f"{'User' if role == 'user' else 'AI'}: {text}")
+    transcript_text = "\n".join(transcript)
+    return {"message": {
+        "timestamp": start_ms + int(hours * 3600 * 1000),
+        "type": "end-of-call-report",
+        "endedReason": "customer-ended-call",
+        "summary": "A long coaching call about habit systems.",
+        "transcript": transcript_text,
+        "messages": messages,
+        "artifact": {"messages": messages, "messagesOpenAIFormatted": openai_messages,
+                     "transcript": transcript_text,
+                     "recordingUrl": "https://example.invalid/recording.wav"},
+        "analysis": {"summary": "A long coaching call about habit systems.", "successEvaluation": "true"},
+        "call": {"id": "benchmark-call", "type": "webCall", "status": "ended"},
+    }}
+
+
+def buffered_path(path: str) -> None:
+    with open(path, "rb") as f:
+        payload = json.loads(f.read())
+    event = payload["message"]
+    put_artifact(event["transcript"], "transcript")
+    put_json_artifact(event["artifact"]["messages"], "messages")
+
+
+def streaming_path(path: str) -> None:
+    with open(path, "rb") as f:
+        body = ingest_json_stream(f)
+    body.commit(("messages", "transcript"))
+
+
+def _measure(func: Callable[[str], None], path: str, repeats: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        func(path)
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_s": min(timings), "peak_mib": peak / (1024 * 1024)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark buffered vs streaming end-of-call ingestion")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1.0, 2.0, 4.0], help="Synthetic call lengths")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        artifact_store.ARTIFACT_DIR = Path(workdir) / "artifacts"  # Keep benchmark blobs out of data/
+        print(f"{'call':>6}{'body MiB':>10}{'buffered s':>12}{'peak MiB':>10}{'streaming s':>13}{'peak MiB':>10}")
+        for hours in args.hours:
+            path = os.path.join(workdir, f"eocr_{hours}h.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(synthesize_report(hours), f)
+            size_mib = os.path.getsize(path) / (1024 * 1024)
+            buffered = _measure(buffered_path, path, args.repeats)
+            streaming = _measure(streaming_path, path, args.repeats)
+            print(f"{hours:>5}h{size_mib:>10.1f}{buffered['best_s']:>12.3f}{buffered['peak_mib']:>10.1f}"
+                  f"{streaming['best_s']:>13.3f}{streaming['peak_mib']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
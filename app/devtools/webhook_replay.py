@@ -0,0 +1,658 @@
+# app/devtools/webhook_replay.py
+"""
+Replays Vapi webhook traffic into the webhook blueprint and reports latency per event type.
+
+    python -m app.devtools.webhook_replay --calls 50 --turns 6 --db-latency-ms 40
+    python -m app.devtools.webhook_replay --events recorded/ --calls 20 --json
+
+Each virtual call sends its events in order; calls run concurrently. Supabase and
+OpenAI are replaced by in-process stand-ins with configurable latency, so a run
+measures the webhook itself (validation, handler logic, DB round trips) and can be
+repeated. Recorded events (JSON, JSON list, JSONL, or the pasted payload dumps in
+attached_assets/) are re-targeted to each virtual call's id and user email.
+"""
+
+import sys
+import copy
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import itertools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# ------------------------------
+# Per-event DB call accounting
+# ------------------------------
+@dataclass
+class _CallCounter:
+    db_calls: int = 0
+    db_time_s: float = 0.0
+    llm_calls: int = 0
+
+
+# Set by the replay worker around each request; contextvars follow the view into
+# Flask's event loop thread and into asyncio.to_thread.
+_current_counter: contextvars.ContextVar[Optional[_CallCounter]] = contextvars.ContextVar(
+    "webhook_replay_counter", default=None)
+
+
+def _count(kind: str, elapsed: float = 0.0) -> None:
+    counter = _current_counter.get()
+    if counter is None:
+        return
+    if kind == "db":
+        counter.db_calls += 1
+        counter.db_time_s += elapsed
+    else:
+        counter.llm_calls += 1
+
+
+# ------------------------------
+# Supabase stand-in
+# ------------------------------
+class FakeAPIResponse:
+    """Mimics postgrest's APIResponse: .data, .count, .error."""
+
+    def __init__(self, data: Any = None, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+        self.error = None
+
+
+class FakeQuery:
+    """
+    Fluent query builder over in-memory rows. eq/neq/in_/is_ filters are applied;
+    other filters and modifiers are accepted and ignored.
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._filters: List[tuple] = []
+        self._count = None
+        self._limit: Optional[int] = None
+        self._order: List[tuple] = []
+        self._single = False
+        self._on_conflict: Optional[str] = None
+
+    # --- Operations ---
+    def select(self, *columns, count=None, **kwargs):
+        self._op, self._count = "select", count
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: Optional[str] = None, **kwargs):
+        self._op, self._payload, self._on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload, **kwargs):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # --- Filters ---
+    def eq(self, column, value):
+        self._filters.append(("eq", column, value))
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(("neq", column, value))
+        return self
+
+    def in_(self, column, values):
+        self._filters.append(("in", column, list(values)))
+        return self
+
+    def is_(self, column, value):
+        self._filters.append(("is", column, None if value in (None, "null") else value))
+        return self
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n, **kwargs):
+        self._limit = n
+        return self
+
+    def single(self):
+        self._single, self._limit = True, 1
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    def __getattr__(self, name):
+        # range, gt, lt, ilike, contains, ... : accepted, not applied
+        return lambda *args, **kwargs: self
+
+    # --- Execution ---
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        for op, column, value in self._filters:
+            current = row.get(column)
+            if op == "eq" and str(current) != str(value):
+                return False
+            if op == "neq" and str(current) == str(value):
+                return False
+            if op == "in" and str(current) not in {str(v) for v in value}:
+                return False
+            if op == "is" and current != value:
+                return False
+        return True
+
+    def execute(self) -> FakeAPIResponse:
+        return self._db._execute(self)
+
+
+# --- RPC stand-ins (same semantics as the functions in migrations/) ---
+def _rpc_patch_user_character(db: "FakeSupabase", params: Dict[str, Any]) -> Any:
+    with db._lock:
+        row = next((r for r in db.tables.get("user_profiles", []) if str(r.get("user_id")) == str(params["p_user_id"])), None)
+        if row is None:
+            return None
+        character = row.get("character") if isinstance(row.get("character"), dict) else {}
+        for op in params["p_ops"]:
+            if op["op"] == "append":
+                items = character.get(op["key"]) if isinstance(character.get(op["key"]), list) else []
+                if op.get("value") not in items:
+                    items = items + [op.get("value")]
+                character[op["key"]] = items
+            else:
+                character[op["key"]] = op.get("value")
+        row["character"] = character
+        return copy.deepcopy(character)
+
+
+def _rpc_upsert_login_user(db: "FakeSupabase", params: Dict[str, Any]) -> Any:
+    def keep(new, old):
+        return old if new is None else new
+
+    with db._lock:
+        users = db.tables.setdefault("users", [])
+        user = next((r for r in users if r.get("email") == params["p_email"]), None)
+        if user is not None and params.get("p_fingerprint") and user.get("login_fingerprint") == params["p_fingerprint"]:
+            return user["user_id"]
+        if user is None:
+            user = {"user_id": str(uuid.uuid5(uuid.NAMESPACE_URL, params["p_email"])), "email": params["p_email"],
+                    "password": params["p_password"], "email_verified": bool(params.get("p_email_verified"))}
+            users.append(user)
+        user["username"] = keep(params.get("p_username"), user.get("username"))
+        for column in ("email_verified", "first_name", "last_name"):
+            user[column] = keep(params.get(f"p_{column}"), user.get(column))
+        user["login_fingerprint"] = keep(params.get("p_fingerprint"), user.get("login_fingerprint"))
+
+        profiles = db.tables.setdefault("user_profiles", [])
+        profile = next((r for r in profiles if r.get("user_id") == user["user_id"]), None)
+        if profile is None:
+            profile = {"user_id": user["user_id"]}
+            profiles.append(profile)
+        for column, param in (("first_name", "p_first_name"), ("last_name", "p_last_name"),
+                              ("email", "p_email"), ("profile_picture_url", "p_picture")):
+            profile[column] = keep(params.get(param), profile.get(column))
+        for column, param in (("current_bg", "p_current_bg"), ("character", "p_character")):
+            profile[column] = keep(profile.get(column), params.get(param))
+        return user["user_id"]
+
+
+DEFAULT_RPC_HANDLERS: Dict[str, Any] = {
+    "patch_user_character": _rpc_patch_user_character,
+    "upsert_login_user": _rpc_upsert_login_user,
+}
+
+
+class FakeSupabase:
+    """In-memory Supabase client with a fixed latency per round trip."""
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpc_handlers: Dict[str, Any] = dict(DEFAULT_RPC_HANDLERS)
+        self.calls_by_table: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> SimpleNamespace:
+        def execute():
+            self._round_trip(f"rpc:{name}")
+            handler = self.rpc_handlers.get(name)
+            return FakeAPIResponse(handler(self, params or {}) if handler else None)
+        return SimpleNamespace(execute=execute)
+
+    def seed(self, table: str, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.tables.setdefault(table, []).extend(copy.deepcopy(list(rows)))
+
+    def _round_trip(self, label: str) -> None:
+        start = time.perf_counter()
+        delay = self.latency_s + (random.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.calls_by_table[label] = self.calls_by_table.get(label, 0) + 1
+        _count("db", time.perf_counter() - start)
+
+    def _execute(self, query: FakeQuery) -> FakeAPIResponse:
+        self._round_trip(f"{query._op}:{query._table}")
+        with self._lock:
+            rows = self.tables.setdefault(query._table, [])
+            if query._op == "select":
+                found = [copy.deepcopy(r) for r in rows if query._matches(r)]
+                for column, desc in reversed(query._order):
+                    # Insertion order breaks ties, as a serial/timestamp default would
+                    ranked = sorted(enumerate(found), key=lambda p: (str(p[1].get(column) or ""), p[0]), reverse=desc)
+                    found = [row for _, row in ranked]
+                total = len(found)
+                if query._limit is not None:
+                    found = found[:query._limit]
+                data = (found[0] if found else None) if query._single else found
+                return FakeAPIResponse(data, total if query._count else None)
+            if query._op in ("insert", "upsert"):
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                written = []
+                for item in payload:
+                    keys = [k.strip() for k in (query._on_conflict or "").split(",") if k.strip()]
+                    existing = None
+                    if query._op == "upsert" and keys:
+                        existing = next((r for r in rows if all(r.get(k) == item.get(k) for k in keys)), None)
+                    if existing is not None:
+                        existing.update(item)
+                        written.append(copy.deepcopy(existing))
+                    else:
+                        rows.append(copy.deepcopy(item))
+                        written.append(copy.deepcopy(item))
+                return FakeAPIResponse(written)
+            if query._op == "update":
+                updated = []
+                for row in rows:
+                    if query._matches(row):
+                        row.update(query._payload or {})
+                        updated.append(copy.deepcopy(row))
+                return FakeAPIResponse(updated)
+            if query._op == "delete":
+                kept = [r for r in rows if not query._matches(r)]
+                deleted = len(rows) - len(kept)
+                rows[:] = kept
+                return FakeAPIResponse([{}] * deleted)
+        return FakeAPIResponse([])
+
+
+# ------------------------------
+# OpenAI stand-in
+# ------------------------------
+class FakeOpenAI:
+    """Covers chat.completions.create (streaming or not) and embeddings.create."""
+
+    def __init__(self, latency_s: float = 0.0, reply: str = "This is a replayed response.", dimensions: int = 1536):
+        self.latency_s = latency_s
+        self.reply = reply
+        self.dimensions = dimensions
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.embeddings = SimpleNamespace(create=self._embeddings_create)
+
+    def _wait(self) -> None:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        _count("llm")
+
+    def _chat_create(self, stream: bool = False, **kwargs):
+        self._wait()
+        if not stream:
+            message = SimpleNamespace(role="assistant", content=self.reply, tool_calls=None)
+            return SimpleNamespace(id=f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                                   choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+        def chunks():
+            for word in self.reply.split(" "):
+                delta = SimpleNamespace(role="assistant", content=word + " ", tool_calls=None)
+                yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(
+                role=None, content=None, tool_calls=None), finish_reason="stop")])
+        return chunks()
+
+    def _embeddings_create(self, input=None, **kwargs):
+        self._wait()
+        inputs = input if isinstance(input, list) else [input]
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[0.0] * self.dimensions)
+                                     for i in range(len(inputs))])
+
+
+# ------------------------------
+# Installing the stand-ins
+# ------------------------------
+_SUPABASE_ATTRS = ("supabase",)
+_OPENAI_ATTRS = ("client_openai", "openai_client")
+
+
+def install_fakes(db: FakeSupabase, llm: Optional[FakeOpenAI] = None) -> List[tuple]:
+    """
+    Points every loaded app.* module's Supabase/OpenAI client globals at the stand-ins.
+    Modules bind the client at import (`from app.api.supabase_db import supabase`), so
+    each module attribute is patched. Returns the originals for restore_fakes().
+    """
+    patched = []
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app.") or not isinstance(module, ModuleType):
+            continue
+        for attr in _SUPABASE_ATTRS:
+            if attr in vars(module) and not isinstance(vars(module)[attr], ModuleType):
+                patched.append((module, attr, vars(module)[attr]))
+                setattr(module, attr, db)
+        if llm is not None:
+            for attr in _OPENAI_ATTRS:
+                if attr in vars(module):
+                    patched.append((module, attr, vars(module)[attr]))
+                    setattr(module, attr, llm)
+    return patched
+
+
+def restore_fakes(patched: List[tuple]) -> None:
+    for module, attr, original in reversed(patched):
+        setattr(module, attr, original)
+
+
+# ------------------------------
+# Event streams
+# ------------------------------
+def _user_block(email: str) -> Dict[str, Any]:
+    return {"metadata": {"data": {"user": {"email": email, "username": email.split("@")[0]}}}}
+
+
+def _call_block(call_id: str, email: str, status: str = "in-progress") -> Dict[str, Any]:
+    return {
+        "id": call_id,
+        "type": "webCall",
+        "status": status,
+        "monitor": {"controlUrl": f"http://127.0.0.1:9/{call_id}/control"},
+        "assistantOverrides": _user_block(email),
+    }
+
+
+def synthesize_call_events(call_id: str, email: str, turns: int = 4) -> List[Dict[str, Any]]:
+    """A plausible call: status, per-turn speech/conversation updates, end-of-call report."""
+    now_ms = int(time.time() * 1000)
+    events: List[Dict[str, Any]] = [
+        {"type": "status-update", "status": "in-progress", "timestamp": now_ms, "call": _call_block(call_id, email)}
+    ]
+    conversation: List[Dict[str, Any]] = [{"role": "system", "content": "You are a reading companion."}]
+    transcript_lines = []
+    for turn in range(turns):
+        user_text = f"Turn {turn}: what does the chapter say about habit stacking?"
+        agent_text = f"Turn {turn}: habit stacking pairs a new habit with one you already do."
+        conversation += [{"role": "user", "content": user_text}, {"role": "assistant", "content": agent_text}]
+        transcript_lines += [f"User: {user_text}", f"AI: {agent_text}"]
+        for role in ("user", "assistant"):
+            for status in ("started", "stopped"):
+                events.append({"type": "speech-update", "status": status, "role": role, "turn": turn,
+                               "timestamp": now_ms, "call": _call_block(call_id, email)})
+        events.append({"type": "conversation-update", "timestamp": now_ms,
+                       "conversation": copy.deepcopy(conversation),
+                       "messages": [{"role": m["role"], "message": m["content"]} for m in conversation],
+                       "call": _call_block(call_id, email)})
+    transcript = "\n".join(transcript_lines)
+    events.append({
+        "type": "end-of-call-report", "timestamp": now_ms, "endedReason": "customer-ended-call",
+        "summary": f"Discussed habit stacking over {turns} turns.", "transcript": transcript,
+        "artifact": {"transcript": transcript,
+                     "messages": [{"role": "bot" if m["role"] == "assistant" else m["role"], "message": m["content"]}
+                                  for m in conversation],
+                     "recordingUrl": f"https://example.invalid/{call_id}.wav"},
+        "call": _call_block(call_id, email, status="ended"),
+    })
+    events.append({"type": "status-update", "status": "ended", "timestamp": now_ms,
+                   "call": _call_block(call_id, email, status="ended")})
+    return events
+
+
+def _parse_events(text: str) -> List[Dict[str, Any]]:
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+        items = data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    events = []
+    for item in items:
+        if isinstance(item, dict):
+            event = item.get("message", item) if isinstance(item.get("message"), dict) else item
+            if event.get("type"):
+                events.append(event)
+    return events
+
+
+def load_recorded_events(path: str) -> List[Dict[str, Any]]:
+    """Loads events from a file or every file in a directory (sorted by name)."""
+    source = Path(path)
+    files = sorted(p for p in source.iterdir() if p.is_file()) if source.is_dir() else [source]
+    events: List[Dict[str, Any]] = []
+    for file in files:
+        try:
+            events.extend(_parse_events(file.read_text(encoding="utf-8", errors="replace")))
+        except OSError:
+            continue
+    events.sort(key=lambda e: e.get("timestamp") or 0)
+    return events
+
+
+def retarget_events(events: List[Dict[str, Any]], call_id: str, email: str) -> List[Dict[str, Any]]:
+    """Copies recorded events onto a virtual call: new call id, caller email and control URL."""
+    retargeted = []
+    for event in events:
+        event = copy.deepcopy(event)
+        call = event.setdefault("call", {})
+        call["id"] = call_id
+        call.setdefault("monitor", {})["controlUrl"] = f"http://127.0.0.1:9/{call_id}/control"
+        overrides = call.setdefault("assistantOverrides", {}) or {}
+        call["assistantOverrides"] = overrides
+        overrides.setdefault("metadata", {}).setdefault("data", {}).setdefault("user", {})["email"] = email
+        retargeted.append(event)
+    return retargeted
+
+
+# ------------------------------
+# Replay
+# ------------------------------
+@dataclass
+class EventSample:
+    event_type: str
+    latency_s: float
+    status_code: int
+    db_calls: int
+    db_time_s: float
+    llm_calls: int
+
+
+@dataclass
+class ReplayReport:
+    calls: int
+    concurrency: int
+    wall_clock_s: float
+    samples: List[EventSample] = field(default_factory=list)
+    db_calls_by_table: Dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], pct: float) -> float:
+        if not sorted_values:
+            return 0.0
+        # Nearest-rank percentile
+        index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+        return sorted_values[index]
+
+    def by_event_type(self) -> Dict[str, Dict[str, Any]]:
+        grouped: Dict[str, List[EventSample]] = {}
+        for sample in self.samples:
+            grouped.setdefault(sample.event_type, []).append(sample)
+        summary = {}
+        for event_type, samples in sorted(grouped.items()):
+            latencies = sorted(s.latency_s for s in samples)
+            summary[event_type] = {
+                "count": len(samples),
+                "errors": sum(1 for s in samples if s.status_code >= 400),
+                "p50_ms": round(self._percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(self._percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(self._percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+                "db_calls_per_event": round(sum(s.db_calls for s in samples) / len(samples), 2),
+                "db_time_share": round(sum(s.db_time_s for s in samples) / max(sum(latencies), 1e-9), 3),
+                "llm_calls_per_event": round(sum(s.llm_calls for s in samples) / len(samples), 2),
+            }
+        return summary
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "concurrency": self.concurrency,
+            "events": len(self.samples),
+            "wall_clock_s": round(self.wall_clock_s, 3),
+            "events_per_s": round(len(self.samples) / self.wall_clock_s, 1) if self.wall_clock_s else 0.0,
+            "by_event_type": self.by_event_type(),
+            "db_calls_by_table": dict(sorted(self.db_calls_by_table.items())),
+        }
+
+    def format_table(self) -> str:
+        header = f"{'event type':<22}{'n':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db/evt':>8}{'db %':>7}"
+        lines = [header, "-" * len(header)]
+        for event_type, row in self.by_event_type().items():
+            lines.append(f"{event_type:<22}{row['count']:>7}{row['errors']:>5}{row['p50_ms']:>10.1f}"
+                         f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['db_calls_per_event']:>8.2f}"
+                         f"{row['db_time_share'] * 100:>6.0f}%")
+        d = self.as_dict()
+        lines.append(f"\n{d['events']} events from {self.calls} calls in {d['wall_clock_s']}s "
+                     f"({d['events_per_s']} events/s, concurrency {self.concurrency})")
+        return "\n".join(lines)
+
+
+def build_app():
+    """A minimal Flask app with only the webhook blueprint (no Redis, no JWT)."""
+    from flask import Flask
+    from app.api.webhook import webhook as webhook_blueprint
+
+    app = Flask("webhook_replay")
+    app.config.update(TESTING=True, CACHE_TYPE="SimpleCache", CACHE_DEFAULT_TIMEOUT=300)
+    try:
+        from flask_caching import Cache
+        Cache(app)
+    except ImportError:
+        pass
+    app.register_blueprint(webhook_blueprint, url_prefix="/api/webhook")
+    return app
+
+
+def replay(call_streams: List[List[Dict[str, Any]]], db: FakeSupabase, llm: Optional[FakeOpenAI] = None,
+           concurrency: int = 16, app=None, wrap_in_message: bool = True) -> ReplayReport:
+    """
+    Sends each stream's events in order to POST /api/webhook/; streams run concurrently
+    on `concurrency` worker threads.
+    """
+    app = app or build_app()
+    patched = install_fakes(db, llm)
+    samples: List[EventSample] = []
+    samples_lock = threading.Lock()
+
+    def run_call(events: List[Dict[str, Any]]):
+        client = app.test_client()
+        local = []
+        for event in events:
+            counter = _CallCounter()
+            token = _current_counter.set(counter)
+            start = time.perf_counter()
+            try:
+                response = client.post("/api/webhook/", json={"message": event} if wrap_in_message else event)
+                status_code = response.status_code
+            except Exception:
+                status_code = 599
+            finally:
+                elapsed = time.perf_counter() - start
+                _current_counter.reset(token)
+            local.append(EventSample(event.get("type", "unknown"), elapsed, status_code,
+                                     counter.db_calls, counter.db_time_s, counter.llm_calls))
+        with samples_lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="webhook-replay") as pool:
+            list(pool.map(run_call, call_streams))
+    finally:
+        restore_fakes(patched)
+    report = ReplayReport(calls=len(call_streams), concurrency=concurrency,
+                          wall_clock_s=time.perf_counter() - start, samples=samples)
+    report.db_calls_by_table = dict(db.calls_by_table)
+    return report
+
+
+def seed_users(db: FakeSupabase, emails: Iterable[str]) -> None:
+    db.seed("users", [{"user_id": str(uuid.uuid5(uuid.NAMESPACE_URL, email)), "email": email,
+                       "username": email.split("@")[0]} for email in emails])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay Vapi webhook events against the webhook blueprint")
+    parser.add_argument("--events", help="Recorded events: JSON/JSONL file or a directory of them. "
+                                         "Default: synthesized calls.")
+    parser.add_argument("--calls", type=int, default=20, help="Number of virtual calls")
+    parser.add_argument("--users", type=int, default=0, help="Distinct callers (default: one per call)")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per synthesized call")
+    parser.add_argument("--concurrency", type=int, default=16, help="Calls in flight at once")
+    parser.add_argument("--db-latency-ms", type=float, default=30.0, help="Latency per Supabase round trip")
+    parser.add_argument("--db-jitter-ms", type=float, default=10.0, help="Extra random latency per round trip")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latency per OpenAI call")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    users = args.users or args.calls
+    emails = [f"replay+{i}@example.com" for i in range(users)]
+    recorded = load_recorded_events(args.events) if args.events else None
+    if args.events and not recorded:
+        print(f"No events found in {args.events}", file=sys.stderr)
+        return 1
+
+    streams = []
+    for i, email in zip(range(args.calls), itertools.cycle(emails)):
+        call_id = str(uuid.UUID(int=random.getrandbits(128)))
+        streams.append(retarget_events(recorded, call_id, email) if recorded
+                       else synthesize_call_events(call_id, email, turns=args.turns))
+
+    db = FakeSupabase(latency_s=args.db_latency_ms / 1000.0, jitter_s=args.db_jitter_ms / 1000.0)
+    seed_users(db, emails)
+    llm = FakeOpenAI(latency_s=args.llm_latency_ms / 1000.0)
+    report = replay(streams, db, llm, concurrency=args.concurrency)
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report.format_table())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
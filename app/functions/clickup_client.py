@@ -0,0 +1,334 @@
+# app/functions/clickup_client.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+CLICKUP_API_KEY = os.environ.get("CLICKUP_API_KEY", "your_clickup_api_key")
+BASE_URL = os.environ.get("CLICKUP_BASE_URL", "https://api.clickup.com/api/v2")
+
+# ClickUp per-token limits (requests per minute) by workspace plan.
+PLAN_RATE_LIMITS_PER_MIN = {
+    "free": 100,
+    "unlimited": 100,
+    "business": 100,
+    "business_plus": 1000,
+    "enterprise": 10000,
+}
+CLICKUP_PLAN = os.environ.get("CLICKUP_PLAN", "business").lower()
+CLICKUP_RATE_LIMIT_PER_MIN = int(os.environ.get(
+    "CLICKUP_RATE_LIMIT_PER_MIN", PLAN_RATE_LIMITS_PER_MIN.get(CLICKUP_PLAN, 100)))
+CLICKUP_MAX_RETRIES = int(os.environ.get("CLICKUP_MAX_RETRIES", 5))
+BACKOFF_BASE_S = 0.5
+BACKOFF_CAP_S = 30.0
+IDEMPOTENCY_CACHE_SIZE = 2048
+# Completed creates are only remembered long enough to cover retries of the same operation;
+# a later identical create (e.g. the same habit scheduled again) is a new object.
+IDEMPOTENCY_TTL_S = float(os.environ.get("CLICKUP_IDEMPOTENCY_TTL_S", 120))
+
+
+class ClickUpAPIError(Exception):
+    """Non-retryable (or retries exhausted) ClickUp API failure."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# One bucket per API token, shared by every client in the process.
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket_for(api_key: str) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(api_key)
+        if bucket is None:
+            rate_per_s = CLICKUP_RATE_LIMIT_PER_MIN / 60.0
+            # A small burst allowance; the server-side window is per minute.
+            bucket = _buckets[api_key] = TokenBucket(rate_per_s, capacity=max(1.0, min(10.0, rate_per_s * 6)))
+    return bucket
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait from Retry-After (delta or HTTP date) or X-RateLimit-Reset (epoch seconds)."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = response.headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+def idempotency_key(method: str, path: str, payload: Optional[Dict[str, Any]]) -> str:
+    body = json.dumps(payload or {}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{method} {path} {body}".encode("utf-8")).hexdigest()
+
+
+class ClickUpClient:
+    """
+    Rate-limit-aware ClickUp API client (async + sync).
+
+    - A client-side token bucket keeps us under the plan's per-token limit.
+    - 429s honour Retry-After / X-RateLimit-Reset plus jitter, and pause every
+      request sharing the token, not just the one that was rejected.
+    - Creates are idempotent: a completed create is remembered for IDEMPOTENCY_TTL_S
+      by an idempotency key, and after an ambiguous failure (timeout, 5xx) we look for the object
+      by name before re-POSTing, so a retry does not create a duplicate.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: int = 10, max_retries: Optional[int] = None):
+        self.api_key = api_key or CLICKUP_API_KEY
+        self.base_url = (base_url or BASE_URL).rstrip("/")
+        self.max_retries = CLICKUP_MAX_RETRIES if max_retries is None else max_retries
+        self.bucket = _bucket_for(self.api_key)
+        self._headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._completed: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, data)
+        self._completed_lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0, "deduplicated": 0}
+
+    # --- Lifecycle ---
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.aclose()
+        self._async_client = self._async_loop = None
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # httpx pools are bound to the loop that opened them; Flask runs each view in its own loop
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(headers=self._headers, limits=self._limits, timeout=30.0)
+            self._async_loop = loop
+            loop.create_task(self._close_with_loop(self._async_client))
+        return self._async_client
+
+    async def _close_with_loop(self, client: httpx.AsyncClient) -> None:
+        # Parked until the loop shuts down (asyncio.run cancels pending tasks), then closes the
+        # pool on its own loop so a per-view loop doesn't leave its connections open
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if self._async_client is client:
+                self._async_client = self._async_loop = None
+            await client.aclose()
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    # --- Idempotency cache ---
+    def _remember(self, key: Optional[str], data: Dict[str, Any]) -> None:
+        if not key:
+            return
+        with self._completed_lock:
+            self._completed[key] = (time.monotonic() + IDEMPOTENCY_TTL_S, data)
+            self._completed.move_to_end(key)
+            while len(self._completed) > IDEMPOTENCY_CACHE_SIZE:
+                self._completed.popitem(last=False)
+
+    def _recall(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not key:
+            return None
+        with self._completed_lock:
+            entry = self._completed.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._completed[key]
+                return None
+            return entry[1]
+
+    # --- Retry policy shared by async and sync paths ---
+    def _classify(self, response: httpx.Response, attempt: int, path: str):
+        """Returns ('ok', data) | ('retry', delay, ambiguous) | raises ClickUpAPIError."""
+        if 200 <= response.status_code < 300:
+            return ("ok", response.json() if response.text else {})
+        if response.status_code == 429:
+            self.stats["rate_limited"] += 1
+            wait = retry_after_seconds(response)
+            delay = (wait if wait is not None else _backoff(attempt)) + random.uniform(0, 0.5)
+            self.bucket.penalize(delay)
+            logger.warning(f"ClickUp 429 on {path}; retrying in {delay:.2f}s (attempt {attempt + 1}).")
+            return ("retry", delay, False)
+        if response.status_code >= 500:
+            return ("retry", _backoff(attempt), True)
+        raise ClickUpAPIError(f"ClickUp {response.status_code} on {path}: {response.text}", response.status_code)
+
+    async def request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                      params: Optional[Dict[str, Any]] = None,
+                      find_existing: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None,
+                      idempotent_create: bool = False) -> Dict[str, Any]:
+        key = idempotency_key(method, path, payload) if idempotent_create else None
+        cached = self._recall(key)
+        if cached is not None:
+            self.stats["deduplicated"] += 1
+            return cached
+        client = self._get_async_client()
+
+        ambiguous = False
+        for attempt in range(self.max_retries + 1):
+            if ambiguous and find_existing is not None:
+                existing = await find_existing()
+                if existing:
+                    logger.info(f"ClickUp create on {path} had already succeeded; reusing {existing.get('id')}.")
+                    self.stats["deduplicated"] += 1
+                    self._remember(key, existing)
+                    return existing
+            await self.bucket.acquire_async()
+            self.stats["requests"] += 1
+            try:
+                response = await client.request(method, f"{self.base_url}{path}", json=payload, params=params)
+            except httpx.TransportError as e:
+                outcome = ("retry", _backoff(attempt), True)
+                logger.warning(f"ClickUp transport error on {path}: {e}")
+            else:
+                outcome = self._classify(response, attempt, path)
+            if outcome[0] == "ok":
+                self._remember(key, outcome[1])
+                return outcome[1]
+            ambiguous = ambiguous or outcome[2]
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(outcome[1])
+        raise ClickUpAPIError(f"ClickUp {method} {path} failed after {self.max_retries + 1} attempts.")
+
+    def request_sync(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                     params: Optional[Dict[str, Any]] = None,
+                     find_existing: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+                     idempotent_create: bool = False) -> Dict[str, Any]:
+        key = idempotency_key(method, path, payload) if idempotent_create else None
+        cached = self._recall(key)
+        if cached is not None:
+            self.stats["deduplicated"] += 1
+            return cached
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(headers=self._headers, limits=self._limits, timeout=30.0)
+
+        ambiguous = False
+        for attempt in range(self.max_retries + 1):
+            if ambiguous and find_existing is not None:
+                existing = find_existing()
+                if existing:
+                    self.stats["deduplicated"] += 1
+                    self._remember(key, existing)
+                    return existing
+            self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = self._sync_client.request(method, f"{self.base_url}{path}", json=payload, params=params)
+            except httpx.TransportError as e:
+                outcome = ("retry", _backoff(attempt), True)
+                logger.warning(f"ClickUp transport error on {path}: {e}")
+            else:
+                outcome = self._classify(response, attempt, path)
+            if outcome[0] == "ok":
+                self._remember(key, outcome[1])
+                return outcome[1]
+            ambiguous = ambiguous or outcome[2]
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                time.sleep(outcome[1])
+        raise ClickUpAPIError(f"ClickUp {method} {path} failed after {self.max_retries + 1} attempts.")
+
+    # --- Lookups used to de-duplicate retried creates ---
+    @staticmethod
+    def _match(items, name: str, parent: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        for item in items or []:
+            if item.get("name") == name and (parent is None or item.get("parent") == parent):
+                return item
+        return None
+
+    # --- Async endpoints ---
+    async def create_folder(self, space_id: str, name: str) -> str:
+        async def find():
+            data = await self.request("GET", f"/space/{space_id}/folder")
+            return self._match(data.get("folders"), name)
+        data = await self.request("POST", f"/space/{space_id}/folder", {"name": name},
+                                  find_existing=find, idempotent_create=True)
+        return data.get("id")
+
+    async def create_list(self, folder_id: str, name: str) -> str:
+        async def find():
+            data = await self.request("GET", f"/folder/{folder_id}/list")
+            return self._match(data.get("lists"), name)
+        data = await self.request("POST", f"/folder/{folder_id}/list", {"name": name},
+                                  find_existing=find, idempotent_create=True)
+        return data.get("id")
+
+    async def create_task(self, list_id: str, payload: Dict[str, Any]) -> str:
+        async def find():
+            data = await self.request("GET", f"/list/{list_id}/task", params={"subtasks": "true"})
+            return self._match(data.get("tasks"), payload.get("name"), payload.get("parent"))
+        data = await self.request("POST", f"/list/{list_id}/task", payload,
+                                  find_existing=find, idempotent_create=True)
+        return data.get("id")
+
+    async def set_dependency(self, task_id: str, depends_on_id: str) -> None:
+        await self.request("POST", f"/task/{task_id}/dependency", {"depends_on": depends_on_id},
+                           idempotent_create=True)
+
+    # --- Sync endpoints ---
+    def create_folder_sync(self, space_id: str, name: str) -> str:
+        def find():
+            return self._match(self.request_sync("GET", f"/space/{space_id}/folder").get("folders"), name)
+        return self.request_sync("POST", f"/space/{space_id}/folder", {"name": name},
+                                 find_existing=find, idempotent_create=True).get("id")
+
+    def create_list_sync(self, folder_id: str, name: str) -> str:
+        def find():
+            return self._match(self.request_sync("GET", f"/folder/{folder_id}/list").get("lists"), name)
+        return self.request_sync("POST", f"/folder/{folder_id}/list", {"name": name},
+                                 find_existing=find, idempotent_create=True).get("id")
+
+    def create_task_sync(self, list_id: str, payload: Dict[str, Any]) -> str:
+        def find():
+            tasks = self.request_sync("GET", f"/list/{list_id}/task", params={"subtasks": "true"}).get("tasks")
+            return self._match(tasks, payload.get("name"), payload.get("parent"))
+        return self.request_sync("POST", f"/list/{list_id}/task", payload,
+                                 find_existing=find, idempotent_create=True).get("id")
+
+    def set_dependency_sync(self, task_id: str, depends_on_id: str) -> None:
+        self.request_sync("POST", f"/task/{task_id}/dependency", {"depends_on": depends_on_id},
+                          idempotent_create=True)
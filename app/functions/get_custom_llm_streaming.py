@@ -2,18 +2,36 @@
 
 import uuid
 import json
+import time
+import queue
 import logging
+import threading
 from flask import Response
 from dotenv import load_dotenv
 import openai
 import os
 
+from app.services.metrics import get_counter
+from app.services.memory_diagnostics import register_memory_report, http_client_size
+
 load_dotenv()
 
 # Set OpenAI API key and initialize clients.
 openai.api_key = os.getenv("OPENAI_API_KEY")
 client_openai = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 logger = logging.getLogger(__name__)
+register_memory_report("llm_streaming.client_openai", lambda: http_client_size(client_openai._client))
+
+# --- SSE re-chunking for TTS ---
+# Vapi's TTS waits for a punctuation boundary (inputPunctuationBoundaries / inputMinCharacters)
+# before speaking, so single-token frames buy nothing. Content deltas are buffered and sent as
+# one frame per boundary, or when the oldest buffered text is SSE_RECHUNK_MAX_DELAY_MS old.
+# Tool-call, finish and other non-text chunks flush the buffer and pass through unchanged.
+# The llm.ttft stage is measured to the first frame written, so it includes this buffering.
+SSE_RECHUNK_ENABLED = os.getenv("SSE_RECHUNK_ENABLED", "true").lower() in ("1", "true", "yes")
+SSE_RECHUNK_BOUNDARIES = tuple(os.getenv("SSE_RECHUNK_BOUNDARIES", ". ! ? , ; : )").split())
+SSE_RECHUNK_MIN_CHARS = int(os.getenv("SSE_RECHUNK_MIN_CHARS", 10))
+SSE_RECHUNK_MAX_DELAY_S = float(os.getenv("SSE_RECHUNK_MAX_DELAY_MS", 150)) / 1000
 
 
 def generate_user_uuid(user_id):
@@ -27,12 +45,139 @@ def generate_user_uuid(user_id):
 
 
 def generate_streaming_response(data):
+    if SSE_RECHUNK_ENABLED:
+        data = rechunk_for_tts(data)
     for message in data:
         json_data = message.model_dump_json()
         # logger.info(f"JSON data: {json.dumps(json_data, indent=2)}")
         yield f"data: {json_data}\n\n"
 
 
+def _text_delta(chunk):
+    """The content of a plain text delta chunk, or None for anything else (tool calls, finish, usage)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices or len(choices) != 1:
+        return None
+    choice = choices[0]
+    delta = choice.delta
+    if choice.finish_reason is not None or delta is None or delta.tool_calls or getattr(delta, "function_call", None):
+        return None
+    return delta.content if isinstance(delta.content, str) else None
+
+
+def _boundary_cut(text: str) -> int:
+    """
+    Length of the longest prefix of `text` that ends on a boundary followed by whitespace and is
+    long enough to send. A boundary at the very end isn't final yet ("3." may continue as "3.14",
+    "e.g." as "e.g.,"); it goes out with the next delta, the max-delay flush or the stream end.
+    """
+    for end in range(len(text) - 1, SSE_RECHUNK_MIN_CHARS - 1, -1):
+        if text[end].isspace() and text[:end].endswith(SSE_RECHUNK_BOUNDARIES):
+            return end
+    return 0
+
+
+_STREAM_END = object()
+
+
+def _pump(chunks, out: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                break
+            out.put(chunk)
+    except BaseException as e:
+        out.put(e)
+    finally:
+        if stop.is_set() and hasattr(chunks, "close"):
+            chunks.close()  # The client went away; stop reading the completion
+        out.put(_STREAM_END)
+
+
+def rechunk_for_tts(chunks):
+    """
+    Merges consecutive text deltas of an OpenAI chunk stream into boundary-aligned chunks.
+    The upstream is read on a helper thread so buffered text is sent after at most
+    SSE_RECHUNK_MAX_DELAY_S even while the model is slow to produce the next token.
+    """
+    upstream: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    threading.Thread(target=_pump, args=(chunks, upstream, stop), name="sse-rechunk", daemon=True).start()
+
+    template, text, oldest, received, emitted = None, "", 0.0, 0, 0
+
+    def merged(content: str):
+        chunk = template.model_copy(deep=True)
+        chunk.choices[0].delta.content = content
+        return chunk
+
+    try:
+        while True:
+            timeout = None if template is None else max(0.0, oldest + SSE_RECHUNK_MAX_DELAY_S - time.monotonic())
+            try:
+                item = upstream.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # Max delay reached; send what is buffered
+            if item is None or item is _STREAM_END or isinstance(item, BaseException) or _text_delta(item) is None:
+                if template is not None:
+                    yield merged(text)
+                    emitted += 1
+                    template, text = None, ""
+                if item is None:
+                    continue
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                received += 1
+                emitted += 1
+                yield item  # Tool-call / finish / usage chunks stay intact
+                continue
+
+            received += 1
+            if template is None:
+                template, oldest = item, time.monotonic()
+            text += _text_delta(item)
+            cut = _boundary_cut(text)
+            if cut:
+                yield merged(text[:cut])
+                emitted += 1
+                text = text[cut:]
+                if text:
+                    template, oldest = item, time.monotonic()
+                else:
+                    template = None
+    finally:
+        stop.set()
+        get_counter("sse_chunks_total", {"stage": "upstream"}).inc(received)
+        get_counter("sse_chunks_total", {"stage": "emitted"}).inc(emitted)
+
+
+def build_text_chunk(content: str, model: str, chunk_id: str = None, finish_reason: str = None) -> dict:
+    """
+    A chat.completion.chunk carrying `content`, shaped like the OpenAI stream chunks
+    generate_streaming_response forwards, for text the server produces itself.
+    """
+    return {
+        "id": chunk_id or f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": content} if content else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+
+
+def generate_streaming_text(text: str, model: str):
+    """Streams `text` as a complete reply: one content chunk, then a stop chunk."""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    yield f"data: {json.dumps(build_text_chunk(text, model, chunk_id))}\n\n"
+    yield f"data: {json.dumps(build_text_chunk('', model, chunk_id, finish_reason='stop'))}\n\n"
+
+
 # def generate_streaming_response(chat_completion_stream) -> str:
 #     """
 #     Convert the streaming response from the LLM into a Server-Sent Events (SSE)
@@ -1,10 +1,13 @@
 import os
 import json
-import requests
+import asyncio
 from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from pydantic import ValidationError
 
+from app.functions.clickup_client import ClickUpClient
+from app.functions.schedule_materializer import MaterializationReport, materialize_schedule
+
 
 
 
@@ -15,7 +18,8 @@ import instructor
 
 # ClickUp API Configuration
 CLICKUP_API_KEY = os.environ.get("CLICKUP_API_KEY", "your_clickup_api_key")
-BASE_URL = "https://api.clickup.com/api/v2"
+# CLICKUP_BASE_URL lets tests point at a local stand-in server (app/devtools/clickup_stub.py)
+BASE_URL = os.environ.get("CLICKUP_BASE_URL", "https://api.clickup.com/api/v2")
 
 
 
@@ -60,11 +64,15 @@ class Schedule(BaseModel):
 
 
 
-def _headers():
-   return {
-       "Authorization": CLICKUP_API_KEY,
-       "Content-Type": "application/json"
-   }
+_client = None
+
+
+def _get_client() -> ClickUpClient:
+   # Shared so every call goes through the same rate limiter and idempotency cache
+   global _client
+   if _client is None:
+       _client = ClickUpClient(CLICKUP_API_KEY, BASE_URL)
+   return _client
 
 
 
@@ -139,94 +147,37 @@ def generate_schedule(prompt: str) -> Schedule:
 
 
 def create_folder(space_id: str, folder_name: str) -> str:
-   url = f"{BASE_URL}/space/{space_id}/folder"
-   payload = {"name": folder_name}
-   resp = requests.post(url, json=payload, headers=_headers())
-   if resp.status_code == 200:
-       return resp.json().get("id")
-   else:
-       raise Exception(f"Error creating folder '{folder_name}': {resp.status_code} - {resp.text}")
+   return _get_client().create_folder_sync(space_id, folder_name)
 
 
 
 
 def create_list(folder_id: str, list_name: str) -> str:
-   url = f"{BASE_URL}/folder/{folder_id}/list"
-   payload = {"name": list_name}
-   resp = requests.post(url, json=payload, headers=_headers())
-   if resp.status_code == 200:
-       return resp.json().get("id")
-   else:
-       raise Exception(f"Error creating list '{list_name}': {resp.status_code} - {resp.text}")
+   return _get_client().create_list_sync(folder_id, list_name)
 
 
 
 
 def create_task(list_id: str, task: Task) -> str:
-   url = f"{BASE_URL}/list/{list_id}/task"
-   payload = task.dict(exclude_unset=True)
-   resp = requests.post(url, json=payload, headers=_headers())
-   if resp.status_code == 200:
-       return resp.json().get("id")
-   else:
-       raise Exception(f"Error creating task '{task.name}': {resp.status_code} - {resp.text}")
+   return _get_client().create_task_sync(list_id, task.model_dump(exclude_unset=True, exclude={"subtasks", "depends_on"}))
 
 
 
 
 def set_dependency(task_id: str, depends_on_id: str):
-   url = f"{BASE_URL}/task/{task_id}/dependency"
-   payload = {"depends_on": depends_on_id}
-   resp = requests.post(url, json=payload, headers=_headers())
-   if resp.status_code != 200:
-       raise Exception(f"Error setting dependency for task {task_id} on {depends_on_id}: {resp.status_code} - {resp.text}")
+   _get_client().set_dependency_sync(task_id, depends_on_id)
 
 
 
 
-def process_schedule(space_id: str, schedule: Schedule):
+def process_schedule(space_id: str, schedule: Schedule, max_concurrency: Optional[int] = None) -> MaterializationReport:
    """
    Creates a ClickUp schedule from the validated Schedule object.
-   1) Create a folder
-   2) Create lists, tasks, and subtasks
-   3) Set dependencies if required
+   The folder, lists, tasks, subtasks and dependencies form a dependency graph;
+   independent items are created concurrently through one pooled client
+   (see app/functions/schedule_materializer.py). Returns the timing report.
    """
-
-
-   folder_id = create_folder(space_id, schedule.schedule_name)
-   name_to_id_map = {}
-
-
-   for task_list in schedule.lists:
-       list_id = create_list(folder_id, task_list.list_name)
-
-
-       for task in task_list.tasks:
-           task_id = create_task(list_id, task)
-           name_to_id_map[task.name] = task_id
-
-
-           for subtask in task.subtasks:
-               subtask_id = create_task(list_id, subtask)
-               name_to_id_map[subtask.name] = subtask_id
-
-
-   # Second pass to set dependencies
-   for task_list in schedule.lists:
-       for task in task_list.tasks:
-           current_task_id = name_to_id_map[task.name]
-           if task.depends_on:
-               for dep_name in task.depends_on:
-                   if dep_name in name_to_id_map:
-                       set_dependency(current_task_id, name_to_id_map[dep_name])
-
-
-           for subtask in task.subtasks:
-               current_subtask_id = name_to_id_map[subtask.name]
-               if subtask.depends_on:
-                   for dep_name in subtask.depends_on:
-                       if dep_name in name_to_id_map:
-                           set_dependency(current_subtask_id, name_to_id_map[dep_name])
+   return asyncio.run(materialize_schedule(space_id, schedule, max_concurrency=max_concurrency))
 
 
 def transform_llm_output(llm_output):
@@ -251,6 +202,6 @@ if __name__ == "__main__":
 
    space_id = "your_clickup_space_id"
    print("\nCreating schedule in ClickUp...")
-   process_schedule(space_id, generated_schedule)
-   print("Done!")
+   report = process_schedule(space_id, generated_schedule)
+   print(f"Done! {report.as_dict()}")
 
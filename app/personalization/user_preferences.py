@@ -1,12 +1,22 @@
 # app/personalization/user_preferences.py
 
 import os
+import json
 import logging
 import hashlib # For SHA256 hashing
+import functools
 from typing import Dict, Optional, List, Any
+from datetime import datetime, timezone
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from app.api.supabase_db import (
+    PREFERENCE_DEFAULTS,
+    instrument_supabase_client,
+    get_user_preferences as get_user_preferences_from_db
+)
+from app.services import session_history
+
 load_dotenv()
 
 # Initialize Supabase client
@@ -19,6 +29,7 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 else:
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        instrument_supabase_client(supabase)
         logging.info("Supabase client initialized successfully.")
     except Exception as e:
         logging.error(f"Failed to initialize Supabase client: {e}")
@@ -102,6 +113,9 @@ def get_or_create_voice_session(call_uuid: str, user_id: str, book_id: Optional[
             elif not insert_response.data:
                  logging.warning(f"Supabase session insert for {session_id_hash} did not return data.")
                  # Decide if this is an error, but likely okay if no error attribute.
+            if not (hasattr(insert_response, 'error') and insert_response.error):
+                # Brand-new session: its (empty) interaction history is complete
+                session_history.mark_new_session(session_id_hash)
 
         # Session exists (either found or just created)
         return session_id_hash
@@ -143,6 +157,10 @@ def store_voice_interaction(session_id: str, user_id: str, interaction_type: str
             logging.warning(f"Supabase interaction insert for session (hash) {session_id[:8]}... did not return data.")
             # return False # Decide if error
 
+        # Write-through so get_llm_context_from_session doesn't read back what we just wrote
+        stored_row = response.data[0] if response.data else dict(interaction_data)
+        stored_row.setdefault("timestamp", datetime.now(timezone.utc).isoformat())
+        session_history.record_interaction(session_id, stored_row)
         return True
     except Exception as e:
         logging.error(f"Exception storing voice interaction for session (hash) {session_id[:8]}...: {e}")
@@ -177,41 +195,74 @@ def update_session_end_time(session_id: str) -> bool:
         return False
 
 
+SESSION_ARTIFACT_KINDS = ("transcript", "messages")
+
+
+def get_session_artifact_pointer(session_id: str, user_id: str, kind: str) -> Optional[str]:
+    """
+    Returns the artifact id (sha256) stored on a session for `kind` ('transcript' or
+    'messages'), only if the session belongs to `user_id`.
+    """
+    if not supabase: logging.error("get_session_artifact_pointer: Supabase client not initialized."); return None
+    if not session_id or not user_id or kind not in SESSION_ARTIFACT_KINDS: return None
+
+    column = f"{kind}_artifact"
+    try:
+        response = supabase.table("voice_agent_sessions") \
+                           .select(f"user_id, {column}") \
+                           .eq("session_id", session_id) \
+                           .eq("user_id", user_id) \
+                           .limit(1) \
+                           .execute()
+        if hasattr(response, 'error') and response.error:
+            logging.error(f"Supabase error reading artifact pointer for session (hash) {session_id[:8]}...: {response.error}")
+            return None
+        return response.data[0].get(column) if response.data else None
+    except Exception as e:
+        logging.error(f"Exception reading artifact pointer for session (hash) {session_id[:8]}...: {e}")
+        return None
+
+
+def _fetch_recent_interactions(session_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Newest `limit` voice_interactions rows of a session from Supabase, oldest first."""
+    if not supabase: raise RuntimeError("Supabase client not initialized.")
+    logging.debug(f"Fetching context for session (hash) {session_id[:8]}... from Supabase")
+    response = supabase.table("voice_interactions") \
+                       .select("interaction_type, user_speech, agent_response, timestamp") \
+                       .eq("session_id", session_id) \
+                       .order("timestamp", desc=True) \
+                       .limit(limit) \
+                       .execute()
+    if hasattr(response, 'error') and response.error:
+        raise RuntimeError(f"Supabase error fetching interactions: {response.error}")
+    return list(reversed(response.data or []))
+
+
 def get_llm_context_from_session(session_id: str, max_turns: int = 5) -> str:
     """
     Retrieve recent interactions using the session hash string ID.
+    Served from the write-through session history; Supabase is only read on a cold miss.
     """
-    # Input validation and Supabase client check remain the same...
-    if not supabase: logging.error("get_llm_context_from_session: Supabase client not initialized."); return "Context unavailable."
     if not session_id: logging.warning("get_llm_context_from_session: Missing session_id hash."); return "Context unavailable."
 
     context_lines = []
     try:
         limit = max_turns * 2 + 2
-        logging.debug(f"Fetching context for session (hash) {session_id[:8]}...")
-        response = supabase.table("voice_interactions") \
-                           .select("interaction_type, user_speech, agent_response, timestamp") \
-                           .eq("session_id", session_id) \
-                           .order("timestamp", desc=True) \
-                           .limit(limit) \
-                           .execute()
-
-        # Processing logic remains the same...
-        if response.data:
-            interactions = sorted(response.data, key=lambda x: x.get('timestamp', ''))
-            user_turns_added = 0
-            for row in interactions:
-                if user_turns_added >= max_turns: break
-                # ... (rest of the logic to build context_lines) ...
-                interaction_type = row.get("interaction_type")
-                user_speech = row.get("user_speech")
-                agent_response = row.get("agent_response")
-                if interaction_type == 'user_utterance' and user_speech:
-                    context_lines.append(f"User: {user_speech}")
-                    user_turns_added += 1
-                elif interaction_type == 'agent_response' and agent_response:
-                    context_lines.append(f"Agent: {agent_response}")
-            while len(context_lines) > max_turns * 2 : context_lines.pop(0)
+        interactions = session_history.get_recent_interactions(
+            session_id, limit, lambda n: _fetch_recent_interactions(session_id, n))
+
+        user_turns_added = 0
+        for row in interactions:
+            if user_turns_added >= max_turns: break
+            interaction_type = row.get("interaction_type")
+            user_speech = row.get("user_speech")
+            agent_response = row.get("agent_response")
+            if interaction_type == 'user_utterance' and user_speech:
+                context_lines.append(f"User: {user_speech}")
+                user_turns_added += 1
+            elif interaction_type == 'agent_response' and agent_response:
+                context_lines.append(f"Agent: {agent_response}")
+        while len(context_lines) > max_turns * 2 : context_lines.pop(0)
 
         if context_lines:
             return "\n".join(context_lines)
@@ -223,95 +274,40 @@ def get_llm_context_from_session(session_id: str, max_turns: int = 5) -> str:
         logging.error(f"Error fetching LLM context for session (hash) {session_id[:8]}...: {e}")
         return "Error retrieving context."
 
+# --- System Prompt ---
+BASE_SYSTEM_PROMPT = (
+    "You are a helpful assistant knowledgeable about Atomic Habits. "
+    "Tailor your responses based on the user's preferences and past conversation history provided below. "
+    "Avoid using special characters like #,*,&,^,%,$,! unless part of necessary code or examples."
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _system_prompt_for(prefs_json: str) -> str:
+    return f"{BASE_SYSTEM_PROMPT}\nUser Preferences: {prefs_json}"
+
+
+def build_personalized_system_prompt(preferences: Dict[str, Any]) -> str:
+    """
+    The chat system prompt with the user's preferences embedded. Memoized per distinct
+    preference set, so the login warm-up's build is reused by the first chat turn.
+    """
+    try:
+        prefs_json = json.dumps({k: str(v) for k, v in preferences.items()})
+    except TypeError:
+        logging.warning("Could not serialize user preferences to JSON. Using raw dict string.")
+        prefs_json = str(preferences)
+    return _system_prompt_for(prefs_json)
+
 # --- Existing Functions (Keep if needed) ---
-# def get_user_preferences(user_id: str) -> Dict[str, str]: ...
 def get_user_preferences(user_id: str) -> Dict[str, str]:
     """
-    Retrieve user preferences from the voice_agent_preferences and
-    cognitive_preferences tables in Supabase using the user's UUID string.
-
-    Args:
-        user_id: The UUID string of the user.
-
-    Returns:
-        A dictionary containing user preferences. Applies defaults if specific
-        preferences are not found in the database. Returns an empty dictionary
-        if the Supabase client is not available or a major error occurs.
+    Retrieve user preferences (voice agent + cognitive) using the user's UUID string.
+    Same loader as app.api.supabase_db.get_user_preferences, but never returns None:
+    defaults are returned if no user_id is given or the lookup fails.
     """
-    if not supabase:
-        logging.error("get_user_preferences: Supabase client not initialized.")
-        # Return default preferences dictionary directly if client fails
-        return {
-            "speaking_rate": "normal", "interaction_style": "friendly",
-            "explanation_detail_level": "standard", "discussion_depth": "moderate",
-            "learning_style": "visual", "reading_pace": "normal",
-            "preferred_complexity_level": "medium", "preferred_interaction_frequency": "regular"
-        }
     if not user_id:
         logging.warning("get_user_preferences: No user_id provided.")
-        # Return defaults if no user ID is given
-        return {
-            "speaking_rate": "normal", "interaction_style": "friendly",
-            "explanation_detail_level": "standard", "discussion_depth": "moderate",
-            "learning_style": "visual", "reading_pace": "normal",
-            "preferred_complexity_level": "medium", "preferred_interaction_frequency": "regular"
-        }
-
-    preferences: Dict[str, str] = {}
-    defaults = {
-        "speaking_rate": "normal",
-        "interaction_style": "friendly",
-        "explanation_detail_level": "standard",
-        "discussion_depth": "moderate",
-        "learning_style": "visual",
-        "reading_pace": "normal",
-        "preferred_complexity_level": "medium",
-        "preferred_interaction_frequency": "regular"
-    }
-
-    try:
-        # Query voice agent preferences.
-        logging.debug(f"Fetching voice agent preferences for user: {user_id}")
-        agent_response = supabase.table("voice_agent_preferences").select(
-            "speaking_rate, interaction_style, explanation_detail_level, discussion_depth"
-        ).eq("user_id", user_id).limit(1).execute()
-
-        if hasattr(agent_response, 'error') and agent_response.error:
-            logging.error(f"Supabase error fetching voice preferences for user {user_id}: {agent_response.error}")
-        elif agent_response.data:
-            row = agent_response.data[0]
-            preferences["speaking_rate"] = str(row.get("speaking_rate", defaults["speaking_rate"]))
-            preferences["interaction_style"] = str(row.get("interaction_style", defaults["interaction_style"]))
-            preferences["explanation_detail_level"] = str(row.get("explanation_detail_level", defaults["explanation_detail_level"]))
-            preferences["discussion_depth"] = str(row.get("discussion_depth", defaults["discussion_depth"]))
-        else:
-             logging.info(f"No voice agent preferences found for user: {user_id}. Defaults will be used for these.")
-
-        # Query cognitive preferences.
-        logging.debug(f"Fetching cognitive preferences for user: {user_id}")
-        cognitive_response = supabase.table("cognitive_preferences").select(
-            "learning_style, reading_pace, preferred_complexity_level, preferred_interaction_frequency"
-        ).eq("user_id", user_id).limit(1).execute()
-
-        if hasattr(cognitive_response, 'error') and cognitive_response.error:
-             logging.error(f"Supabase error fetching cognitive preferences for user {user_id}: {cognitive_response.error}")
-        elif cognitive_response.data:
-            row = cognitive_response.data[0]
-            preferences["learning_style"] = str(row.get("learning_style", defaults["learning_style"]))
-            preferences["reading_pace"] = str(row.get("reading_pace", defaults["reading_pace"]))
-            preferences["preferred_complexity_level"] = str(row.get("preferred_complexity_level", defaults["preferred_complexity_level"]))
-            preferences["preferred_interaction_frequency"] = str(row.get("preferred_interaction_frequency", defaults["preferred_interaction_frequency"]))
-        else:
-            logging.info(f"No cognitive preferences found for user: {user_id}. Defaults will be used for these.")
-
-    except Exception as e:
-        logging.error(f"Unexpected error fetching user preferences for user {user_id}: {e}", exc_info=True)
-        # In case of error, return defaults to avoid breaking downstream logic
-        return defaults
-
-    # Ensure all default keys are present using setdefault
-    for key, value in defaults.items():
-        preferences.setdefault(key, value) # Adds key with default value ONLY if key is not already present
-
-    logging.debug(f"Final preferences for user {user_id}: {preferences}")
-    return preferences
+        return dict(PREFERENCE_DEFAULTS)
+    preferences = get_user_preferences_from_db(user_id)
+    return preferences if preferences is not None else dict(PREFERENCE_DEFAULTS)
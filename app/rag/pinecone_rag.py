@@ -12,6 +12,9 @@ import instructor
 from pinecone import Pinecone
 from dotenv import load_dotenv
 
+from app.services.tracing import span
+from app.services.memory_diagnostics import register_memory_report, http_client_size
+
 # Load environment variables
 load_dotenv()
 
@@ -28,6 +31,10 @@ client_openai = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 client = instructor.from_openai(
     client_openai)  # Apply patch to the OpenAI client
 
+register_memory_report("pinecone_rag.client_openai", lambda: http_client_size(client_openai._client))
+# Pinecone talks through urllib3 pools; the client and both index handles are sized together
+register_memory_report("pinecone_rag.pinecone", lambda: [pc, user_index, book_index])
+
 
 # --- Classification model ---
 class ClassificationResponse(BaseModel):
@@ -68,7 +75,8 @@ def get_embedding(text: str, model: str = "text-embedding-ada-002"):
     Get embedding for a given text using the OpenAI embeddings API.
     """
     print("Embedding text:", text)
-    response = client_openai.embeddings.create(input=[text], model=model)
+    with span("rag.embedding", dependency="openai"):
+        response = client_openai.embeddings.create(input=[text], model=model)
     return response.data[0].embedding
 
 
@@ -84,11 +92,12 @@ def query_pinecone_user(query_string: str,
     Query the user Pinecone index using the query string.
     """
     xc = get_embedding(query_string)
-    result = user_index.query(vector=xc,
-                              top_k=top_k,
-                              include_metadata=True,
-                              namespace=namespace,
-                              filter=filter)
+    with span("rag.pinecone", dependency="pinecone", index="user"):
+        result = user_index.query(vector=xc,
+                                  top_k=top_k,
+                                  include_metadata=True,
+                                  namespace=namespace,
+                                  filter=filter)
     return result
 
 
@@ -97,10 +106,11 @@ def query_pinecone_book(query_string: str,
                         namespace: str = "ah-test"):
     """Query Pinecone index and return top result plus next two entries."""
     xc = get_embedding(query_string)
-    result = book_index.query(vector=xc,
-                              top_k=top_k,
-                              include_metadata=True,
-                              namespace=namespace)
+    with span("rag.pinecone", dependency="pinecone", index="book"):
+        result = book_index.query(vector=xc,
+                                  top_k=top_k,
+                                  include_metadata=True,
+                                  namespace=namespace)
 
     if not result or not result.matches:
         return "No results found."
@@ -117,8 +127,9 @@ def query_pinecone_book(query_string: str,
     indices_to_fetch = [top_index, top_index + 1, top_index + 2]
     combined_strings = []
     for idx in indices_to_fetch:
-        individual_result = book_index.fetch(ids=[str(idx)],
-                                             namespace=namespace)
+        with span("rag.pinecone_fetch", dependency="pinecone", index="book"):
+            individual_result = book_index.fetch(ids=[str(idx)],
+                                                 namespace=namespace)
         # print("*******INDIVIDUAL RESULT*******", individual_result)
         if individual_result and str(idx) in individual_result.vectors:
             text = individual_result.vectors[str(idx)].metadata.get("text", "")
@@ -0,0 +1,211 @@
+# app/services/admission.py
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from app.services.rate_limit import TokenBucket
+from app.services.metrics import get_counter, get_histogram, register_collector
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Chat turns are admitted per worker: a per-user token bucket first (a user's own burst is
+# rejected at once), then a global limit on turns in flight. When every slot is taken a turn
+# waits in a short FIFO queue; a full queue or a missed deadline sheds it with a fallback reply.
+# A streamed turn keeps its slot until the last SSE chunk is written.
+MAX_CONCURRENT_TURNS = int(os.environ.get("LLM_MAX_CONCURRENT_STREAMS", 32))  # 0 = unlimited
+QUEUE_MAX = int(os.environ.get("LLM_ADMISSION_QUEUE_MAX", 16))
+QUEUE_WAIT_S = float(os.environ.get("LLM_ADMISSION_WAIT_S", 2.0))
+USER_TURNS_PER_MIN = float(os.environ.get("LLM_USER_TURNS_PER_MIN", 20))  # 0 = no per-user limit
+USER_BURST = float(os.environ.get("LLM_USER_BURST", 5))
+MAX_TRACKED_USERS = 10_000
+RETRY_AFTER_S = 2
+
+FALLBACK_REPLY = os.environ.get(
+    "LLM_OVERLOAD_REPLY",
+    "Sorry, I'm handling a lot right now. Give me a moment and ask me that again."
+)
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+
+
+class Shed(Exception):
+    """Raised by admit() when a turn is rejected; `reason` is the metrics label."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# ------------------------------
+# Global concurrency gate
+# ------------------------------
+class _Gate:
+    """Counting semaphore with a bounded FIFO wait queue and per-waiter deadlines."""
+
+    def __init__(self, limit: int, queue_max: int):
+        self.limit = limit
+        self.queue_max = queue_max
+        self.active = 0
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout_s: float) -> float:
+        """Takes a slot and returns the seconds spent queued; raises Shed if it can't."""
+        if self.limit <= 0:
+            return 0.0
+        with self._cond:
+            if self.active < self.limit and not self._queue:
+                self.active += 1
+                return 0.0
+            if len(self._queue) >= self.queue_max:
+                raise Shed("queue_full")
+            waiter = object()
+            self._queue.append(waiter)
+            started = time.monotonic()
+            deadline = started + timeout_s
+            try:
+                while not (self._queue[0] is waiter and self.active < self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Shed("timeout")
+                    self._cond.wait(remaining)
+                self.active += 1
+                return time.monotonic() - started
+            finally:
+                self._queue.remove(waiter)
+                self._cond.notify_all()  # The next waiter may now be at the head
+
+    def release(self) -> None:
+        if self.limit <= 0:
+            return
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+
+_gate = _Gate(MAX_CONCURRENT_TURNS, QUEUE_MAX)
+_user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+_user_buckets_lock = threading.Lock()
+
+register_collector("llm_turns_active", lambda: _gate.active)
+register_collector("llm_admission_queue_depth", lambda: _gate.queued)
+
+
+def _user_bucket(user_id: str) -> TokenBucket:
+    with _user_buckets_lock:
+        bucket = _user_buckets.get(user_id)
+        if bucket is None:
+            bucket = _user_buckets[user_id] = TokenBucket(USER_TURNS_PER_MIN / 60.0, USER_BURST)
+            while len(_user_buckets) > MAX_TRACKED_USERS:
+                _user_buckets.popitem(last=False)
+        else:
+            _user_buckets.move_to_end(user_id)
+        return bucket
+
+
+# ------------------------------
+# Admission tickets
+# ------------------------------
+class Ticket:
+    """A held slot; released once, by the request scope or by the stream it was handed to."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.handed_off = False
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        _gate.release()
+
+
+_current_ticket: contextvars.ContextVar = contextvars.ContextVar("admission_ticket", default=None)
+
+
+def _count(result: str) -> None:
+    get_counter("llm_admission_total", {"result": result}).inc()
+
+
+def admit(user_id: str) -> Ticket:
+    """
+    Admits one chat turn for `user_id` (blocking up to QUEUE_WAIT_S in the wait queue) and
+    binds the ticket to the current admission_scope(). Raises Shed when the turn is rejected.
+    """
+    if USER_TURNS_PER_MIN > 0 and not _user_bucket(user_id).try_acquire():
+        _count("shed_user_rate")
+        logger.warning(f"Shedding chat turn for user {user_id}: over {USER_TURNS_PER_MIN:g} turns/min.")
+        raise Shed("user_rate")
+    try:
+        waited = _gate.acquire(QUEUE_WAIT_S)
+    except Shed as shed:
+        _count(f"shed_{shed.reason}")
+        logger.warning(f"Shedding chat turn for user {user_id}: {shed.reason} "
+                       f"({_gate.active} active, {_gate.queued} queued).")
+        raise
+    get_histogram("llm_admission_wait_seconds", buckets=WAIT_BUCKETS).observe(waited)
+    _count("queued" if waited > 0 else "admitted")
+    ticket = Ticket(user_id)
+    _current_ticket.set(ticket)
+    return ticket
+
+
+@contextmanager
+def admission_scope() -> Iterator[None]:
+    """
+    Request scope for admit(): the ticket taken inside is released on exit unless
+    hold_for_stream() passed it to a streamed response.
+    """
+    token = _current_ticket.set(None)
+    try:
+        yield
+    finally:
+        ticket = _current_ticket.get()
+        _current_ticket.reset(token)
+        if ticket is not None and not ticket.handed_off:
+            ticket.release()
+
+
+class _HeldStream:
+    """Response body that releases its ticket when exhausted or closed (even if never iterated)."""
+
+    def __init__(self, chunks: Iterable[str], ticket: Ticket):
+        self._chunks = chunks
+        self._ticket = ticket
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            yield from self._chunks
+        finally:
+            self._ticket.release()
+
+    def close(self) -> None:
+        try:
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._ticket.release()
+
+
+def hold_for_stream(chunks: Iterable[str]) -> Iterable[str]:
+    """Keeps the current turn's slot until the SSE body `chunks` is written or closed."""
+    ticket = _current_ticket.get()
+    if ticket is None:
+        return chunks
+    ticket.handed_off = True
+    return _HeldStream(chunks, ticket)
@@ -0,0 +1,317 @@
+# app/services/artifact_store.py
+
+import os
+import io
+import re
+import gzip
+import json
+import base64
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+from app.api.supabase_db import supabase
+
+try:
+    import zstandard
+except ImportError:  # gzip is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# "local" keeps blobs under ARTIFACT_DIR; "supabase" uses the session_artifacts table
+# (see migrations/001_session_artifacts.sql).
+ARTIFACT_STORE_BACKEND = os.environ.get("ARTIFACT_STORE_BACKEND", "local").lower()
+ARTIFACT_DIR = Path(os.environ.get("ARTIFACT_DIR", os.path.join("data", "artifacts")))
+ARTIFACT_TABLE = "session_artifacts"
+ZSTD_LEVEL = int(os.environ.get("ARTIFACT_ZSTD_LEVEL", 10))
+GZIP_LEVEL = int(os.environ.get("ARTIFACT_GZIP_LEVEL", 6))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@dataclass
+class ArtifactRef:
+    """Pointer to a stored artifact. `size` is uncompressed, `stored_size` compressed."""
+    sha256: str
+    kind: str
+    size: int
+    stored_size: int
+    codec: str
+    content_type: str = "text/plain; charset=utf-8"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ArtifactStoreError(Exception):
+    """Raised when an artifact cannot be written or read."""
+
+
+# ------------------------------
+# Codecs
+# ------------------------------
+def _default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _compressing_writer(codec: str, raw: BinaryIO) -> BinaryIO:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ArtifactStoreError("zstd artifact requested but the zstandard package is not installed.")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _decompressing_reader(codec: str, raw: BinaryIO) -> BinaryIO:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ArtifactStoreError("Artifact is zstd-compressed but the zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    return gzip.GzipFile(fileobj=raw, mode="rb")
+
+
+# ------------------------------
+# Backends
+# ------------------------------
+class _LocalBackend:
+    """Blobs at ARTIFACT_DIR/<sha[:2]>/<sha>, metadata beside them as <sha>.json."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _paths(self, sha256: str) -> Tuple[Path, Path]:
+        folder = self.root / sha256[:2]
+        return folder / sha256, folder / f"{sha256}.json"
+
+    def spool_dir(self) -> Path:
+        path = self.root / "tmp"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def exists(self, sha256: str) -> bool:
+        return self._paths(sha256)[1].exists()
+
+    def commit(self, ref: ArtifactRef, spool_path: str) -> None:
+        blob, meta = self._paths(ref.sha256)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(spool_path, blob)
+        # Metadata last: an artifact exists once its .json does
+        tmp_meta = meta.with_suffix(".json.tmp")
+        tmp_meta.write_text(json.dumps(ref.as_dict()), encoding="utf-8")
+        os.replace(tmp_meta, meta)
+
+    def meta(self, sha256: str) -> Optional[ArtifactRef]:
+        meta = self._paths(sha256)[1]
+        try:
+            return ArtifactRef(**json.loads(meta.read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return None
+
+    def open_compressed(self, sha256: str) -> BinaryIO:
+        return open(self._paths(sha256)[0], "rb")
+
+
+class _SupabaseBackend:
+    """Rows in the session_artifacts table; the compressed blob is stored base64-encoded."""
+
+    def spool_dir(self) -> Path:
+        path = ARTIFACT_DIR / "tmp"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _client(self):
+        if not supabase:
+            raise ArtifactStoreError("Supabase client not available for the artifact store.")
+        return supabase
+
+    def exists(self, sha256: str) -> bool:
+        response = self._client().table(ARTIFACT_TABLE).select("sha256").eq("sha256", sha256).limit(1).execute()
+        return bool(response.data)
+
+    def commit(self, ref: ArtifactRef, spool_path: str) -> None:
+        try:
+            with open(spool_path, "rb") as f:
+                content_b64 = base64.b64encode(f.read()).decode("ascii")
+        finally:
+            os.unlink(spool_path)
+        row = {**ref.as_dict(), "content_b64": content_b64}
+        response = self._client().table(ARTIFACT_TABLE).upsert(
+            row, on_conflict="sha256", ignore_duplicates=True).execute()
+        if hasattr(response, 'error') and response.error:
+            raise ArtifactStoreError(f"Supabase error storing artifact {ref.sha256[:12]}: {response.error}")
+
+    def _row(self, sha256: str, columns: str) -> Optional[Dict[str, Any]]:
+        response = self._client().table(ARTIFACT_TABLE).select(columns).eq("sha256", sha256).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def meta(self, sha256: str) -> Optional[ArtifactRef]:
+        row = self._row(sha256, "sha256, kind, size, stored_size, codec, content_type")
+        return ArtifactRef(**row) if row else None
+
+    def open_compressed(self, sha256: str) -> BinaryIO:
+        row = self._row(sha256, "content_b64")
+        if not row:
+            raise FileNotFoundError(sha256)
+        return io.BytesIO(base64.b64decode(row["content_b64"]))
+
+
+def _backend():
+    if ARTIFACT_STORE_BACKEND == "supabase":
+        return _SupabaseBackend()
+    return _LocalBackend(ARTIFACT_DIR)
+
+
+# ------------------------------
+# Writing
+# ------------------------------
+class ArtifactWriter:
+    """
+    Incremental, content-addressed artifact writer. Data is hashed and compressed as it
+    is written into a spool file, so memory stays flat however large the artifact is.
+
+        with ArtifactWriter("transcript") as writer:
+            writer.write(chunk)
+        ref = writer.ref
+    """
+
+    def __init__(self, kind: str, content_type: str = "text/plain; charset=utf-8", codec: Optional[str] = None):
+        self.kind = kind
+        self.content_type = content_type
+        self.codec = codec or _default_codec()
+        self.ref: Optional[ArtifactRef] = None
+        self._pending: Optional[ArtifactRef] = None
+        self._backend = _backend()
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._spool = tempfile.NamedTemporaryFile(dir=self._backend.spool_dir(), suffix=".part", delete=False)
+        self._compressor = _compressing_writer(self.codec, self._spool)
+
+    def write(self, data: Union[bytes, str]) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not data:
+            return
+        self._hash.update(data)
+        self._size += len(data)
+        self._compressor.write(data)
+
+    def finish(self) -> ArtifactRef:
+        """Completes the compressed spool without storing it; see commit() / iter_spooled()."""
+        if self._pending is not None:
+            return self._pending
+        try:
+            self._compressor.close()
+            self._spool.flush()
+            stored_size = self._spool.tell()
+            self._spool.close()
+        except Exception:
+            self.abort()
+            raise
+        self._pending = ArtifactRef(self._hash.hexdigest(), self.kind, self._size, stored_size,
+                                    self.codec, self.content_type)
+        return self._pending
+
+    def commit(self) -> ArtifactRef:
+        """Stores the spooled artifact (a no-op if identical content already exists)."""
+        if self.ref is not None:
+            return self.ref
+        ref = self.finish()
+        try:
+            if self._backend.exists(ref.sha256):
+                os.unlink(self._spool.name)  # Same content already stored
+            else:
+                self._backend.commit(ref, self._spool.name)
+        except Exception:
+            self.abort()
+            raise
+        self.ref = ref
+        logger.info(f"Stored {ref.kind} artifact {ref.sha256[:12]}: {ref.size} bytes -> {ref.stored_size} ({ref.codec})")
+        return ref
+
+    def close(self) -> ArtifactRef:
+        return self.commit()
+
+    def iter_spooled(self, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Decompressed content of a finished, not yet committed, spool."""
+        self.finish()
+        with open(self._spool.name, "rb") as raw:
+            reader = _decompressing_reader(self.codec, raw)
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def abort(self) -> None:
+        try:
+            self._spool.close()
+            os.unlink(self._spool.name)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def put_artifact(content: Union[bytes, str], kind: str, content_type: str = "text/plain; charset=utf-8") -> ArtifactRef:
+    """Stores `content` compressed and returns its pointer (deduplicated by sha256)."""
+    with ArtifactWriter(kind, content_type) as writer:
+        writer.write(content)
+    return writer.ref
+
+
+def put_json_artifact(value: Any, kind: str) -> ArtifactRef:
+    """Stores a JSON-serialisable value (e.g. a message array) as a compressed artifact."""
+    return put_artifact(json.dumps(value, separators=(",", ":"), default=str), kind,
+                        content_type="application/json")
+
+
+# ------------------------------
+# Reading
+# ------------------------------
+def is_artifact_id(value: Optional[str]) -> bool:
+    return bool(value) and bool(_SHA256_RE.match(value))
+
+
+def get_artifact_meta(sha256: str) -> Optional[ArtifactRef]:
+    if not is_artifact_id(sha256):
+        return None
+    try:
+        return _backend().meta(sha256)
+    except Exception as e:
+        logger.error(f"Error reading artifact metadata {sha256[:12]}: {e}")
+        return None
+
+
+def iter_artifact(sha256: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the decompressed artifact in chunks, without loading it whole."""
+    meta = get_artifact_meta(sha256)
+    if meta is None:
+        raise ArtifactStoreError(f"Artifact {sha256[:12]} not found.")
+    raw = _backend().open_compressed(sha256)
+    try:
+        reader = _decompressing_reader(meta.codec, raw)
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        raw.close()
+
+
+def read_artifact(sha256: str) -> bytes:
+    """Whole artifact in memory; prefer iter_artifact for anything large."""
+    return b"".join(iter_artifact(sha256))
@@ -0,0 +1,151 @@
+# app/services/filler_stream.py
+
+import os
+import json
+import random
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.functions.get_custom_llm_streaming import build_text_chunk, generate_streaming_response
+from app.services.tracing import current_trace, hand_off_to_stream
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Filler mode answers a streamed turn at once with a short spoken filler while retrieval and
+# the LLM request run in a background thread; the completion then continues the same stream.
+#   off        - never (default)
+#   preference - only for users whose interaction_style has phrases below
+#   always     - every user; styles without phrases use the friendly ones
+# Resolved preferences default interaction_style to "friendly", so users opt out in either
+# mode with a style from FILLER_OPT_OUT_STYLES.
+FILLER_STREAM_MODE = os.environ.get("FILLER_STREAM_MODE", "off").lower()
+FILLER_PREPARE_TIMEOUT_S = float(os.environ.get("FILLER_PREPARE_TIMEOUT_S", 30))
+FILLER_ERROR_REPLY = "Sorry, I lost my train of thought there. Could you say that again?"
+FILLER_OPT_OUT_STYLES = {style.strip().lower() for style in
+                         os.environ.get("FILLER_OPT_OUT_STYLES", "direct,concise").split(",") if style.strip()}
+
+# interaction_style -> topic -> phrases. Trailing spaces keep the completion from running on.
+FILLER_PHRASES: Dict[str, Dict[str, List[str]]] = {
+    "friendly": {
+        "habit": ["Let me think about that habit... ", "Ooh, good one. Let me think about that habit... "],
+        "question": ["Good question, let me think... ", "Hmm, let me think about that... "],
+        "general": ["Hmm, let me think about that... ", "Okay, give me a second... "],
+    },
+    "casual": {
+        "habit": ["Oh, that habit... let me think. ", "Hmm, habits, okay... "],
+        "question": ["Hmm, good one... ", "Let me see... "],
+        "general": ["Hmm, okay... ", "Let me see... "],
+    },
+    "formal": {
+        "habit": ["Let me consider that habit for a moment. "],
+        "question": ["That is a good question. Let me consider it. "],
+        "general": ["One moment, please. "],
+    },
+}
+FILLER_PHRASES["professional"] = FILLER_PHRASES["formal"]
+_QUESTION_WORDS = ("how", "what", "why", "when", "where", "which", "who", "can", "could", "should", "do", "does", "is")
+
+
+def _topic(query: str, keywords: Iterable[str]) -> str:
+    text = query.lower()
+    if "habit" in text or any(keyword and str(keyword).lower() in text for keyword in keywords):
+        return "habit"
+    if text.rstrip().endswith("?") or text.split(" ", 1)[0] in _QUESTION_WORDS:
+        return "question"
+    return "general"
+
+
+def choose_filler(query: str, preferences: Optional[Dict[str, Any]], keywords: Iterable[str] = ()) -> Optional[str]:
+    """
+    A filler line for this turn, or None when filler mode doesn't apply (mode off, no user
+    query, an opted-out interaction_style, or in "preference" mode a missing style or one
+    without phrases).
+    """
+    if FILLER_STREAM_MODE not in ("preference", "always") or not query or not query.strip():
+        return None
+    style = str((preferences or {}).get("interaction_style") or "").strip().lower()
+    if style in FILLER_OPT_OUT_STYLES:
+        return None
+    phrases = FILLER_PHRASES.get(style)
+    if phrases is None:
+        if FILLER_STREAM_MODE != "always":
+            return None
+        phrases = FILLER_PHRASES["friendly"]
+    return random.choice(phrases[_topic(query, keywords)])
+
+
+def _sse(chunk: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def stream_with_filler(filler: str, model: str, start_completion: Callable[[], Any],
+                       llm_started: float) -> Iterator[str]:
+    """
+    Starts `start_completion()` (retrieval + the streaming LLM call, returning the OpenAI
+    stream) in a background thread and returns the SSE body: the filler chunk first, then
+    the completion's chunks. The current trace is handed to the stream, so llm.ttft measures
+    to the first completion chunk rather than the filler.
+    """
+    future: Future = Future()
+    ctx = contextvars.copy_context()  # Flask app context and the turn's trace
+    trace = current_trace()
+    abandoned = threading.Event()  # Set once nothing will read the completion stream
+    close_once = threading.Lock()
+
+    def run():
+        try:
+            future.set_result(ctx.run(start_completion))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def close_if_abandoned(done: Future) -> None:
+        # Called when the completion is ready and when the body gives up on it; closes once both happened
+        if not abandoned.is_set() or not done.done() or done.exception() is not None:
+            return
+        if not close_once.acquire(blocking=False):
+            return
+        try:
+            done.result().close()
+        except Exception as e:
+            logger.warning(f"Closing the abandoned completion behind the filler failed: {e}")
+
+    future.add_done_callback(close_if_abandoned)
+    threading.Thread(target=run, name="filler-prepare", daemon=True).start()
+    taken = False
+
+    def completion_chunks() -> Iterator[str]:
+        nonlocal taken
+        try:
+            completion_stream = future.result(timeout=FILLER_PREPARE_TIMEOUT_S)
+        except FutureTimeout:
+            logger.error(f"Completion behind the filler didn't start within {FILLER_PREPARE_TIMEOUT_S:g}s.")
+            yield _sse(build_text_chunk(FILLER_ERROR_REPLY, model, finish_reason="stop"))
+            return
+        except Exception as e:
+            logger.error(f"Completion behind the filler failed: {e}", exc_info=True)
+            yield _sse(build_text_chunk(FILLER_ERROR_REPLY, model, finish_reason="stop"))
+            return
+        taken = True  # From here generate_streaming_response owns (and closes) the stream
+        yield from generate_streaming_response(completion_stream)
+
+    completion = hand_off_to_stream(completion_chunks(), llm_started)
+
+    def body() -> Iterator[str]:
+        try:
+            yield _sse(build_text_chunk(filler, model))
+            yield from completion
+        finally:
+            # The client may leave after the filler, before the completion is read (or the
+            # completion may start after we stopped waiting): close it and end the turn's trace
+            completion.close()
+            if not taken:
+                abandoned.set()
+                close_if_abandoned(future)
+            if trace is not None:
+                trace.finish()
+
+    return body()
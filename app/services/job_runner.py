@@ -0,0 +1,290 @@
+# app/services/job_runner.py
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import socket
+import sqlite3
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from app.services.metrics import get_gauge
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+DB_BASE_PATH = "data/databases"
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", f"{DB_BASE_PATH}/jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+VAPI_CONTROL_TIMEOUT_S = float(os.environ.get("VAPI_CONTROL_TIMEOUT_S", 5))
+# Each process heartbeats the queued/running jobs it owns; jobs whose owner stopped
+# heartbeating (restarted or killed worker, on any host) are failed by the others.
+JOB_HEARTBEAT_S = float(os.environ.get("JOB_HEARTBEAT_S", 10))
+JOB_STALE_AFTER_S = float(os.environ.get("JOB_STALE_AFTER_S", 60))
+
+_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS background_jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    call_id TEXT,
+    control_url TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    reported INTEGER NOT NULL DEFAULT 0,
+    user_id TEXT,
+    owner TEXT,
+    heartbeat REAL
+)
+"""
+_ADDED_COLUMNS = (("user_id", "TEXT"), ("owner", "TEXT"), ("heartbeat", "REAL"))
+INTERRUPTED_ERROR = "Interrupted: the worker running this task restarted."
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="background-job")
+# Queue depth for /metrics: submitted but not started, and currently running
+_queued_gauge = get_gauge("background_jobs", {"state": "queued"})
+_running_gauge = get_gauge("background_jobs", {"state": "running"})
+_schema_ready = False
+_schema_lock = threading.Lock()
+_owner: Optional[str] = None
+_owner_pid: Optional[int] = None
+_owner_lock = threading.Lock()
+
+
+# ------------------------------
+# Persistence helpers
+# ------------------------------
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    _process_owner()  # Starts this process's heartbeat (and interrupted-job sweep) on first use
+    Path(os.path.dirname(JOBS_DB_PATH) or ".").mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(_JOBS_SCHEMA)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_background_jobs_call ON background_jobs (call_id, reported)")
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(background_jobs)")}
+                for column, column_type in _ADDED_COLUMNS:
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE background_jobs ADD COLUMN {column} {column_type}")
+                conn.commit()
+                _schema_ready = True
+    return conn
+
+
+# ------------------------------
+# Ownership heartbeat
+# ------------------------------
+def _process_owner() -> str:
+    """This process's owner token; a forked worker gets its own (and its own heartbeat thread)."""
+    global _owner, _owner_pid
+    if _owner_pid == os.getpid():
+        return _owner
+    with _owner_lock:
+        if _owner_pid != os.getpid():
+            _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            _owner_pid = os.getpid()
+            threading.Thread(target=_heartbeat_loop, args=(_owner,), name="background-job-heartbeat",
+                             daemon=True).start()
+    return _owner
+
+
+def _heartbeat_loop(owner: str) -> None:
+    while True:
+        try:
+            _heartbeat_and_fail_interrupted(owner)
+        except Exception as e:
+            logger.error(f"Background job heartbeat failed: {e}")
+        time.sleep(JOB_HEARTBEAT_S)
+
+
+def _heartbeat_and_fail_interrupted(owner: str) -> None:
+    """
+    Refreshes the heartbeat of our queued/running jobs and marks those of owners that stopped
+    heartbeating as failed, so they are reported instead of staying pending forever.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("UPDATE background_jobs SET heartbeat = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                     (now, owner))
+        failed = conn.execute(
+            "UPDATE background_jobs SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE status IN ('queued', 'running') AND owner IS NOT ? AND (heartbeat IS NULL OR heartbeat < ?)",
+            (INTERRUPTED_ERROR, now, owner, now - JOB_STALE_AFTER_S)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if failed:
+        logger.warning(f"Marked {failed} background job(s) interrupted by a restart as failed.")
+
+
+def _update_job(job_id: str, **fields) -> None:
+    columns = ", ".join(f"{key} = ?" for key in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE background_jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    if job.get("result"):
+        try:
+            job["result"] = json.loads(job["result"])
+        except json.JSONDecodeError:
+            pass
+    job["reported"] = bool(job.get("reported"))
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the persisted job record, or None if unknown."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM background_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        conn.close()
+
+
+def _claim_report(conn: sqlite3.Connection, job_id: str) -> bool:
+    """Atomically takes the right to report a job; False if someone else already did."""
+    claimed = conn.execute("UPDATE background_jobs SET reported = 1 WHERE job_id = ? AND reported = 0",
+                           (job_id,)).rowcount == 1
+    conn.commit()
+    return claimed
+
+
+def pop_finished_jobs_for_call(call_id: str) -> List[Dict[str, Any]]:
+    """
+    Returns finished jobs for a call that have not been reported to the caller yet,
+    and marks them reported. Used to surface results on the next chat turn.
+    """
+    if not call_id:
+        return []
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM background_jobs WHERE call_id = ? AND reported = 0 "
+            "AND status IN ('succeeded', 'failed') ORDER BY finished_at", (call_id,)).fetchall()
+        # Only jobs claimed here are returned; one being pushed via the control URL is skipped
+        return [_row_to_job(row) for row in rows if _claim_report(conn, row["job_id"])]
+    finally:
+        conn.close()
+
+
+# ------------------------------
+# Completion reporting
+# ------------------------------
+def describe_job_outcome(job: Dict[str, Any]) -> str:
+    """One-line, speakable summary of a finished job."""
+    result = job.get("result")
+    if job.get("status") == "succeeded":
+        if isinstance(result, dict) and result.get("message"):
+            return f"Background task '{job['kind']}' finished: {result['message']}"
+        return f"Background task '{job['kind']}' finished successfully."
+    return f"Background task '{job['kind']}' failed: {job.get('error') or 'unknown error'}"
+
+
+def _report_to_call(job: Dict[str, Any]) -> bool:
+    """Injects the outcome into the live call via Vapi's control URL. True if delivered."""
+    control_url = job.get("control_url")
+    if not control_url:
+        return False
+    message = {
+        "type": "add-message",
+        "message": {"role": "system", "content": describe_job_outcome(job)},
+        "triggerResponseEnabled": True
+    }
+    try:
+        response = httpx.post(control_url, json=message, timeout=VAPI_CONTROL_TIMEOUT_S)
+        if response.status_code >= 300:
+            logger.warning(f"Vapi control URL rejected job {job['job_id']} report: {response.status_code} {response.text[:200]}")
+            return False
+        return True
+    except Exception as e:
+        # Call may have ended; the result is still picked up on the next turn or via the status route
+        logger.warning(f"Could not report job {job['job_id']} to call {job.get('call_id')}: {e}")
+        return False
+
+
+# ------------------------------
+# Execution
+# ------------------------------
+def _run_job(job_id: str, func: Callable, kwargs: Dict[str, Any]) -> None:
+    _queued_gauge.dec()
+    _running_gauge.inc()
+    try:
+        _execute_job(job_id, func, kwargs)
+    finally:
+        _running_gauge.dec()
+
+
+def _execute_job(job_id: str, func: Callable, kwargs: Dict[str, Any]) -> None:
+    _update_job(job_id, status="running", started_at=time.time())
+    try:
+        if asyncio.iscoroutinefunction(func):
+            result = asyncio.run(func(**kwargs))
+        else:
+            result = func(**kwargs)
+        if isinstance(result, dict) and result.get("status") == "error":
+            _update_job(job_id, status="failed", error=str(result.get("message")),
+                        result=json.dumps(result, default=str), finished_at=time.time())
+        else:
+            _update_job(job_id, status="succeeded", result=json.dumps(result, default=str), finished_at=time.time())
+        logger.info(f"Background job {job_id} finished.")
+    except Exception as e:
+        logger.error(f"Background job {job_id} failed: {e}", exc_info=True)
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    job = get_job(job_id)
+    if not job or not job.get("control_url"):
+        return
+    # Claim before posting so a chat turn in the meantime can't report the same outcome
+    conn = _connect()
+    try:
+        claimed = _claim_report(conn, job_id)
+    finally:
+        conn.close()
+    if claimed and not _report_to_call(job):
+        _update_job(job_id, reported=0)  # Left for the next chat turn or the status route
+
+
+def submit_job(kind: str, func: Callable, kwargs: Optional[Dict[str, Any]] = None,
+               call_id: Optional[str] = None, control_url: Optional[str] = None,
+               user_id: Optional[str] = None) -> str:
+    """
+    Persists a queued job and runs `func(**kwargs)` (sync or async) on the
+    background pool. Returns the job id immediately.
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO background_jobs (job_id, kind, status, call_id, control_url, created_at, user_id, owner, heartbeat) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, call_id, control_url, now, user_id, _process_owner(), now))
+        conn.commit()
+    finally:
+        conn.close()
+    _queued_gauge.inc()
+    _executor.submit(_run_job, job_id, func, kwargs or {})
+    logger.info(f"Queued background job {job_id} ({kind}) for call {call_id}.")
+    return job_id
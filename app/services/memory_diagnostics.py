@@ -0,0 +1,244 @@
+# app/services/memory_diagnostics.py
+
+import gc
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# tracemalloc only runs between start_tracing() and stop_tracing() (it slows allocations and
+# costs memory per traced block); snapshots are kept in memory, oldest dropped first.
+MAX_SNAPSHOTS = int(os.environ.get("MEMORY_MAX_SNAPSHOTS", 5))
+DEFAULT_TRACE_FRAMES = 10
+DEEP_SIZE_MAX_OBJECTS = 200_000  # deep_sizeof stops walking (and says so) past this many objects
+
+_lock = threading.Lock()
+_snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+_next_snapshot_id = 1
+# name -> callback returning the object(s) to size, or a ready {"items": n, "bytes": b} dict
+_reporters: Dict[str, Callable[[], Any]] = {}
+
+# Allocations made by the diagnostics themselves are left out of snapshots
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+# ------------------------------
+# Process memory
+# ------------------------------
+def process_memory() -> Dict[str, Any]:
+    """Current RSS (Linux /proc) and peak RSS of this worker, in bytes."""
+    info: Dict[str, Any] = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/statm") as statm:
+            info["rss_bytes"] = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        info["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        pass
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        info["traced_bytes"], info["traced_peak_bytes"] = current, peak
+    return info
+
+
+# ------------------------------
+# Snapshots
+# ------------------------------
+def start_tracing(frames: int = DEFAULT_TRACE_FRAMES) -> bool:
+    """Starts tracemalloc (False if it was already running) and takes a baseline snapshot."""
+    if tracemalloc.is_tracing():
+        return False
+    frames = max(1, min(frames, 50))
+    tracemalloc.start(frames)
+    logger.warning(f"tracemalloc started ({frames} frames) on worker {os.getpid()}; allocations are slower until it is stopped.")
+    take_snapshot(label="baseline")
+    return True
+
+
+def stop_tracing() -> bool:
+    """Stops tracemalloc and drops the stored snapshots. False if it wasn't running."""
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+    logger.info(f"tracemalloc stopped on worker {os.getpid()}.")
+    return True
+
+
+def _object_type_counts() -> Counter:
+    # gc only sees container objects (and not dicts/tuples holding only atomic values), so
+    # these counts complement the tracemalloc sites rather than add up to them
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        counts[type(obj).__qualname__] += 1
+    return counts
+
+
+def take_snapshot(label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stores a tracemalloc snapshot plus gc object counts by type. Returns its summary;
+    raises RuntimeError when tracing isn't running.
+    """
+    global _next_snapshot_id
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running; start tracing first.")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    types = _object_type_counts()
+    with _lock:
+        snapshot_id = _next_snapshot_id
+        _next_snapshot_id += 1
+        _snapshots[snapshot_id] = {"id": snapshot_id, "label": label, "taken_at": time.time(),
+                                   "snapshot": snapshot, "types": types, "process": process_memory()}
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot_summary(snapshot_id)
+
+
+def _get(snapshot_id: int) -> Optional[Dict[str, Any]]:
+    with _lock:
+        return _snapshots.get(snapshot_id)
+
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    with _lock:
+        entries = list(_snapshots.values())
+    return [{"id": e["id"], "label": e["label"], "taken_at": e["taken_at"],
+             "rss_bytes": e["process"].get("rss_bytes")} for e in entries]
+
+
+def _stat_row(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    row = {"site": f"{frame.filename}:{frame.lineno}", "size_bytes": stat.size, "count": stat.count}
+    if len(stat.traceback) > 1:
+        row["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+    return row
+
+
+def snapshot_summary(snapshot_id: int, limit: int = 25, group_by: str = "lineno") -> Optional[Dict[str, Any]]:
+    """Top allocation sites and object types of one snapshot."""
+    entry = _get(snapshot_id)
+    if entry is None:
+        return None
+    stats = entry["snapshot"].statistics(group_by)
+    return {"id": entry["id"], "label": entry["label"], "taken_at": entry["taken_at"],
+            "process": entry["process"],
+            "traced_bytes": sum(stat.size for stat in stats),
+            "top_sites": [_stat_row(stat) for stat in stats[:limit]],
+            "top_types": [{"type": name, "count": count} for name, count in entry["types"].most_common(limit)]}
+
+
+def diff_snapshots(older_id: int, newer_id: int, limit: int = 25, group_by: str = "lineno") -> Optional[Dict[str, Any]]:
+    """Growth between two snapshots by allocation site (tracemalloc) and by object type (gc counts)."""
+    older, newer = _get(older_id), _get(newer_id)
+    if older is None or newer is None:
+        return None
+    site_diffs = newer["snapshot"].compare_to(older["snapshot"], group_by)
+    type_growth = Counter(newer["types"])
+    type_growth.subtract(older["types"])
+    rss_old, rss_new = older["process"].get("rss_bytes"), newer["process"].get("rss_bytes")
+    return {
+        "from": older_id, "to": newer_id,
+        "elapsed_s": round(newer["taken_at"] - older["taken_at"], 1),
+        "rss_growth_bytes": rss_new - rss_old if rss_old is not None and rss_new is not None else None,
+        "traced_growth_bytes": sum(d.size_diff for d in site_diffs),
+        "top_sites": [dict(_stat_row(d), size_diff_bytes=d.size_diff, count_diff=d.count_diff)
+                      for d in site_diffs[:limit] if d.size_diff or d.count_diff],
+        "top_types": [{"type": name, "count_diff": diff}
+                      for name, diff in type_growth.most_common(limit) if diff > 0],
+    }
+
+
+# ------------------------------
+# Module-level caches and state
+# ------------------------------
+def register_memory_report(name: str, callback: Callable[[], Any]) -> None:
+    """
+    Registers a cache / module-level structure for the size report. `callback` returns the
+    object to measure with deep_sizeof, or a ready {"items": n, "bytes": b} dict.
+    """
+    with _lock:
+        _reporters[name] = callback
+
+
+def deep_sizeof(obj: Any, max_objects: int = DEEP_SIZE_MAX_OBJECTS) -> Dict[str, Any]:
+    """
+    Approximate retained size of `obj`: sys.getsizeof over everything reachable through
+    gc.get_referents, not counting modules, classes and functions. Objects shared with
+    other structures are counted here too.
+    """
+    seen = set()
+    total = 0
+    pending = [obj]
+    truncated = False
+    skip = (type, type(sys), type(deep_sizeof))
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, skip):
+            continue
+        if len(seen) >= max_objects:
+            truncated = True
+            break
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        pending.extend(gc.get_referents(current))
+    return {"bytes": total, "objects": len(seen), "truncated": truncated}
+
+
+def _items(obj: Any) -> Optional[int]:
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def cache_sizes() -> List[Dict[str, Any]]:
+    """Every registered cache / structure with its item count and byte size, largest first."""
+    with _lock:
+        reporters = dict(_reporters)
+    report = []
+    for name, callback in reporters.items():
+        try:
+            target = callback()
+            if isinstance(target, dict) and "bytes" in target and "items" in target:
+                row = {"name": name, **target}
+            else:
+                row = {"name": name, "items": _items(target), **deep_sizeof(target)}
+        except Exception as e:
+            row = {"name": name, "error": str(e)}
+        report.append(row)
+    return sorted(report, key=lambda row: row.get("bytes", 0), reverse=True)
+
+
+def _sized(values) -> Dict[str, Any]:
+    values = list(values)
+    return {"items": len(values), "bytes": sum(values)}
+
+
+def pickled_store_size(store: Any) -> Dict[str, Any]:
+    """Size of a {key: (expires, pickled bytes)} store (TieredCache L1, cachelib SimpleCache)."""
+    return _sized(len(entry[1]) for entry in list(store.values())
+                  if isinstance(entry, tuple) and len(entry) > 1 and isinstance(entry[1], (bytes, bytearray)))
+
+
+def http_client_size(client: Any) -> Dict[str, Any]:
+    """Pooled connections and retained size of an httpx client (OpenAI SDK, Supabase PostgREST session)."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return {"items": len(connections) if connections is not None else None, "bytes": deep_sizeof(client)["bytes"]}
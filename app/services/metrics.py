@@ -0,0 +1,261 @@
+# app/services/metrics.py
+
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Latency buckets (seconds) shared by every latency histogram in the app.
+DEFAULT_LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Metric updates go to one of _SHARDS stripes picked by thread id, each with its own lock, so
+# concurrent request threads rarely contend; readers (the /metrics scrape) sum the stripes.
+_SHARDS = 16
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+def _shard_index() -> int:
+    return threading.get_ident() % _SHARDS
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus semantics: cumulative 'le' buckets).
+    Safe to observe from any thread.
+    """
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        # Per stripe: bucket counts (last slot is +Inf), then sum, then count
+        self._shards = [[0] * (len(self.buckets) + 1) + [0.0, 0] for _ in range(_SHARDS)]
+        self._locks = [threading.Lock() for _ in range(_SHARDS)]
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        shard_index = _shard_index()
+        shard = self._shards[shard_index]
+        with self._locks[shard_index]:
+            shard[index] += 1
+            shard[-2] += value
+            shard[-1] += 1
+
+    def snapshot(self) -> Dict:
+        """Returns count, sum and cumulative bucket counts."""
+        width = len(self.buckets) + 1
+        counts = [0] * width
+        total, count = 0.0, 0
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                values = list(shard)
+            for i in range(width):
+                counts[i] += values[i]
+            total += values[-2]
+            count += values[-1]
+        cumulative, running = [], 0
+        for upper, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((upper, running))
+        return {"name": self.name, "labels": dict(self.labels),
+                "count": count, "sum": total, "buckets": cumulative}
+
+
+class Counter:
+    """Monotonic counter (or up/down gauge when dec() is used); striped like Histogram."""
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.labels = dict(labels or {})
+        self._shards = [0] * _SHARDS
+        self._locks = [threading.Lock() for _ in range(_SHARDS)]
+
+    def inc(self, amount: float = 1) -> None:
+        shard_index = _shard_index()
+        with self._locks[shard_index]:
+            self._shards[shard_index] += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return sum(self._shards)
+
+
+# --- Registry ---
+_registry_lock = threading.Lock()
+_histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+_counters: Dict[Tuple[str, LabelKey], Counter] = {}
+_gauges: Dict[Tuple[str, LabelKey], Counter] = {}
+# name -> (type, callback returning {labels-dict-as-tuple: value} or a single value)
+_collectors: Dict[str, Tuple[str, Callable[[], Union[float, Dict[LabelKey, float]]]]] = {}
+
+
+def _get_or_create(registry: Dict, factory: Callable, name: str, labels: Optional[Dict[str, str]], *args):
+    key = (name, _label_key(labels))
+    metric = registry.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = registry.get(key)
+            if metric is None:
+                metric = factory(name, labels, *args)
+                registry[key] = metric
+    return metric
+
+
+def get_histogram(name: str, labels: Optional[Dict[str, str]] = None,
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    """Returns the histogram for (name, labels), creating it on first use."""
+    return _get_or_create(_histograms, Histogram, name, labels, buckets)
+
+
+def get_counter(name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+    """Returns the counter for (name, labels), creating it on first use."""
+    return _get_or_create(_counters, Counter, name, labels)
+
+
+def get_gauge(name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+    """Returns the up/down gauge for (name, labels) (inc()/dec()), creating it on first use."""
+    return _get_or_create(_gauges, Counter, name, labels)
+
+
+def register_collector(name: str, callback: Callable[[], Union[float, Dict[LabelKey, float]]],
+                       kind: str = "gauge") -> None:
+    """
+    Registers a metric computed only at scrape time (queue depths, existing stats dicts).
+    `callback` returns a number, or {label key (tuple of (name, value) pairs): number}.
+    """
+    with _registry_lock:
+        _collectors[name] = (kind, callback)
+
+
+def histogram_snapshots(name: Optional[str] = None) -> List[Dict]:
+    """Snapshots of all registered histograms, optionally filtered by name."""
+    with _registry_lock:
+        histograms = list(_histograms.values())
+    return [h.snapshot() for h in histograms if name is None or h.name == name]
+
+
+# ------------------------------
+# Upstream dependencies
+# ------------------------------
+DEPENDENCY_HISTOGRAM = "dependency_call_duration_seconds"
+DEPENDENCY_ERRORS = "dependency_errors_total"
+
+
+def observe_dependency_call(dependency: str, operation: str, seconds: float, error: bool = False) -> None:
+    """Latency (and error count) of one call to Supabase / Pinecone / OpenAI / ..."""
+    labels = {"dependency": dependency, "operation": operation}
+    get_histogram(DEPENDENCY_HISTOGRAM, labels).observe(seconds)
+    if error:
+        get_counter(DEPENDENCY_ERRORS, labels).inc()
+
+
+def httpx_event_hooks(dependency: str, operation: Callable[[str], str]) -> Dict[str, List[Callable]]:
+    """
+    httpx event hooks timing each request to the first response byte; `operation(path)`
+    names the call (keep it low-cardinality). Responses with status >= 400 count as errors.
+    Transport failures never reach a response hook, so they aren't counted here.
+    """
+    def on_request(request) -> None:
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response) -> None:
+        started = response.request.extensions.get("metrics_started")
+        if started is not None:
+            observe_dependency_call(dependency, operation(response.request.url.path),
+                                    time.perf_counter() - started, error=response.status_code >= 400)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def track_active_stream(chunks: Iterable[str], name: str = "active_sse_streams") -> Iterable[str]:
+    """Wraps a streamed response body so gauge `name` counts the streams being written."""
+    gauge = get_gauge(name)
+
+    def tracked():
+        gauge.inc()
+        try:
+            yield from chunks
+        finally:
+            gauge.dec()
+
+    return tracked()
+
+
+def stats_collector(stats: Dict[str, float], label: str = "event") -> Callable[[], Dict[LabelKey, float]]:
+    """Collector callback exposing a module's stats dict, one series per key."""
+    return lambda: {((label, key),): value for key, value in list(stats.items())}
+
+
+# ------------------------------
+# Prometheus text exposition
+# ------------------------------
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text format (version 0.0.4)."""
+    with _registry_lock:
+        histograms = list(_histograms.values())
+        counters = list(_counters.values())
+        gauges = list(_gauges.values())
+        collectors = dict(_collectors)
+
+    lines: List[str] = []
+    typed = set()
+
+    def declare(name: str, kind: str) -> None:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for histogram in sorted(histograms, key=lambda h: h.name):
+        snapshot = histogram.snapshot()
+        declare(histogram.name, "histogram")
+        labels = _label_key(snapshot["labels"])
+        for upper, cumulative in snapshot["buckets"]:
+            le = "+Inf" if upper == float("inf") else repr(upper)
+            lines.append(f"{histogram.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{histogram.name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+        lines.append(f"{histogram.name}_count{_format_labels(labels)} {snapshot['count']}")
+
+    for kind, metrics in (("counter", counters), ("gauge", gauges)):
+        for metric in sorted(metrics, key=lambda m: m.name):
+            declare(metric.name, kind)
+            lines.append(f"{metric.name}{_format_labels(_label_key(metric.labels))} {_format_value(metric.value)}")
+
+    for name, (kind, callback) in sorted(collectors.items()):
+        try:
+            result = callback()
+        except Exception:
+            continue  # A broken collector must not break the scrape
+        declare(name, kind)
+        if isinstance(result, dict):
+            for labels, value in result.items():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        elif result is not None:
+            lines.append(f"{name} {_format_value(result)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,240 @@
+# app/services/profile_cache.py
+
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app, has_app_context
+
+from app.services.single_flight import cache_entry, get_or_load, single_flight
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PROFILE_CACHE_TTL_S = int(os.environ.get("PROFILE_CACHE_TTL_S", 300))
+# Version counters outlive entries so a bump is never forgotten before the entries it obsoletes
+PROFILE_VERSION_TTL_S = max(PROFILE_CACHE_TTL_S * 4, 3600)
+
+
+def get_cache():
+    """
+    The app's cache: the TieredCache wrapper when one is registered (L1 + Redis, or a
+    metrics-only pass-through), else the Flask-Caching backend, or None.
+    Flask-Caching stores {Cache: backend} in app.extensions['cache'], not the Cache
+    itself, so `current_app.extensions.get('cache')` is a dict whose .get() always misses.
+    """
+    if not has_app_context():
+        return None
+    tiered = current_app.extensions.get('tiered_cache')
+    if tiered is not None:
+        return tiered
+    registered = current_app.extensions.get('cache')
+    if isinstance(registered, dict):
+        return next(iter(registered.values()), None)
+    return registered
+
+
+# ------------------------------
+# Versioned per-user profile cache
+# ------------------------------
+# Entries are keyed by the user's current version (user_profile:<id>:v<n>). Writers bump the
+# version instead of deleting, so a reader that loaded the old row before the write can
+# only repopulate the obsolete key.
+def _version_key(user_id: str) -> str:
+    return f"user_profile_ver:{user_id}"
+
+
+def _entry_key(user_id: str, version: int) -> str:
+    return f"user_profile:{user_id}:v{version}"
+
+
+def _current_version(cache, user_id: str) -> int:
+    version = cache.get(_version_key(user_id))
+    return int(version) if version is not None else 0
+
+
+def profile_etag(profile: Dict[str, Any]) -> str:
+    """Strong ETag for a profile dict: a hash of its canonical JSON."""
+    canonical = json.dumps(profile, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def get_cached_profile_entry(user_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    {"profile": ..., "etag": ...} for the user, from cache when the current version is
+    cached, else from `loader(user_id)` (then cached). None if the user doesn't exist.
+    """
+    cache = get_cache()
+    if cache is None:
+        profile = loader(user_id)
+        return {"profile": profile, "etag": profile_etag(profile)} if profile is not None else None
+
+    version = 0
+    try:
+        version = _current_version(cache, user_id)
+        entry = cache.get(_entry_key(user_id, version))
+    except Exception as e:
+        logger.error(f"Profile cache read failed for user {user_id}: {e}")
+        entry = None
+    if isinstance(entry, dict) and "etag" in entry:
+        logger.debug(f"Profile cache hit for user {user_id} (v{version}).")
+        return entry
+
+    def load() -> Optional[Dict[str, Any]]:
+        profile = loader(user_id)
+        if profile is None:
+            return None
+        loaded = {"profile": profile, "etag": profile_etag(profile)}
+        try:
+            cache.set(_entry_key(user_id, version), loaded, timeout=PROFILE_CACHE_TTL_S)
+        except Exception as e:
+            logger.error(f"Profile cache write failed for user {user_id}: {e}")
+        return loaded
+
+    # Concurrent misses (e.g. /user polls right after a write) share one load
+    return single_flight(_entry_key(user_id, version), load)
+
+
+def get_cached_profile(user_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """The user's combined profile from cache, else `loader(user_id)` (cached when found)."""
+    entry = get_cached_profile_entry(user_id, loader)
+    return entry["profile"] if entry else None
+
+
+def _bump_version(cache, key: str) -> None:
+    cache.add(key, 0, timeout=PROFILE_VERSION_TTL_S)  # No-op when it exists; gives the counter a TTL
+    cache.inc(key)
+
+
+def invalidate_user_profile(user_id: str) -> None:
+    """Bumps the user's profile version; call after any write to users / user_profiles."""
+    cache = get_cache()
+    if cache is None or not user_id:
+        return
+    try:
+        _bump_version(cache, _version_key(user_id))
+        logger.info(f"Invalidated profile cache for user {user_id}.")
+    except Exception as e:
+        logger.error(f"Failed to invalidate profile cache for user {user_id}: {e}")
+
+
+# ------------------------------
+# Login fingerprints
+# ------------------------------
+# Last-written login fields per email (as supabase_db.login_fingerprint). A login whose
+# fingerprint matches needs no DB writes at all.
+LOGIN_FINGERPRINT_TTL_S = int(os.environ.get("LOGIN_FINGERPRINT_TTL_S", 24 * 3600))
+
+
+def _login_key(email: str) -> str:
+    return "login_fp:" + hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+def get_unchanged_login_user_id(email: str, fingerprint: str) -> Optional[str]:
+    """The cached user_id if this email last logged in with the same fingerprint, else None."""
+    cache = get_cache()
+    if cache is None or not email:
+        return None
+    try:
+        entry = cache.get(_login_key(email))
+    except Exception as e:
+        logger.error(f"Login fingerprint cache read failed: {e}")
+        return None
+    if isinstance(entry, dict) and entry.get("fingerprint") == fingerprint:
+        return entry.get("user_id")
+    return None
+
+
+def remember_login(email: str, fingerprint: str, user_id: str) -> None:
+    cache = get_cache()
+    if cache is None or not email or not user_id:
+        return
+    try:
+        cache.set(_login_key(email), {"fingerprint": fingerprint, "user_id": user_id},
+                  timeout=LOGIN_FINGERPRINT_TTL_S)
+    except Exception as e:
+        logger.error(f"Login fingerprint cache write failed: {e}")
+
+
+# ------------------------------
+# Preferences
+# ------------------------------
+# Entries are fresh for PREFERENCES_CACHE_TTL_S, then served for up to PREFERENCES_STALE_S
+# more while one refresh runs. Versioned like the profile (user_prefs:<id>:v<n>): an update
+# bumps the version, so a load or refresh that read the old rows can't bring them back.
+PREFERENCES_CACHE_TTL_S = int(os.environ.get("PREFERENCES_CACHE_TTL_S", 300))
+PREFERENCES_STALE_S = int(os.environ.get("PREFERENCES_STALE_S", 600))
+
+
+def _preferences_version_key(user_id: str) -> str:
+    return f"user_prefs_ver:{user_id}"
+
+
+def preferences_cache_key(user_id: str, version: int) -> str:
+    return f"user_prefs:{user_id}:v{version}"
+
+
+def get_cached_preferences(user_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    The user's preferences from cache, else `loader(user_id)`; concurrent misses across
+    requests and workers share one load. None if the loader fails.
+    """
+    cache = get_cache()
+    version = 0
+    if cache is not None:
+        try:
+            version = int(cache.get(_preferences_version_key(user_id)) or 0)
+        except Exception as e:
+            logger.error(f"Preferences version read failed for user {user_id}: {e}")
+    return get_or_load(cache, preferences_cache_key(user_id, version), lambda: loader(user_id),
+                       PREFERENCES_CACHE_TTL_S, PREFERENCES_STALE_S)
+
+
+def invalidate_user_preferences(user_id: str) -> None:
+    """Bumps the user's preferences version; call after any preference write."""
+    cache = get_cache()
+    if cache is None or not user_id:
+        return
+    try:
+        _bump_version(cache, _preferences_version_key(user_id))
+        logger.info(f"Invalidated preferences cache for user {user_id}.")
+    except Exception as e:
+        logger.error(f"Failed to invalidate preferences cache for user {user_id}: {e}")
+
+
+def warm_user_preferences(user_ids: List[str]) -> int:
+    """
+    Loads preferences for `user_ids` in one bulk query and writes the ones not yet cached.
+    Returns how many entries were written.
+    """
+    cache = get_cache()
+    if cache is None or not user_ids:
+        return 0
+    try:
+        versions = cache.get_many(*[_preferences_version_key(uid) for uid in user_ids])
+        key_list = [preferences_cache_key(uid, int(version or 0)) for uid, version in zip(user_ids, versions)]
+        cached = cache.get_many(*key_list)
+    except Exception as e:
+        logger.error(f"Preferences cache read failed during warm-up: {e}")
+        return 0
+    keys = dict(zip(user_ids, key_list))
+    missing = [uid for uid, value in zip(user_ids, cached) if not isinstance(value, dict) or "value" not in value]
+    if not missing:
+        return 0
+
+    from app.api.supabase_db import get_user_preferences_bulk  # supabase_db imports this module
+
+    preferences = get_user_preferences_bulk(missing)
+    if not preferences:
+        return 0
+    try:
+        cache.set_many({keys[uid]: cache_entry(prefs, PREFERENCES_CACHE_TTL_S)
+                        for uid, prefs in preferences.items()},
+                       timeout=PREFERENCES_CACHE_TTL_S + PREFERENCES_STALE_S)
+    except Exception as e:
+        logger.error(f"Preferences cache write failed during warm-up: {e}")
+        return 0
+    logger.info(f"Warmed preferences cache for {len(preferences)} user(s).")
+    return len(preferences)
@@ -0,0 +1,150 @@
+# app/services/profiler.py
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Statistical profiler: a timer thread samples every thread's stack (sys._current_frames) and
+# counts collapsed stacks ("outer;inner;leaf count", the flamegraph.pl / speedscope input).
+# Nothing runs unless a profile was requested.
+PROFILES_DIR = os.environ.get("PROFILES_DIR", "data/profiles")
+DEFAULT_INTERVAL_S = 0.01  # ~2x the interpreter's 5 ms switch interval, so sampling doesn't hog the GIL
+MAX_DURATION_S = float(os.environ.get("PROFILE_MAX_DURATION_S", 60))
+MAX_SAVED_PROFILES = 50
+# Leaf functions of threads parked on I/O or locks; skipped unless include_idle is set
+# (C calls such as lock.acquire or time.sleep have no frame, so their Python callers are listed)
+IDLE_LEAVES = {"wait", "select", "poll", "accept", "readinto", "_wait_for_tstate_lock", "_worker",
+               "get_message", "serve_forever"}
+_PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.folded$")
+
+_run_lock = threading.Lock()  # One profile at a time per worker
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}".replace(";", ",")
+
+
+def _collapse(frame) -> List[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Samples all other threads' stacks every interval_s for duration_s seconds."""
+
+    def __init__(self, duration_s: float, interval_s: float = DEFAULT_INTERVAL_S, include_idle: bool = False):
+        self.duration_s = min(max(duration_s, 0.1), MAX_DURATION_S)
+        self.interval_s = max(interval_s, 0.001)
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.overruns = 0  # Ticks that took longer than the interval (sampling fell behind)
+
+    def _sample(self, own_ident: int, thread_names: Dict[int, str]) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not self.include_idle and frame.f_code.co_name in IDLE_LEAVES:
+                continue
+            labels = _collapse(frame)
+            thread_name = thread_names.get(ident, "thread").replace(";", ",")
+            # Thread names like "background-job_3" are grouped by prefix
+            self.stacks[";".join([re.sub(r"[_-]\d+$", "", thread_name)] + labels)] += 1
+        self.samples += 1
+
+    def run(self) -> "SamplingProfiler":
+        """Blocks for duration_s while sampling from a separate thread."""
+        def loop():
+            own = threading.get_ident()
+            deadline = time.perf_counter() + self.duration_s
+            next_tick = time.perf_counter()
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                names = {t.ident: t.name for t in threading.enumerate()}
+                self._sample(own, names)
+                next_tick += self.interval_s
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.overruns += 1
+                    next_tick = time.perf_counter()
+
+        sampler = threading.Thread(target=loop, name="sampling-profiler", daemon=True)
+        sampler.start()
+        sampler.join()
+        return self
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+def run_profile(duration_s: float, interval_s: float = DEFAULT_INTERVAL_S,
+                include_idle: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Profiles this worker for duration_s and saves the collapsed stacks under PROFILES_DIR.
+    Returns {"name", "samples", "stacks", "collapsed"}, or None if a profile is already running.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        started = time.time()
+        profiler = SamplingProfiler(duration_s, interval_s, include_idle).run()
+        collapsed = profiler.collapsed()
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(started))}-pid{os.getpid()}.folded"
+        try:
+            directory = Path(PROFILES_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / name).write_text(collapsed, encoding="utf-8")
+            _prune_saved_profiles(directory)
+        except OSError as e:
+            logger.error(f"Could not save profile {name}: {e}")
+        logger.info(f"Profiled worker {os.getpid()} for {profiler.duration_s:g}s: {profiler.samples} ticks, "
+                    f"{len(profiler.stacks)} distinct stacks, {profiler.overruns} overruns.")
+        return {"name": name, "duration_s": profiler.duration_s, "interval_s": profiler.interval_s,
+                "samples": profiler.samples, "overruns": profiler.overruns,
+                "stacks": len(profiler.stacks), "collapsed": collapsed}
+    finally:
+        _run_lock.release()
+
+
+def _prune_saved_profiles(directory: Path) -> None:
+    saved = sorted(directory.glob("*.folded"))
+    for old in saved[:-MAX_SAVED_PROFILES]:
+        old.unlink(missing_ok=True)
+
+
+def list_saved_profiles() -> List[Dict[str, Any]]:
+    directory = Path(PROFILES_DIR)
+    if not directory.is_dir():
+        return []
+    return [{"name": p.name, "size": p.stat().st_size} for p in sorted(directory.glob("*.folded"), reverse=True)]
+
+
+def is_profile_name(name: str) -> bool:
+    return bool(_PROFILE_NAME_RE.match(name))
+
+
+def read_saved_profile(name: str) -> Optional[str]:
+    """Collapsed stacks of a saved profile, or None if the name is invalid or unknown."""
+    if not is_profile_name(name):
+        return None
+    path = Path(PROFILES_DIR) / name
+    return path.read_text(encoding="utf-8") if path.is_file() else None
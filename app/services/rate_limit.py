@@ -0,0 +1,70 @@
+# app/services/rate_limit.py
+
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate_per_s` tokens are added per second up to `capacity`.
+
+    `reserve()` takes tokens immediately (the balance may go negative) and returns how
+    long the caller must wait, so concurrent callers queue up fairly instead of polling.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        if rate_per_s <= 0 or capacity <= 0:
+            raise ValueError("rate_per_s and capacity must be positive")
+        self.rate_per_s = float(rate_per_s)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Takes `tokens` and returns the seconds to wait before using them."""
+        with self._lock:
+            self._refill_locked()
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_s
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes `tokens` only if they are available right now."""
+        with self._lock:
+            self._refill_locked()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def penalize(self, seconds: float) -> None:
+        """Empties the bucket for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._refill_locked()
+            self._tokens = min(self._tokens, -seconds * self.rate_per_s)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill_locked()
+            return self._tokens
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Blocks until `tokens` are available; returns the time waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Awaits until `tokens` are available; returns the time waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
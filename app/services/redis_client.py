@@ -0,0 +1,77 @@
+# app/services/redis_client.py
+
+import os
+import time
+import logging
+import threading
+
+try:
+    import redis
+except ImportError:  # Redis-backed features fall back to per-process state
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# SESSION_REDIS_URL wins; otherwise the Flask-Caching Redis URL is shared.
+REDIS_URL = os.environ.get("SESSION_REDIS_URL") or os.environ.get("REDIS_URL") or os.environ.get("CACHE_REDIS_URL")
+REDIS_SOCKET_TIMEOUT_S = float(os.environ.get("REDIS_SOCKET_TIMEOUT_S", 0.5))
+REDIS_RETRY_INTERVAL_S = 30.0  # After a failed connect, don't retry on every call
+
+_lock = threading.Lock()
+_client = None
+_last_failure = 0.0
+
+
+def get_redis():
+    """
+    Returns a shared redis.Redis client (decode_responses=True), or None when the
+    package isn't installed, no URL is configured, or the server was unreachable
+    within the last REDIS_RETRY_INTERVAL_S. Callers must handle None.
+    """
+    global _client, _last_failure
+    if redis is None or not REDIS_URL:
+        return None
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is not None:
+            return _client
+        if time.monotonic() - _last_failure < REDIS_RETRY_INTERVAL_S:
+            return None
+        try:
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True,
+                                          socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+                                          socket_connect_timeout=REDIS_SOCKET_TIMEOUT_S,
+                                          health_check_interval=30)
+            client.ping()
+            _client = client
+            logger.info(f"Connected to Redis at {REDIS_URL}")
+        except Exception as e:
+            _last_failure = time.monotonic()
+            logger.warning(f"Redis unavailable at {REDIS_URL}, using in-process state: {e}")
+    return _client
+
+
+def reset_redis(failed: bool = False) -> None:
+    """Drops the shared client (e.g. after a connection error) so the next call reconnects."""
+    global _client, _last_failure
+    with _lock:
+        _client = None
+        if failed:
+            _last_failure = time.monotonic()
+
+
+def new_redis_client(**overrides):
+    """
+    A dedicated, unshared client (e.g. for a pub/sub listener that blocks on its socket),
+    or None when Redis isn't configured. Keyword arguments override the connection defaults.
+    """
+    if redis is None or not REDIS_URL:
+        return None
+    options = dict(decode_responses=True,
+                   socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+                   socket_connect_timeout=REDIS_SOCKET_TIMEOUT_S,
+                   health_check_interval=30)
+    options.update(overrides)
+    return redis.Redis.from_url(REDIS_URL, **options)
@@ -0,0 +1,295 @@
+# app/services/session_history.py
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.redis_client import get_redis, reset_redis
+from app.services.metrics import register_collector, stats_collector
+from app.services.memory_diagnostics import register_memory_report
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Recent voice interactions per session, written through by store_voice_interaction so the
+# chat path can build its context without querying voice_interactions.
+#   auto   - same as redis
+#   redis  - Redis only (shared by all workers); reads go to Supabase while Redis is down
+#   memory - in-process only; correct for a single worker (as SimpleCache). Never used as a
+#            fallback: other workers' appends don't reach it, so it would serve gaps as complete.
+#   off    - disabled, every read goes to Supabase
+SESSION_HISTORY_BACKEND = os.environ.get("SESSION_HISTORY_BACKEND", "auto").lower()
+SESSION_HISTORY_MAX_ITEMS = int(os.environ.get("SESSION_HISTORY_MAX_ITEMS", 40))
+SESSION_HISTORY_TTL_S = int(os.environ.get("SESSION_HISTORY_TTL_S", 6 * 3600))
+SESSION_HISTORY_MAX_SESSIONS = int(os.environ.get("SESSION_HISTORY_MAX_SESSIONS", 2000))
+KEY_PREFIX = "session_history"
+
+HISTORY_FIELDS = ("interaction_type", "user_speech", "agent_response", "timestamp")
+
+stats = {"hits": 0, "misses": 0, "hydrations": 0, "hydration_conflicts": 0, "appends": 0,
+         "invalidations": 0}
+register_collector("session_history_events_total", stats_collector(stats), kind="counter")
+
+
+def _history_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: row.get(field) for field in HISTORY_FIELDS}
+
+
+# ------------------------------
+# In-process backend
+# ------------------------------
+class _Ring:
+    __slots__ = ("items", "complete", "version", "expires_at")
+
+    def __init__(self):
+        self.items = deque(maxlen=SESSION_HISTORY_MAX_ITEMS)
+        self.complete = False  # True once the ring holds the session's full recent tail
+        self.version = 0       # Bumped by every append; hydration installs only if unchanged
+        self.expires_at = 0.0
+
+
+class _MemoryHistory:
+    def __init__(self):
+        self._rings: "OrderedDict[str, _Ring]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ring(self, session_id: str, create: bool) -> Optional[_Ring]:
+        ring = self._rings.get(session_id)
+        now = time.monotonic()
+        if ring is not None and ring.expires_at < now:
+            del self._rings[session_id]
+            ring = None
+        if ring is None and create:
+            ring = self._rings[session_id] = _Ring()
+            while len(self._rings) > SESSION_HISTORY_MAX_SESSIONS:
+                self._rings.popitem(last=False)
+        if ring is not None:
+            self._rings.move_to_end(session_id)
+            if create:
+                ring.expires_at = now + SESSION_HISTORY_TTL_S
+        return ring
+
+    def append(self, session_id: str, row: Dict[str, Any]) -> None:
+        with self._lock:
+            ring = self._ring(session_id, create=True)
+            ring.items.append(row)
+            ring.version += 1
+
+    def mark_complete(self, session_id: str) -> None:
+        with self._lock:
+            self._ring(session_id, create=True).complete = True
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._rings.pop(session_id, None)
+
+    def recent(self, session_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            ring = self._ring(session_id, create=False)
+            if ring is None or not ring.complete:
+                return None
+            items = list(ring.items)
+        return items[-limit:] if limit else []
+
+    def hydrate(self, session_id: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            ring = self._ring(session_id, create=True)
+            version = ring.version
+        rows = loader()
+        with self._lock:
+            ring = self._ring(session_id, create=True)
+            if ring.version != version:
+                stats["hydration_conflicts"] += 1  # An append raced the load; next read retries
+                return rows
+            ring.items.clear()
+            ring.items.extend(rows)
+            ring.complete = True
+        return rows
+
+
+# ------------------------------
+# Redis backend
+# ------------------------------
+class _RedisHistory:
+    """A capped list per session plus a 'complete' flag, both expiring after SESSION_HISTORY_TTL_S."""
+
+    def __init__(self, client):
+        self._client = client
+
+    @staticmethod
+    def _keys(session_id: str):
+        key = f"{KEY_PREFIX}:{session_id}"
+        return key, f"{key}:complete"
+
+    def append(self, session_id: str, row: Dict[str, Any]) -> None:
+        key, flag = self._keys(session_id)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.rpush(key, json.dumps(row, default=str))
+        pipe.ltrim(key, -SESSION_HISTORY_MAX_ITEMS, -1)
+        pipe.expire(key, SESSION_HISTORY_TTL_S)
+        pipe.expire(flag, SESSION_HISTORY_TTL_S)
+        pipe.execute()
+
+    def mark_complete(self, session_id: str) -> None:
+        # NX: never clear entries another worker appended after the session was created
+        self._client.set(self._keys(session_id)[1], 1, ex=SESSION_HISTORY_TTL_S, nx=True)
+
+    def invalidate(self, *session_ids: str) -> None:
+        """Drops the histories (and 'complete' flags) so the next read re-hydrates from Supabase."""
+        self._client.delete(*[key for session_id in session_ids for key in self._keys(session_id)])
+
+    def recent(self, session_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        key, flag = self._keys(session_id)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.exists(flag)
+        pipe.lrange(key, -limit, -1)
+        complete, raw = pipe.execute()
+        if not complete:
+            return None
+        return [json.loads(item) for item in raw] if limit else []
+
+    def hydrate(self, session_id: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        import redis  # Only reached when get_redis() returned a client
+
+        key, flag = self._keys(session_id)
+        with self._client.pipeline() as pipe:
+            pipe.watch(key)
+            rows = loader()
+            try:
+                pipe.multi()
+                pipe.delete(key)
+                if rows:
+                    pipe.rpush(key, *[json.dumps(row, default=str) for row in rows[-SESSION_HISTORY_MAX_ITEMS:]])
+                    pipe.expire(key, SESSION_HISTORY_TTL_S)
+                pipe.set(flag, 1, ex=SESSION_HISTORY_TTL_S)
+                pipe.execute()
+            except redis.WatchError:
+                stats["hydration_conflicts"] += 1  # An append raced the load; next read retries
+        return rows
+
+
+_memory = _MemoryHistory()
+register_memory_report("session_history.memory", lambda: _memory._rings)
+# Sessions whose Redis history missed an append while Redis was failing; their 'complete'
+# flag is dropped as soon as Redis answers again, before any read is served from it.
+_missed: "OrderedDict[str, None]" = OrderedDict()
+_missed_lock = threading.Lock()
+
+
+def _backend():
+    if SESSION_HISTORY_BACKEND == "memory":
+        return _memory
+    if SESSION_HISTORY_BACKEND in ("auto", "redis"):
+        client = get_redis()
+        if client is not None:
+            return _RedisHistory(client)
+    return None
+
+
+def _redis_failed(backend, action: str, session_id: str, e: Exception) -> None:
+    logger.warning(f"Session history {action} failed for session (hash) {session_id[:8]}...: {e}")
+    if isinstance(backend, _RedisHistory):
+        reset_redis(failed=True)
+
+
+def _remember_missed(session_id: str) -> None:
+    with _missed_lock:
+        _missed[session_id] = None
+        _missed.move_to_end(session_id)
+        while len(_missed) > SESSION_HISTORY_MAX_SESSIONS:
+            _missed.popitem(last=False)  # Left to expire with SESSION_HISTORY_TTL_S
+
+
+def _invalidate_missed(backend: "_RedisHistory") -> None:
+    """Drops the histories that missed appends. Raises (keeping them queued) if Redis fails."""
+    with _missed_lock:
+        session_ids = list(_missed)
+        _missed.clear()
+    if not session_ids:
+        return
+    try:
+        backend.invalidate(*session_ids)
+        stats["invalidations"] += len(session_ids)
+    except Exception:
+        for session_id in session_ids:
+            _remember_missed(session_id)
+        raise
+
+
+# ------------------------------
+# Public API
+# ------------------------------
+def record_interaction(session_id: str, row: Dict[str, Any]) -> None:
+    """Write-through of a stored voice_interactions row. Never raises."""
+    if SESSION_HISTORY_BACKEND == "off" or not session_id:
+        return
+    backend = _backend()
+    if backend is None:
+        _remember_missed(session_id)  # Redis is down; its copy of this session now has a gap
+        return
+    try:
+        backend.append(session_id, _history_row(row))
+        stats["appends"] += 1
+    except Exception as e:
+        _redis_failed(backend, "append", session_id, e)
+        try:
+            backend.invalidate(session_id)  # Best effort; otherwise dropped once Redis is back
+            stats["invalidations"] += 1
+        except Exception:
+            _remember_missed(session_id)
+
+
+def mark_new_session(session_id: str) -> None:
+    """A just-created session has no earlier interactions, so its (empty) history is complete."""
+    backend = _backend()
+    if backend is None or not session_id:
+        return
+    try:
+        backend.mark_complete(session_id)
+    except Exception as e:
+        _redis_failed(backend, "mark", session_id, e)
+
+
+def get_recent_interactions(session_id: str, limit: int,
+                            loader: Callable[[int], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    The last `limit` interactions of a session, oldest first. Served from the history
+    buffer when it holds the session; on a cold miss `loader(n)` (newest n rows from
+    Supabase, oldest first) is called once and its result installs the buffer.
+    """
+    backend = _backend()
+    if backend is None or limit > SESSION_HISTORY_MAX_ITEMS:
+        return loader(limit)
+
+    try:
+        if isinstance(backend, _RedisHistory):
+            _invalidate_missed(backend)
+        rows = backend.recent(session_id, limit)
+    except Exception as e:
+        _redis_failed(backend, "read", session_id, e)
+        return loader(limit)
+    if rows is not None:
+        stats["hits"] += 1
+        return rows
+
+    stats["misses"] += 1
+    load_state: Dict[str, Any] = {"started": False, "rows": None}
+
+    def load() -> List[Dict[str, Any]]:
+        load_state["started"] = True
+        load_state["rows"] = [_history_row(row) for row in loader(SESSION_HISTORY_MAX_ITEMS)]
+        return load_state["rows"]
+
+    try:
+        rows = backend.hydrate(session_id, load)
+        stats["hydrations"] += 1
+    except Exception as e:
+        if load_state["started"] and load_state["rows"] is None:
+            raise  # The Supabase load itself failed
+        _redis_failed(backend, "hydrate", session_id, e)
+        rows = load_state["rows"] if load_state["rows"] is not None else loader(limit)
+    return rows[-limit:] if limit else []
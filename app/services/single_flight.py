@@ -0,0 +1,203 @@
+# app/services/single_flight.py
+
+import os
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Set
+
+from flask import current_app, has_app_context
+
+from app.services.redis_client import get_redis
+from app.services.metrics import register_collector, stats_collector
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Concurrent misses for one key share a single load: in-process callers wait on the leader's
+# result, and other workers wait (polling the cache) while a short Redis lock is held.
+FLIGHT_WAIT_S = float(os.environ.get("SINGLE_FLIGHT_WAIT_S", 5.0))
+PEER_LOCK_MS = int(os.environ.get("SINGLE_FLIGHT_LOCK_MS", 5000))
+PEER_POLL_S = 0.05
+
+# Compare-and-delete so a loader that outlived its lock can't release a newer holder's lock
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# ------------------------------
+# Cache entries
+# ------------------------------
+# Values are wrapped as {"value": ..., "fresh_until": <epoch s>} and stored for
+# fresh_s + stale_s: between fresh_until and expiry the value is served while it's refreshed.
+def cache_entry(value: Any, fresh_s: float) -> Dict[str, Any]:
+    return {"value": value, "fresh_until": time.time() + fresh_s}
+
+
+def _is_entry(entry: Any) -> bool:
+    return isinstance(entry, dict) and "value" in entry and "fresh_until" in entry
+
+
+# ------------------------------
+# In-process single flight
+# ------------------------------
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+_refreshing: Set[str] = set()  # Keys with a background refresh thread in this process
+stats = {"loads": 0, "shared": 0, "peer_waits": 0, "stale_served": 0, "refreshes": 0}
+register_collector("single_flight_events_total", stats_collector(stats), kind="counter")
+
+
+def single_flight(key: str, fn: Callable[[], Any]) -> Any:
+    """
+    Runs fn() once per key across concurrent callers in this process; the others get the
+    leader's result (or exception). A caller that waits longer than FLIGHT_WAIT_S runs fn() itself.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        stats["shared"] += 1
+        if flight.done.wait(FLIGHT_WAIT_S):
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        logger.warning(f"Single-flight wait for '{key}' timed out after {FLIGHT_WAIT_S}s; loading directly.")
+        return fn()
+
+    try:
+        flight.value = fn()
+        return flight.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# ------------------------------
+# Cross-worker lock
+# ------------------------------
+def _acquire_peer_lock(key: str) -> Optional[str]:
+    """Lock token if acquired, "" if another worker holds it, None if Redis isn't available."""
+    client = get_redis()
+    if client is None:
+        return None
+    token = uuid.uuid4().hex
+    try:
+        return token if client.set(f"lock:{key}", token, nx=True, px=PEER_LOCK_MS) else ""
+    except Exception as e:
+        logger.warning(f"Single-flight lock for '{key}' unavailable, loading without it: {e}")
+        return None
+
+
+def _release_peer_lock(key: str, token: str) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+    except Exception as e:
+        logger.warning(f"Failed to release single-flight lock for '{key}' (expires in {PEER_LOCK_MS} ms): {e}")
+
+
+def _wait_for_peer(cache, key: str) -> Optional[Dict[str, Any]]:
+    """Polls for the entry another worker is loading; None if it doesn't appear in time."""
+    stats["peer_waits"] += 1
+    deadline = time.monotonic() + PEER_LOCK_MS / 1000
+    while time.monotonic() < deadline:
+        time.sleep(PEER_POLL_S)
+        try:
+            entry = cache.get(key)
+        except Exception:
+            return None
+        if _is_entry(entry) and entry["fresh_until"] > time.time():
+            return entry
+    return None
+
+
+def _load_and_store(cache, key: str, loader: Callable[[], Any], fresh_s: float, stale_s: float,
+                    refreshing: bool = False) -> Any:
+    token = _acquire_peer_lock(key)
+    if token == "":
+        if refreshing:
+            return None  # Another worker is already refreshing this key
+        entry = _wait_for_peer(cache, key)
+        if entry is not None:
+            return entry["value"]
+        logger.warning(f"Peer load of '{key}' didn't finish within {PEER_LOCK_MS} ms; loading directly.")
+    try:
+        stats["loads"] += 1
+        value = loader()
+        if value is not None:
+            try:
+                cache.set(key, cache_entry(value, fresh_s), timeout=int(fresh_s + stale_s))
+            except Exception as e:
+                logger.error(f"Cache set failed for '{key}': {e}")
+        return value
+    finally:
+        if token:
+            _release_peer_lock(key, token)
+
+
+def _refresh_in_background(cache, key: str, loader: Callable[[], Any], fresh_s: float, stale_s: float) -> None:
+    with _flights_lock:
+        if key in _flights or key in _refreshing:
+            return  # A load or refresh for this key is already running here
+        _refreshing.add(key)
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def refresh():
+        try:
+            stats["refreshes"] += 1
+            if app is not None:
+                with app.app_context():
+                    single_flight(key, lambda: _load_and_store(cache, key, loader, fresh_s, stale_s, refreshing=True))
+            else:
+                single_flight(key, lambda: _load_and_store(cache, key, loader, fresh_s, stale_s, refreshing=True))
+        except Exception as e:
+            logger.error(f"Background refresh of '{key}' failed; the stale value stays until expiry: {e}")
+        finally:
+            with _flights_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, name=f"refresh:{key}", daemon=True).start()
+
+
+def get_or_load(cache, key: str, loader: Callable[[], Any], fresh_s: float, stale_s: float = 0) -> Any:
+    """
+    The cached value for `key`, loading it with `loader()` on a miss (None results aren't cached).
+    Concurrent misses share one load per process and, with Redis, per key across workers.
+    A value past fresh_s but within fresh_s + stale_s is returned at once while one refresh runs.
+    """
+    if cache is None:
+        return loader()
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        logger.error(f"Cache get failed for '{key}': {e}")
+        entry = None
+    if _is_entry(entry):
+        if entry["fresh_until"] > time.time():
+            return entry["value"]
+        stats["stale_served"] += 1
+        _refresh_in_background(cache, key, loader, fresh_s, stale_s)
+        return entry["value"]
+    return single_flight(key, lambda: _load_and_store(cache, key, loader, fresh_s, stale_s))
@@ -0,0 +1,391 @@
+# app/services/streaming_ingest.py
+
+import re
+import json
+import codecs
+import logging
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.artifact_store import ArtifactRef, ArtifactWriter
+
+try:
+    import ijson
+except ImportError:  # The stdlib tokenizer below is used instead
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Arrays and long strings that are spooled compressed instead of built in memory, by
+# path from the body root. Vapi wraps events in {"message": {...}}; bare events are accepted too.
+DEFAULT_SPOOL_ROUTES: Dict[Tuple[str, ...], str] = {
+    ("message", "artifact", "messages"): "messages",
+    ("message", "artifact", "messagesOpenAIFormatted"): "messages_openai",
+    ("message", "messages"): "messages_top",
+    ("artifact", "messages"): "messages",
+    ("artifact", "messagesOpenAIFormatted"): "messages_openai",
+    ("messages",): "messages_top",
+    ("message", "transcript"): "transcript",
+    ("message", "artifact", "transcript"): "artifact_transcript",
+    ("transcript",): "transcript",
+    ("artifact", "transcript"): "artifact_transcript",
+}
+
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_SCALAR_RUN_RE = re.compile(r"[0-9a-zA-Z+\-.]*")
+_LITERALS = {"true": ("boolean", True), "false": ("boolean", False), "null": ("null", None)}
+
+
+# ------------------------------
+# Tokenizer (stdlib fallback for ijson.basic_parse)
+# ------------------------------
+class _JsonTokenizer:
+    """
+    Incremental JSON tokenizer producing ijson-style basic events
+    (start_map, map_key, end_map, start_array, end_array, string, number, boolean, null).
+    Strings longer than a read chunk arrive as "string_part" events followed by a final
+    "string", so only about one chunk of the body is buffered at a time.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = READ_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return bool(chunk) or bool(text)
+
+    def _next_char(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _read_string(self, allow_parts: bool) -> Iterator[str]:
+        """
+        Yields the decoded string. With `allow_parts`, a string longer than the read
+        chunk is yielded in pieces as it arrives instead of being buffered whole.
+        """
+        self._pos += 1  # Opening quote
+        scan = self._pos
+        while True:
+            end = self._buf.find('"', scan)
+            if end != -1:
+                backslashes = 0
+                while end - 1 - backslashes >= self._pos and self._buf[end - 1 - backslashes] == "\\":
+                    backslashes += 1
+                if backslashes % 2 == 1:
+                    scan = end + 1
+                    continue
+                yield self._decode(self._buf[self._pos:end])
+                self._pos = end + 1
+                return
+            if allow_parts and len(self._buf) - self._pos > self._chunk_size:
+                # Cut well clear of any escape so \uXXXX pairs are never split
+                cut = len(self._buf) - 12
+                while cut > self._pos and "\\" in self._buf[max(self._pos, cut - 12):cut]:
+                    cut = self._buf.rindex("\\", max(self._pos, cut - 12), cut)
+                if cut > self._pos:
+                    yield self._decode(self._buf[self._pos:cut])
+                    self._pos = cut
+            scan = len(self._buf) - self._pos
+            if not self._fill():
+                raise ValueError("Unterminated string in JSON body.")
+            scan += self._pos  # _fill rebased the buffer onto self._pos
+
+    @staticmethod
+    def _decode(raw: str) -> str:
+        return json.loads(f'"{raw}"') if "\\" in raw else raw
+
+    def _read_scalar(self) -> Tuple[str, Any]:
+        # Take the whole run of number/literal characters; a run that touches the end
+        # of the buffer may continue in the next read.
+        while True:
+            match = _SCALAR_RUN_RE.match(self._buf, self._pos)
+            if match.end() == len(self._buf) and self._fill():
+                continue
+            break
+        text = match.group()
+        self._pos = match.end()
+        if text in _LITERALS:
+            return _LITERALS[text]
+        if _NUMBER_RE.fullmatch(text):
+            return "number", float(text) if any(c in text for c in ".eE") else int(text)
+        raise ValueError(f"Unexpected token {text[:20] or self._buf[self._pos:self._pos + 1]!r} in JSON body.")
+
+    def _close(self, containers: List[str], kind: str) -> None:
+        if not containers or containers[-1] != kind:
+            raise ValueError(f"Unexpected {self._buf[self._pos]!r} in JSON body.")
+        self._pos += 1
+        containers.pop()
+
+    def events(self) -> Iterator[Tuple[str, Any]]:
+        containers: List[str] = []
+        expect_key = False
+        while True:
+            c = self._next_char()
+            if not c:
+                if containers:
+                    raise ValueError("Truncated JSON body.")
+                return
+            if c == "{":
+                self._pos += 1
+                containers.append("map")
+                expect_key = True
+                yield "start_map", None
+            elif c == "}":
+                self._close(containers, "map")
+                expect_key = False
+                yield "end_map", None
+            elif c == "[":
+                self._pos += 1
+                containers.append("array")
+                yield "start_array", None
+            elif c == "]":
+                self._close(containers, "array")
+                yield "end_array", None
+            elif c == ",":
+                self._pos += 1
+                expect_key = bool(containers) and containers[-1] == "map"
+            elif c == ":":
+                self._pos += 1
+            elif c == '"':
+                if expect_key:
+                    expect_key = False
+                    yield "map_key", "".join(self._read_string(allow_parts=False))
+                else:
+                    previous = None
+                    for piece in self._read_string(allow_parts=True):
+                        if previous is not None:
+                            yield "string_part", previous
+                        previous = piece
+                    yield "string", previous
+            else:
+                yield self._read_scalar()
+
+
+def basic_events(stream: BinaryIO) -> Iterable[Tuple[str, Any]]:
+    """ijson's C/Python backend when installed, otherwise the stdlib tokenizer."""
+    if ijson is not None:
+        return _ijson_events(stream)
+    return _JsonTokenizer(stream).events()
+
+
+def _ijson_events(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    # ijson's parse errors aren't ValueErrors; callers treat ValueError as a malformed body
+    try:
+        yield from ijson.basic_parse(stream, use_float=True)
+    except ijson.JSONError as e:
+        raise ValueError(f"Malformed JSON body: {e}") from e
+
+
+# ------------------------------
+# Assembly with spooled arrays
+# ------------------------------
+class _ObjectBuilder:
+    """Builds a Python value from basic events (as ijson.common.ObjectBuilder)."""
+
+    def __init__(self):
+        self.value: Any = None
+        self._containers: List[Any] = []
+        self._keys: List[Optional[str]] = []
+        self._parts: List[str] = []
+
+    def _add(self, value: Any) -> None:
+        if not self._containers:
+            self.value = value
+        elif isinstance(self._containers[-1], list):
+            self._containers[-1].append(value)
+        else:
+            self._containers[-1][self._keys[-1]] = value
+
+    def event(self, event: str, value: Any) -> None:
+        if event == "map_key":
+            self._keys[-1] = value
+        elif event == "string_part":
+            self._parts.append(value)
+        elif event == "string" and self._parts:
+            self._parts.append(value)
+            self._add("".join(self._parts))
+            self._parts = []
+        elif event in ("start_map", "start_array"):
+            container = {} if event == "start_map" else []
+            self._add(container)
+            self._containers.append(container)
+            self._keys.append(None)
+        elif event in ("end_map", "end_array"):
+            self._containers.pop()
+            self._keys.pop()
+        else:
+            self._add(value)
+
+
+@dataclass
+class _Spool:
+    path: Tuple[str, ...]
+    writer: ArtifactWriter
+    items: int = 0
+    is_text: bool = False
+
+
+@dataclass
+class IngestedBody:
+    """
+    A JSON body parsed with its large arrays diverted into compressed spools.
+    `payload` holds everything else; call commit(), rehydrate() or discard() once.
+    """
+    payload: Dict[str, Any]
+    spools: Dict[str, _Spool] = field(default_factory=dict)
+    bytes_read: int = 0
+
+    def commit(self, names: Iterable[str]) -> Dict[str, ArtifactRef]:
+        """Stores the named spools as artifacts and drops the rest."""
+        names = set(names)
+        refs = {}
+        for name, spool in self.spools.items():
+            if name in names:
+                refs[name] = spool.writer.commit()
+            else:
+                spool.writer.abort()
+        self.spools = {}
+        return refs
+
+    def rehydrate(self) -> None:
+        """Puts spooled arrays back into the payload, for events that need them in memory."""
+        for spool in self.spools.values():
+            content = b"".join(spool.writer.iter_spooled())
+            value = content.decode("utf-8") if spool.is_text else json.loads(content)
+            spool.writer.abort()
+            target = self.payload
+            for key in spool.path[:-1]:
+                target = target.setdefault(key, {})
+            target[spool.path[-1]] = value
+        self.spools = {}
+
+    def discard(self) -> None:
+        for spool in self.spools.values():
+            spool.writer.abort()
+        self.spools = {}
+
+
+class _CountingReader:
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def ingest_json_stream(stream: BinaryIO, routes: Optional[Dict[Tuple[str, ...], str]] = None) -> IngestedBody:
+    """
+    Parses a JSON object from `stream` incrementally. Arrays at `routes` paths are
+    written item by item, and strings piece by piece, into compressed spools
+    (ArtifactWriter) instead of being built, so peak memory is bounded by the largest
+    single message, not by the body size.
+    """
+    routes = DEFAULT_SPOOL_ROUTES if routes is None else routes
+    reader = _CountingReader(stream)
+    root = _ObjectBuilder()
+    spools: Dict[str, _Spool] = {}
+
+    path: List[str] = []           # Path of the value about to start
+    spool: Optional[_Spool] = None  # Active spooled array
+    text: Optional[_Spool] = None   # Active spooled string
+    item: Optional[_ObjectBuilder] = None
+    depth = 0                       # Nesting depth inside the current spooled item
+
+    try:
+        for event, value in basic_events(reader):
+            if spool is not None:
+                if depth == 0 and event == "end_array":
+                    spool.writer.write(b"]")
+                    spool.writer.finish()
+                    spool = None
+                    path.pop()
+                    continue
+                if item is None:
+                    item = _ObjectBuilder()
+                item.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+                # A top-level string longer than a read chunk arrives as string_part events
+                # and is only complete at its final "string" event
+                if depth == 0 and event != "string_part":
+                    spool.writer.write((b"," if spool.items else b"") +
+                                       json.dumps(item.value, separators=(",", ":")).encode("utf-8"))
+                    spool.items += 1
+                    item = None
+                continue
+
+            if text is not None:
+                text.writer.write(value)
+                if event == "string":
+                    text.writer.finish()
+                    text = None
+                continue
+
+            if event == "map_key":
+                path[-1] = value
+                root.event(event, value)
+                continue
+            if event in ("end_map", "end_array"):
+                path.pop()
+                root.event(event, value)
+                continue
+
+            # A value starts at `current`
+            current = tuple(path)
+            if event == "start_array" and current in routes:
+                name = routes[current]
+                writer = ArtifactWriter(name, content_type="application/json")
+                writer.write(b"[")
+                spool = spools[name] = _Spool(current, writer)
+                path.append("item")
+                continue
+            if event in ("string_part", "string") and current in routes:
+                name = routes[current]
+                text = spools[name] = _Spool(current, ArtifactWriter("transcript"), is_text=True)
+                text.writer.write(value)
+                if event == "string":
+                    text.writer.finish()
+                    text = None
+                continue
+            root.event(event, value)
+            if event in ("start_map", "start_array"):
+                path.append(None if event == "start_map" else "item")
+    except Exception:
+        for open_spool in spools.values():
+            open_spool.writer.abort()
+        raise
+
+    if not isinstance(root.value, dict):
+        for open_spool in spools.values():
+            open_spool.writer.abort()
+        raise ValueError("JSON body must be an object.")
+    body = IngestedBody(root.value, spools, reader.bytes_read)
+    logger.info(f"Streamed {reader.bytes_read} byte body; spooled "
+                f"{', '.join(f'{n}({s.items} items)' for n, s in spools.items()) or 'nothing'}.")
+    return body
@@ -0,0 +1,312 @@
+# app/services/tiered_cache.py
+
+import os
+import time
+import uuid
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services.redis_client import get_redis, new_redis_client
+from app.services.metrics import get_counter
+from app.services.memory_diagnostics import register_memory_report, pickled_store_size
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# L1 is a per-process LRU in front of the shared (Redis) Flask-Caching backend. Every write
+# through this module is broadcast on INVALIDATION_CHANNEL so the other workers drop their
+# L1 copy. L1_TTL_S bounds how long an entry can be served if a broadcast is ever lost.
+L1_MAX_ITEMS = int(os.environ.get("CACHE_L1_MAX_ITEMS", 5000))
+L1_TTL_S = float(os.environ.get("CACHE_L1_TTL_S", 30))
+INVALIDATION_CHANNEL = os.environ.get("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+LISTENER_RETRY_S = 5.0
+
+_MISSING = object()
+
+
+def _keyspace(key: str) -> str:
+    """Metric label for a key: 'user_profile' for user_profile:<id>:v3, 'user_prefs' for user_prefs:<id>:v2."""
+    if ":" in key:
+        return key.split(":", 1)[0]
+    return key.rsplit("_", 1)[0] if "_" in key else key
+
+
+def _count(key: str, result: str) -> None:
+    get_counter("cache_requests_total", {"keyspace": _keyspace(key), "result": result}).inc()
+
+
+class TieredCache:
+    """
+    Two-level cache with the cachelib API used by the app (get/set/add/inc/delete/*_many).
+
+    L1 holds pickled values, so callers get their own copy exactly as with Redis. L1 is only
+    used while the invalidation listener is subscribed; when it isn't (Redis down, reconnecting)
+    every call goes straight to L2 and L1 is emptied, since broadcasts may have been missed.
+    With l1_enabled=False (in-process backends) it is a pass-through that only counts
+    hits / misses per keyspace.
+    """
+
+    def __init__(self, backend, max_items: int = L1_MAX_ITEMS, l1_ttl_s: float = L1_TTL_S,
+                 channel: str = INVALIDATION_CHANNEL, l1_enabled: bool = True):
+        self.backend = backend
+        self.max_items = max_items
+        self.l1_ttl_s = l1_ttl_s
+        self.channel = channel
+        self._origin = uuid.uuid4().hex
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, pickled value)
+        self._lock = threading.Lock()
+        self._live = False
+        self._invalidations = 0  # Bumped on every invalidation; guards L1 fills racing a write
+        self._disabled = not l1_enabled  # Also set when no Redis is configured: L1 stays off for good
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "evictions": 0,
+                      "invalidations_received": 0, "publish_errors": 0}
+
+    # --- L1 ---
+    def _l1_get(self, key: str) -> Any:
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None:
+                return _MISSING
+            if item[0] <= time.monotonic():
+                del self._l1[key]
+                return _MISSING
+            self._l1.move_to_end(key)
+            self.stats["l1_hits"] += 1
+            data = item[1]
+        return pickle.loads(data)
+
+    def _l1_put(self, key: str, value: Any, timeout: Optional[int] = None,
+                seen_invalidations: Optional[int] = None) -> None:
+        if not self._live or value is None:
+            return
+        ttl = self.l1_ttl_s if not timeout else min(self.l1_ttl_s, timeout)
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return  # Unpicklable values just aren't kept in L1
+        with self._lock:
+            if seen_invalidations is not None and seen_invalidations != self._invalidations:
+                return  # A write elsewhere landed while we were reading L2; don't cache the old value
+            self._l1[key] = (time.monotonic() + ttl, data)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.max_items:
+                self._l1.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _l1_drop(self, keys: List[str]) -> None:
+        with self._lock:
+            self._invalidations += 1
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _l1_clear(self) -> None:
+        with self._lock:
+            self._l1.clear()
+            self._invalidations += 1
+
+    # --- Invalidation broadcast ---
+    def _publish(self, keys: List[str]) -> None:
+        if not keys or self._disabled:
+            return
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.publish(self.channel, "\n".join([self._origin] + list(keys)))
+        except Exception as e:
+            self.stats["publish_errors"] += 1
+            logger.error(f"Failed to broadcast cache invalidation for {len(keys)} key(s): {e}")
+
+    def _on_message(self, data: str) -> None:
+        origin, _, payload = data.partition("\n")
+        if origin == self._origin:
+            return  # Our own write; L1 already reflects it
+        keys = payload.split("\n") if payload else []
+        with self._lock:
+            self._invalidations += 1
+            if "*" in keys:  # clear() on another worker
+                self._l1.clear()
+            for key in keys:
+                self._l1.pop(key, None)
+        self.stats["invalidations_received"] += len(keys)
+
+    def _ensure_listener(self) -> None:
+        # Started lazily so a pre-fork master doesn't own the only listener thread
+        if self._disabled or (self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._live = False
+            self._l1.clear()
+            self._thread = threading.Thread(target=self._listen, name="cache-invalidation-listener", daemon=True)
+            self._thread.start()
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                client = new_redis_client(socket_timeout=None)
+                if client is None:
+                    self._disabled = True
+                    logger.info("No Redis URL configured; in-process L1 cache disabled.")
+                    return
+                pubsub = client.pubsub()
+                pubsub.subscribe(self.channel)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message:
+                        continue
+                    if message.get("type") == "subscribe":
+                        self._l1_clear()
+                        self._live = True
+                        logger.info(f"L1 cache enabled; listening for invalidations on '{self.channel}'.")
+                    elif message.get("type") == "message":
+                        self._on_message(message.get("data") or "")
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener disconnected, L1 disabled until it reconnects: {e}")
+            finally:
+                self._live = False
+                self._l1_clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            self._stop.wait(LISTENER_RETRY_S)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    # --- cachelib API ---
+    def get(self, key: str) -> Any:
+        self._ensure_listener()
+        if self._live:
+            value = self._l1_get(key)
+            if value is not _MISSING:
+                _count(key, "l1_hit")
+                return value
+        seen = self._invalidations
+        value = self.backend.get(key)
+        if value is None:
+            self.stats["misses"] += 1
+            _count(key, "miss")
+            return None
+        self.stats["l2_hits"] += 1
+        _count(key, "hit")
+        self._l1_put(key, value, seen_invalidations=seen)
+        return value
+
+    def get_many(self, *keys: str) -> List[Any]:
+        self._ensure_listener()
+        values: Dict[str, Any] = {}
+        if self._live:
+            for key in keys:
+                value = self._l1_get(key)
+                if value is not _MISSING:
+                    values[key] = value
+                    _count(key, "l1_hit")
+        missing = [key for key in keys if key not in values]
+        if missing:
+            seen = self._invalidations
+            for key, value in zip(missing, self.backend.get_many(*missing)):
+                values[key] = value
+                if value is None:
+                    self.stats["misses"] += 1
+                    _count(key, "miss")
+                else:
+                    self.stats["l2_hits"] += 1
+                    _count(key, "hit")
+                    self._l1_put(key, value, seen_invalidations=seen)
+        return [values[key] for key in keys]
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        result = self.backend.set(key, value, timeout=timeout)
+        self._l1_drop([key])
+        if result:
+            self._l1_put(key, value, timeout)
+        self._publish([key])
+        return result
+
+    def set_many(self, mapping: Dict[str, Any], timeout: Optional[int] = None) -> Any:
+        result = self.backend.set_many(mapping, timeout=timeout)
+        self._l1_drop(list(mapping))
+        for key, value in mapping.items():
+            self._l1_put(key, value, timeout)
+        self._publish(list(mapping))
+        return result
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        added = self.backend.add(key, value, timeout=timeout)
+        self._l1_drop([key])
+        if added:
+            self._publish([key])
+        return added
+
+    def delete(self, key: str) -> bool:
+        result = self.backend.delete(key)
+        self._l1_drop([key])
+        self._publish([key])
+        return result
+
+    def delete_many(self, *keys: str) -> Any:
+        result = self.backend.delete_many(*keys)
+        self._l1_drop(list(keys))
+        self._publish(list(keys))
+        return result
+
+    def inc(self, key: str, delta: int = 1) -> Optional[int]:
+        value = self.backend.inc(key, delta=delta)
+        self._l1_drop([key])
+        self._publish([key])
+        return value
+
+    def dec(self, key: str, delta: int = 1) -> Optional[int]:
+        value = self.backend.dec(key, delta=delta)
+        self._l1_drop([key])
+        self._publish([key])
+        return value
+
+    def clear(self) -> bool:
+        result = self.backend.clear()
+        self._l1_clear()
+        self._publish(["*"])
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+
+def init_tiered_cache(app, backend) -> Optional[TieredCache]:
+    """
+    Registers a TieredCache over `backend` as app.extensions['tiered_cache']. The L1 tier is
+    only added when the backend is shared between workers (Redis); in-process backends
+    (SimpleCache) get the pass-through wrapper for its metrics.
+    """
+    if backend is None:
+        return None
+    shared = type(backend).__name__ == "RedisCache"
+    tiered = TieredCache(backend, l1_enabled=shared)
+    app.extensions['tiered_cache'] = tiered
+    if shared:
+        register_memory_report("cache.l1", lambda: pickled_store_size(tiered._l1))
+    elif isinstance(getattr(backend, "_cache", None), dict):
+        # cachelib SimpleCache: {key: (expires, pickled value)}
+        register_memory_report("cache.simple", lambda: pickled_store_size(backend._cache))
+    if shared:
+        logger.info(f"Tiered cache enabled: L1 max {L1_MAX_ITEMS} items / {L1_TTL_S:g}s over {type(backend).__name__}.")
+    else:
+        logger.info(f"Cache backend {type(backend).__name__} is not shared; no L1 tier added.")
+    return tiered
@@ -0,0 +1,284 @@
+# app/services/tool_executor.py
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.api.tool_registry import ToolSpec, get_tool_spec
+from app.services.metrics import get_histogram, register_collector
+from app.services.job_runner import submit_job
+
+logger = logging.getLogger(__name__)
+
+# Sync tool handlers run here so they never block the webhook's event loop.
+TOOL_THREAD_POOL_SIZE = int(os.environ.get("TOOL_THREAD_POOL_SIZE", 8))
+_tool_thread_pool = ThreadPoolExecutor(max_workers=TOOL_THREAD_POOL_SIZE, thread_name_prefix="tool-handler")
+# A sync handler past its deadline can't be stopped and keeps its pool thread until it returns.
+# Once this many are still running, sync tool calls fail fast instead of queueing behind them.
+TOOL_MAX_ABANDONED = int(os.environ.get("TOOL_MAX_ABANDONED", max(1, TOOL_THREAD_POOL_SIZE // 2)))
+_abandoned = 0
+_abandoned_lock = threading.Lock()
+
+register_collector("tool_handlers_abandoned", lambda: _abandoned)
+
+
+@dataclass
+class ToolCallRequest:
+    """A single tool call parsed from a Vapi payload."""
+    tool_call_id: str
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    argument_error: Optional[str] = None  # Set when the arguments could not be parsed
+
+
+@dataclass
+class ToolCallOutcome:
+    """Result of executing one tool call."""
+    tool_call_id: str
+    name: str
+    status: str  # success | error | timeout | not_found
+    result: Any = None
+    message: Optional[str] = None
+    duration_s: float = 0.0
+
+    @property
+    def content(self) -> str:
+        """The tool result as the JSON/text string Vapi expects."""
+        if self.status != "success":
+            return json.dumps({"status": "error" if self.status != "timeout" else "timeout",
+                               "message": self.message or f"Tool {self.name} failed."})
+        if isinstance(self.result, dict) and isinstance(self.result.get("content"), str):
+            return self.result["content"]  # Handler already produced the Vapi content string
+        if isinstance(self.result, str):
+            return self.result
+        return json.dumps(self.result, default=str)
+
+    def to_vapi_result(self) -> Dict[str, str]:
+        return {"toolCallId": self.tool_call_id, "result": self.content}
+
+
+# ------------------------------
+# Concurrency caps
+# ------------------------------
+class _ConcurrencyGate:
+    """
+    Counting semaphore that works across event loops. Flask runs each async view
+    in its own loop, so a plain asyncio.Semaphore cannot cap a tool process-wide.
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        with self._lock:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return self
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    self._release_locked()  # Slot was already handed to us; pass it on
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        while self._waiters:
+            loop, future = self._waiters.popleft()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve_waiter, future)
+                return  # Slot handed over directly; _active unchanged
+        self._active -= 1
+
+
+def _resolve_waiter(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+_gates: Dict[str, _ConcurrencyGate] = {}
+_gates_lock = threading.Lock()
+
+
+def _gate_for(spec: ToolSpec) -> Optional[_ConcurrencyGate]:
+    if not spec.max_concurrency:
+        return None
+    with _gates_lock:
+        gate = _gates.get(spec.name)
+        if gate is None:
+            gate = _gates[spec.name] = _ConcurrencyGate(spec.max_concurrency)
+    return gate
+
+
+# ------------------------------
+# Parsing
+# ------------------------------
+def parse_tool_calls(raw_calls: List[Dict[str, Any]]) -> List[ToolCallRequest]:
+    """
+    Normalise Vapi/OpenAI style tool calls
+    ({"id": ..., "function": {"name": ..., "arguments": "<json>"}}) into ToolCallRequests.
+    """
+    requests = []
+    for index, call in enumerate(raw_calls or []):
+        if not isinstance(call, dict):
+            continue
+        function = call.get("function") or {}
+        name = function.get("name") or call.get("name")
+        arguments = function.get("arguments", call.get("arguments", {})) or {}
+        tool_call_id = call.get("id") or call.get("toolCallId") or f"{name}_{index}"
+        argument_error = None
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError:
+                logger.error(f"Invalid JSON in arguments for tool {name}: {arguments[:200]}")
+                arguments, argument_error = {}, "Invalid arguments format."
+        if not isinstance(arguments, dict):
+            arguments, argument_error = {}, "Tool arguments must be an object."
+        requests.append(ToolCallRequest(tool_call_id, name, arguments, argument_error))
+    return requests
+
+
+def any_requires_user(calls: List[ToolCallRequest]) -> bool:
+    """True if any of the calls targets a tool registered with requires_user."""
+    for call in calls:
+        spec = get_tool_spec(call.name)
+        if spec and spec.requires_user:
+            return True
+    return False
+
+
+# ------------------------------
+# Execution
+# ------------------------------
+def _release_abandoned(name: str, abandoned_at: float):
+    def done(_future) -> None:
+        global _abandoned
+        with _abandoned_lock:
+            _abandoned -= 1
+        logger.warning(f"Abandoned tool handler {name} returned {time.perf_counter() - abandoned_at:.1f}s after its deadline.")
+    return done
+
+
+async def _invoke(handler, kwargs: Dict[str, Any]):
+    global _abandoned
+    if asyncio.iscoroutinefunction(handler):
+        return await handler(**kwargs)
+    if _abandoned >= TOOL_MAX_ABANDONED:
+        raise RuntimeError(f"{_abandoned} timed-out tool handlers are still holding the tool thread pool.")
+    # Copy the context so Flask's app/request context is visible in the pool thread
+    ctx = contextvars.copy_context()
+    future = _tool_thread_pool.submit(functools.partial(ctx.run, handler, **kwargs))
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # Deadline hit: a handler that hasn't started is cancelled, a running one is counted
+        # as abandoned until it returns
+        if not future.cancel() and not future.done():
+            with _abandoned_lock:
+                _abandoned += 1
+            future.add_done_callback(_release_abandoned(getattr(handler, "__name__", "?"), time.perf_counter()))
+        raise
+
+
+async def _run_gated(spec: ToolSpec, kwargs: Dict[str, Any]):
+    gate = _gate_for(spec)
+    if gate is None:
+        return await _invoke(spec.handler, kwargs)
+    async with gate:
+        return await _invoke(spec.handler, kwargs)
+
+
+async def execute_tool_call(call: ToolCallRequest, context: Optional[Dict[str, Any]] = None) -> ToolCallOutcome:
+    """
+    Runs one tool call under its registered deadline and concurrency cap.
+    Never raises; failures are reported in the returned outcome.
+    """
+    context = context or {}
+    spec = get_tool_spec(call.name)
+    if spec is None:
+        logger.warning(f"No handler registered for tool {call.name}")
+        return ToolCallOutcome(call.tool_call_id, call.name, "not_found", message=f"No handler for tool {call.name}.")
+    if call.argument_error:
+        return ToolCallOutcome(call.tool_call_id, call.name, "error", message=call.argument_error)
+
+    kwargs = {**call.arguments, "tool_call_id": call.tool_call_id}
+    if spec.requires_user:
+        if not context.get("user_id"):
+            msg = f"User context (user_id) not found for {call.name}."
+            logger.error(msg)
+            return ToolCallOutcome(call.tool_call_id, call.name, "error", message=msg)
+        kwargs["user_id"] = context["user_id"]
+
+    start = time.perf_counter()
+    if spec.background:
+        return _submit_background(spec, call, kwargs, context, start)
+    try:
+        # The deadline covers time spent waiting for a concurrency slot.
+        result = await asyncio.wait_for(_run_gated(spec, kwargs), timeout=spec.timeout)
+        outcome = ToolCallOutcome(call.tool_call_id, call.name, "success", result=result)
+    except asyncio.TimeoutError:
+        logger.error(f"Tool {call.name} ({call.tool_call_id}) exceeded its {spec.timeout}s deadline.")
+        outcome = ToolCallOutcome(call.tool_call_id, call.name, "timeout",
+                                  message=f"Tool {call.name} timed out after {spec.timeout}s.")
+    except Exception as e:
+        logger.error(f"Error during execution of tool {call.name}: {e}", exc_info=True)
+        outcome = ToolCallOutcome(call.tool_call_id, call.name, "error",
+                                  message=f"Execution error in tool {call.name}: {str(e)}")
+    outcome.duration_s = time.perf_counter() - start
+    get_histogram("tool_call_duration_seconds", {"tool": call.name, "status": outcome.status}).observe(outcome.duration_s)
+    logger.info(f"Tool {call.name} ({call.tool_call_id}) finished with status '{outcome.status}' in {outcome.duration_s:.3f}s")
+    return outcome
+
+
+def _submit_background(spec: ToolSpec, call: ToolCallRequest, kwargs: Dict[str, Any],
+                       context: Dict[str, Any], start: float) -> ToolCallOutcome:
+    """Queues a background tool and acknowledges the call with its job id."""
+    try:
+        job_id = submit_job(spec.name, spec.handler, kwargs,
+                            call_id=context.get("call_id"), control_url=context.get("control_url"),
+                            user_id=context.get("user_id"))
+        outcome = ToolCallOutcome(call.tool_call_id, call.name, "success", result={
+            "status": "accepted",
+            "job_id": job_id,
+            "message": f"{call.name} has started in the background. I'll let you know when it's done."
+        })
+    except Exception as e:
+        logger.error(f"Could not queue background tool {call.name}: {e}", exc_info=True)
+        outcome = ToolCallOutcome(call.tool_call_id, call.name, "error",
+                                  message=f"Could not start {call.name}: {str(e)}")
+    outcome.duration_s = time.perf_counter() - start
+    get_histogram("tool_call_duration_seconds", {"tool": call.name, "status": outcome.status}).observe(outcome.duration_s)
+    return outcome
+
+
+async def execute_tool_calls(calls: List[ToolCallRequest], context: Optional[Dict[str, Any]] = None) -> List[ToolCallOutcome]:
+    """
+    Runs independent tool calls concurrently; a multi-tool turn takes as long as
+    its slowest tool. Outcomes are returned in the order of `calls`.
+    """
+    if not calls:
+        return []
+    return list(await asyncio.gather(*(execute_tool_call(call, context) for call in calls)))
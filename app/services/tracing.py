@@ -0,0 +1,164 @@
+# app/services/tracing.py
+
+import os
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.metrics import get_histogram, histogram_snapshots, observe_dependency_call
+
+try:
+    from opentelemetry import trace as otel_trace  # Spans are mirrored when the OTel API is installed
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Stage timings are aggregated in-process into STAGE_HISTOGRAM (labels: trace, stage) and
+# logged once per turn. TRACING_ENABLED=0 makes every helper here a no-op.
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1").lower() in ("1", "true", "yes")
+STAGE_HISTOGRAM = "stage_duration_seconds"
+
+_tracer = otel_trace.get_tracer("lavar") if otel_trace is not None else None
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Stage timings for one request (a chat turn or a webhook event)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.finished = False
+        self.handed_off = False  # Set when a streamed response takes over finishing the trace
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def finish(self) -> None:
+        # Histograms are fed here, under the final name (webhook traces are named once parsed)
+        if self.finished:
+            return
+        self.finished = True
+        self.record("total", time.perf_counter() - self.started)
+        for stage, seconds in self.stages:
+            get_histogram(STAGE_HISTOGRAM, {"trace": self.name, "stage": stage}).observe(seconds)
+        summary = ", ".join(f"{stage}={seconds * 1000:.1f}" for stage, seconds in self.stages)
+        logger.info(f"Trace {self.name} timings (ms): {summary}")
+
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Optional[Trace]]:
+    """
+    Opens a per-request trace that span() records into; finished (and logged) on exit
+    unless hand_off_to_stream() passed it to a streamed response.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    otel_cm = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if otel_cm is not None:
+        otel_cm.__enter__()
+    try:
+        yield trace
+    finally:
+        if otel_cm is not None:
+            otel_cm.__exit__(None, None, None)
+        _current_trace.reset(token)
+        if not trace.handed_off:
+            trace.finish()
+
+
+@contextmanager
+def span(stage: str, dependency: Optional[str] = None, **attributes: Any) -> Iterator[None]:
+    """
+    Times a stage of the current trace (histogram + per-turn log line; OTel span if available).
+    With `dependency` (e.g. "openai") the call is also counted in the dependency latency and
+    error metrics, which are kept even when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        if dependency is None:
+            yield
+            return
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            observe_dependency_call(dependency, stage, time.perf_counter() - started, error=failed)
+        return
+    otel_cm = _tracer.start_as_current_span(stage, attributes=attributes or None) if _tracer is not None else None
+    if otel_cm is not None:
+        otel_cm.__enter__()
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        elapsed = time.perf_counter() - started
+        record_stage(stage, elapsed)
+        if dependency is not None:
+            observe_dependency_call(dependency, stage, elapsed, error=failed)
+        if otel_cm is not None:
+            otel_cm.__exit__(None, None, None)
+
+
+def current_trace() -> Optional[Trace]:
+    """The current request's trace; None when tracing is off or outside start_trace()."""
+    return _current_trace.get() if TRACING_ENABLED else None
+
+
+def set_trace_name(name: str) -> None:
+    """Renames the current trace, e.g. once the webhook event type is known."""
+    trace = _current_trace.get() if TRACING_ENABLED else None
+    if trace is not None:
+        trace.name = name
+
+
+def record_stage(stage: str, seconds: float, trace: Optional[Trace] = None) -> None:
+    """Records a stage duration measured elsewhere; outside a trace it only feeds the histogram."""
+    if not TRACING_ENABLED:
+        return
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+    else:
+        get_histogram(STAGE_HISTOGRAM, {"trace": "none", "stage": stage}).observe(seconds)
+
+
+def hand_off_to_stream(chunks: Iterable[str], llm_started: float) -> Iterable[str]:
+    """
+    Wraps an SSE generator so the current trace records llm.ttft (LLM call start to the first
+    chunk written) and llm.stream (to the last), and is finished when the stream ends.
+    """
+    trace = _current_trace.get() if TRACING_ENABLED else None
+    if trace is None:
+        return chunks
+    trace.handed_off = True
+
+    def traced() -> Iterator[str]:
+        first = True
+        try:
+            for chunk in chunks:
+                if first:
+                    trace.record("llm.ttft", time.perf_counter() - llm_started)
+                    first = False
+                yield chunk
+        finally:
+            trace.record("llm.stream", time.perf_counter() - llm_started)
+            trace.finish()
+
+    return traced()
+
+
+def stage_summaries() -> List[Dict[str, Any]]:
+    """The in-process exporter: per-(trace, stage) histogram snapshots."""
+    return histogram_snapshots(STAGE_HISTOGRAM)
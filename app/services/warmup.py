@@ -0,0 +1,169 @@
+# app/services/warmup.py
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+
+from app.services.profile_cache import get_cache, get_cached_preferences, get_cached_profile_entry
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# /token schedules a background warm-up of the user's caches so the first chat turn after
+# login finds them hot. Warm-ups run on their own small pool (not the persisted job runner,
+# whose workers are kept for tool jobs). The per-user flag ('warming' / 'ready') dedupes them
+# across workers and tells the chat route whether the user is warm; 'ready' lives as long as
+# the warmed preferences stay fresh.
+WARMUP_ON_LOGIN = os.environ.get("WARMUP_ON_LOGIN", "1").lower() in ("1", "true", "yes")
+WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", 2))
+WARM_TTL_S = int(os.environ.get("USER_WARM_TTL_S", os.environ.get("PREFERENCES_CACHE_TTL_S", 300)))
+# Upstream connections are per process; re-warming them more often than this is pointless
+CONNECTION_WARM_INTERVAL_S = float(os.environ.get("CONNECTION_WARM_INTERVAL_S", 60))
+# How long a chat turn waits for this worker's in-flight warm-up before loading itself
+WARMUP_JOIN_WAIT_S = float(os.environ.get("WARMUP_JOIN_WAIT_S", 2.0))
+
+_warmup_executor = ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="user-warmup")
+_inflight: Dict[str, Future] = {}  # user_id -> this worker's running warm-up
+_inflight_lock = threading.Lock()
+_connections_lock = threading.Lock()
+_connections_warmed_at = 0.0
+
+
+def _warm_key(user_id: str) -> str:
+    return f"user_warm:{user_id}"
+
+
+def get_warm_status(user_id: str) -> Optional[str]:
+    """'ready' once the user's warm-up succeeded, 'warming' while it runs, else None (cold)."""
+    cache = get_cache()
+    if cache is None or not user_id:
+        return None
+    try:
+        flag = cache.get(_warm_key(user_id))
+    except Exception as e:
+        logger.error(f"Warm-up flag read failed for user {user_id}: {e}")
+        return None
+    return flag.get("status") if isinstance(flag, dict) else None
+
+
+def get_warm_preferences(user_id: str, loader: Callable[[str], Optional[Dict[str, Any]]],
+                         status: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Preferences for a chat turn given the user's warm `status`. While this worker's warm-up
+    is loading them the turn waits for its result (up to WARMUP_JOIN_WAIT_S) instead of
+    fetching again; 'ready' and a warm-up on another worker both resolve through the cache.
+    """
+    future = _inflight.get(user_id) if status == "warming" else None
+    if future is not None:
+        try:
+            preferences = future.result(timeout=WARMUP_JOIN_WAIT_S).get("preferences")
+            if preferences:
+                return preferences
+        except Exception as e:
+            logger.warning(f"Couldn't join the warm-up for user {user_id}; loading preferences directly: {e}")
+    return get_cached_preferences(user_id, loader)
+
+
+def _warm_connections() -> bool:
+    """Opens the OpenAI and Pinecone connections in this process. False if recently done."""
+    global _connections_warmed_at
+    with _connections_lock:
+        if time.monotonic() - _connections_warmed_at < CONNECTION_WARM_INTERVAL_S:
+            return False
+        _connections_warmed_at = time.monotonic()
+
+    # Imported here: both modules build network clients at import time
+    from app.functions.get_custom_llm_streaming import client_openai
+    from app.rag import pinecone_rag
+
+    if client_openai:
+        client_openai.with_options(timeout=5.0).models.list()
+    for index in (pinecone_rag.user_index, pinecone_rag.book_index):
+        if index:
+            index.describe_index_stats()
+    return True
+
+
+def _run_warmup(app, user_id: str) -> Dict[str, Any]:
+    # Imported here: supabase_db and the personalization module import this package
+    from app.api.supabase_db import get_supabase_user_data_by_id, get_user_preferences, PREFERENCE_DEFAULTS
+    from app.personalization.user_preferences import build_personalized_system_prompt
+
+    timings: Dict[str, Any] = {}
+    failed: List[str] = []
+
+    def step(name: str, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed for user {user_id}: {e}")
+            failed.append(name)
+            return None
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    with app.app_context():
+        preferences = step("preferences", lambda: get_cached_preferences(user_id, get_user_preferences))
+        profile = step("profile", lambda: get_cached_profile_entry(user_id, get_supabase_user_data_by_id))
+        step("system_prompt", lambda: build_personalized_system_prompt(preferences or PREFERENCE_DEFAULTS))
+        step("connections", _warm_connections)
+        ok = preferences is not None and profile is not None and not failed
+
+        cache = get_cache()
+        if cache is not None:
+            try:
+                if ok:
+                    cache.set(_warm_key(user_id), {"status": "ready", "at": time.time(), "timings_ms": timings},
+                              timeout=WARM_TTL_S)
+                else:
+                    cache.delete(_warm_key(user_id))  # Cold again; the next login retries
+            except Exception as e:
+                logger.error(f"Warm-up flag write failed for user {user_id}: {e}")
+
+    if ok:
+        logger.info(f"Warmed per-user state for {user_id} (ms): {timings}")
+    else:
+        logger.warning(f"Warm-up for user {user_id} incomplete (failed: {', '.join(failed) or 'empty result'}; ms): {timings}")
+    return {"preferences": preferences, "ok": ok, "timings_ms": timings}
+
+
+def _log_failure(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Warm-up crashed: {error}", exc_info=error)
+
+
+def schedule_user_warmup(user_id: str) -> bool:
+    """
+    Starts a background warm-up of the user's preferences, profile and system prompt (and this
+    process's upstream connections). False if disabled or the user is already warm / warming.
+    """
+    if not WARMUP_ON_LOGIN or not user_id:
+        return False
+    cache = get_cache()
+    if cache is not None:
+        try:
+            # Atomic claim: only one worker schedules while the flag is live
+            if not cache.add(_warm_key(user_id), {"status": "warming", "at": time.time()}, timeout=WARM_TTL_S):
+                logger.debug(f"User {user_id} already warm or warming; skipping warm-up.")
+                return False
+        except Exception as e:
+            logger.error(f"Warm-up flag claim failed for user {user_id}: {e}")
+    future = _warmup_executor.submit(_run_warmup, current_app._get_current_object(), user_id)
+    with _inflight_lock:
+        _inflight[user_id] = future
+    future.add_done_callback(_log_failure)
+    future.add_done_callback(lambda done: _forget_inflight(user_id, done))
+    return True
+
+
+def _forget_inflight(user_id: str, future: Future) -> None:
+    with _inflight_lock:
+        if _inflight.get(user_id) is future:
+            del _inflight[user_id]
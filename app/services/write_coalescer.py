@@ -0,0 +1,390 @@
+# app/services/write_coalescer.py
+
+import os
+import copy
+import json
+import time
+import uuid
+import atexit
+import socket
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app, has_app_context
+
+from app.services.metrics import register_collector, stats_collector
+from app.services.memory_diagnostics import register_memory_report
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# /color and /character updates are acknowledged at once and written per user after the
+# user has been quiet for COALESCE_WINDOW_S (at most COALESCE_MAX_DELAY_S after the first
+# pending update). 0 disables coalescing: every update is written before the response.
+COALESCE_WINDOW_S = int(os.environ.get("PROFILE_WRITE_COALESCE_MS", 300)) / 1000
+COALESCE_MAX_DELAY_S = int(os.environ.get("PROFILE_WRITE_MAX_DELAY_MS", 2000)) / 1000
+DB_BASE_PATH = "data/databases"
+WRITES_DB_PATH = os.environ.get("PROFILE_WRITES_DB_PATH", f"{DB_BASE_PATH}/profile_writes.db")
+# Journal rows whose owner hasn't heartbeated for this long (crashed / killed worker) are
+# taken over and flushed by another process.
+RECOVER_AFTER_S = 30.0
+RETRY_BACKOFF_S = (1.0, 2.0, 5.0, 10.0, 30.0)
+# A patch still failing after this many writes stops being retried. Its updates were already
+# acknowledged, so the rows stay in the journal marked dead (dead = 1) for inspection / replay.
+MAX_WRITE_ATTEMPTS = int(os.environ.get("PROFILE_WRITE_MAX_ATTEMPTS", 8))
+
+_JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_profile_writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    heartbeat REAL NOT NULL,
+    dead INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def merge_character_ops(ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Collapses a sequence of character ops without changing its result: a "set" drops
+    every earlier op on that key, and repeated identical appends are kept once.
+    """
+    merged: List[Dict[str, Any]] = []
+    for op in ops:
+        if op["op"] == "set":
+            merged = [m for m in merged if m["key"] != op["key"]]
+            merged.append(op)
+        elif not any(m["op"] == "append" and m["key"] == op["key"] and m.get("value") == op.get("value")
+                     for m in merged):
+            merged.append(op)
+    return merged
+
+
+class _PendingPatch:
+    __slots__ = ("user_id", "settings", "character_ops", "journal_ids", "first_at", "due_at", "attempts")
+
+    def __init__(self, user_id: str, now: float):
+        self.user_id = user_id
+        self.settings: Dict[str, Any] = {}
+        self.character_ops: List[Dict[str, Any]] = []
+        self.journal_ids: List[int] = []
+        self.first_at = now
+        self.due_at = now
+        self.attempts = 0
+
+
+class ProfileWriteCoalescer:
+    """
+    Per-user write-behind buffer for user_profiles updates. Updates are journaled to a
+    local SQLite file before being acknowledged, merged per user, and flushed by a
+    background thread as one settings update plus one character patch.
+    """
+
+    def __init__(self, apply_settings: Callable[[str, Dict[str, Any]], bool],
+                 apply_character_ops: Callable[[str, List[Dict[str, Any]]], bool],
+                 window_s: float = COALESCE_WINDOW_S, max_delay_s: float = COALESCE_MAX_DELAY_S,
+                 db_path: str = WRITES_DB_PATH):
+        self._apply_settings = apply_settings
+        self._apply_character_ops = apply_character_ops
+        self.window_s = window_s
+        self.max_delay_s = max(max_delay_s, window_s)
+        self._db_path = db_path
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pending: Dict[str, _PendingPatch] = {}
+        self._inflight: Dict[str, _PendingPatch] = {}
+        self._cond = threading.Condition()
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._last_heartbeat = 0.0
+        self.stats = {"updates": 0, "flushes": 0, "db_writes": 0, "failures": 0, "recovered": 0,
+                      "dead_lettered": 0}
+        self._schema_ready = False
+
+    # --- Journal ---
+    def _connect(self) -> sqlite3.Connection:
+        Path(os.path.dirname(self._db_path) or ".").mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self._db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.execute(_JOURNAL_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(pending_profile_writes)")}
+            if "dead" not in columns:
+                conn.execute("ALTER TABLE pending_profile_writes ADD COLUMN dead INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def _journal(self, user_id: str, kind: str, payload: Any) -> int:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO pending_profile_writes (user_id, kind, payload, owner, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (user_id, kind, json.dumps(payload, default=str), self._owner, time.time()))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def _forget(self, journal_ids: List[int]) -> None:
+        if not journal_ids:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(f"DELETE FROM pending_profile_writes WHERE id IN ({','.join('?' * len(journal_ids))})",
+                         journal_ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _dead_letter(self, journal_ids: List[int]) -> None:
+        if not journal_ids:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE pending_profile_writes SET dead = 1 WHERE id IN ({','.join('?' * len(journal_ids))})",
+                         journal_ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _heartbeat_and_recover(self) -> None:
+        """Refreshes our rows' heartbeat and adopts rows abandoned by dead workers."""
+        now = time.time()
+        if now - self._last_heartbeat < RECOVER_AFTER_S / 3:
+            return
+        self._last_heartbeat = now
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE pending_profile_writes SET heartbeat = ? WHERE owner = ? AND dead = 0",
+                         (now, self._owner))
+            adopted = conn.execute(
+                "UPDATE pending_profile_writes SET owner = ?, heartbeat = ? "
+                "WHERE owner != ? AND heartbeat < ? AND dead = 0",
+                (self._owner, now, self._owner, now - RECOVER_AFTER_S)).rowcount
+            conn.commit()
+            rows = conn.execute("SELECT id, user_id, kind, payload FROM pending_profile_writes "
+                                "WHERE owner = ? AND dead = 0 ORDER BY id", (self._owner,)).fetchall() if adopted else []
+        finally:
+            conn.close()
+        if not rows:
+            return
+        with self._cond:
+            known = {jid for patch in list(self._pending.values()) + list(self._inflight.values())
+                     for jid in patch.journal_ids}
+            adopted_rows: Dict[str, List[Any]] = {}
+            for journal_id, user_id, kind, payload in rows:
+                if journal_id not in known:
+                    adopted_rows.setdefault(user_id, []).append((journal_id, kind, json.loads(payload)))
+            for user_id, user_rows in adopted_rows.items():
+                self._adopt(user_id, user_rows, time.monotonic())
+                self.stats["recovered"] += len(user_rows)
+            self._cond.notify()
+        logger.warning(f"Recovered {adopted} pending profile write(s) from a previous worker.")
+
+    # --- Submitting ---
+    def _merge(self, user_id: str, kind: str, payload: Any, journal_id: int, now: float) -> None:
+        patch = self._pending.get(user_id)
+        if patch is None:
+            patch = self._pending[user_id] = _PendingPatch(user_id, now)
+        if kind == "settings":
+            patch.settings.update(payload)
+        else:
+            patch.character_ops = merge_character_ops(patch.character_ops + payload)
+        patch.journal_ids.append(journal_id)
+        patch.due_at = min(now + self.window_s, patch.first_at + self.max_delay_s)
+
+    def _adopt(self, user_id: str, rows: List[Any], now: float) -> None:
+        # Rows left by a dead worker predate anything this worker queued or is writing for the
+        # user, so they go underneath: replay them in journal id order, then the in-flight and
+        # pending patches on top. Re-sending the in-flight values is harmless (sets and
+        # if-absent appends are idempotent) and keeps the adopted rows from overwriting them.
+        pending = self._pending.pop(user_id, None)
+        for journal_id, kind, payload in rows:
+            self._merge(user_id, kind, payload, journal_id, now)
+        patch = self._pending[user_id]
+        for newer in (self._inflight.get(user_id), pending):
+            if newer is None:
+                continue
+            patch.settings.update(newer.settings)
+            patch.character_ops = merge_character_ops(patch.character_ops + newer.character_ops)
+        if pending is not None:
+            patch.journal_ids.extend(pending.journal_ids)
+            patch.first_at, patch.attempts = pending.first_at, pending.attempts
+            patch.due_at = min(pending.due_at, patch.first_at + self.max_delay_s)
+
+    def _submit(self, user_id: str, kind: str, payload: Any) -> bool:
+        if self.window_s <= 0:
+            if kind == "settings":
+                return self._apply_settings(user_id, payload)
+            return self._apply_character_ops(user_id, payload)
+        journal_id = self._journal(user_id, kind, payload)
+        if has_app_context():
+            self._app = current_app._get_current_object()  # Flushes need it for cache invalidation
+        self._ensure_thread()
+        with self._cond:
+            self._merge(user_id, kind, payload, journal_id, time.monotonic())
+            self.stats["updates"] += 1
+            self._cond.notify()
+        return True
+
+    def submit_settings(self, user_id: str, settings: Dict[str, Any]) -> bool:
+        """Queues user_profiles column updates. True once durably queued (or written)."""
+        return self._submit(user_id, "settings", dict(settings))
+
+    def submit_character_ops(self, user_id: str, ops: List[Dict[str, Any]]) -> bool:
+        """Queues character set/append ops. True once durably queued (or written)."""
+        return self._submit(user_id, "character", list(ops))
+
+    # --- Reading ---
+    def overlay(self, user_id: str, profile: Dict[str, Any],
+                apply_ops: Callable[[Optional[Dict[str, Any]], List[Dict[str, Any]]], Dict[str, Any]]) -> Dict[str, Any]:
+        """`profile` with this worker's not-yet-written updates applied (read-your-writes)."""
+        with self._cond:
+            patches = [p for p in (self._inflight.get(user_id), self._pending.get(user_id)) if p]
+            if not patches:
+                return profile
+            patches = [(dict(p.settings), list(p.character_ops)) for p in patches]
+        profile = copy.deepcopy(profile)
+        for settings, ops in patches:
+            profile.update(settings)
+            if ops:
+                profile["character"] = apply_ops(profile.get("character"), ops)
+        return profile
+
+    def has_pending(self, user_id: str) -> bool:
+        with self._cond:
+            return user_id in self._pending or user_id in self._inflight
+
+    # --- Flushing ---
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-write-coalescer", daemon=True)
+                self._thread.start()
+
+    def _write(self, patch: _PendingPatch) -> bool:
+        ok = True
+        if patch.settings:
+            self.stats["db_writes"] += 1
+            ok = self._apply_settings(patch.user_id, patch.settings) and ok
+        if patch.character_ops:
+            self.stats["db_writes"] += 1
+            ok = self._apply_character_ops(patch.user_id, patch.character_ops) and ok
+        return ok
+
+    def _flush_patch(self, patch: _PendingPatch) -> None:
+        try:
+            if self._app is not None:
+                with self._app.app_context():
+                    ok = self._write(patch)
+            else:
+                ok = self._write(patch)
+        except Exception as e:
+            logger.error(f"Exception flushing profile writes for user {patch.user_id}: {e}", exc_info=True)
+            ok = False
+
+        with self._cond:
+            self._inflight.pop(patch.user_id, None)
+            if ok:
+                self.stats["flushes"] += 1
+            else:
+                self.stats["failures"] += 1
+                patch.attempts += 1
+                if patch.attempts >= MAX_WRITE_ATTEMPTS:
+                    self.stats["dead_lettered"] += 1
+                else:
+                    # Keep the ops: put them back in front of anything queued meanwhile
+                    delay = RETRY_BACKOFF_S[min(patch.attempts - 1, len(RETRY_BACKOFF_S) - 1)]
+                    newer = self._pending.pop(patch.user_id, None)
+                    if newer is not None:
+                        patch.settings.update(newer.settings)
+                        patch.character_ops = merge_character_ops(patch.character_ops + newer.character_ops)
+                        patch.journal_ids.extend(newer.journal_ids)
+                    patch.first_at = time.monotonic()
+                    patch.due_at = patch.first_at + delay
+                    self._pending[patch.user_id] = patch
+                    self._cond.notify()
+        if ok:
+            self._forget(patch.journal_ids)
+        elif patch.attempts >= MAX_WRITE_ATTEMPTS:
+            logger.error(f"Giving up on profile write for user {patch.user_id} after {patch.attempts} failed attempts; "
+                         f"journal rows {patch.journal_ids} kept as dead letters: "
+                         f"settings={patch.settings} character_ops={patch.character_ops}")
+            self._dead_letter(patch.journal_ids)
+        else:
+            logger.warning(f"Profile write for user {patch.user_id} failed (attempt {patch.attempts}); will retry.")
+
+    def _take_due(self, now: float, everything: bool = False) -> List[_PendingPatch]:
+        due = [p for uid, p in self._pending.items()
+               if (everything or p.due_at <= now) and uid not in self._inflight]
+        for patch in due:
+            del self._pending[patch.user_id]
+            self._inflight[patch.user_id] = patch
+        return due
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._heartbeat_and_recover()
+            except Exception as e:
+                logger.error(f"Profile write journal maintenance failed: {e}")
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                due = self._take_due(now)
+                if not due:
+                    next_due = min((p.due_at for uid, p in self._pending.items() if uid not in self._inflight),
+                                   default=now + RECOVER_AFTER_S / 3)
+                    self._cond.wait(timeout=max(0.01, min(next_due - now, RECOVER_AFTER_S / 3)))
+                    continue
+            for patch in due:
+                self._flush_patch(patch)
+
+    def flush(self) -> None:
+        """Writes everything pending now (shutdown, tests). Failed writes stay journaled."""
+        with self._cond:
+            due = self._take_due(time.monotonic(), everything=True)
+        for patch in due:
+            self._flush_patch(patch)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.flush()
+
+
+# ------------------------------
+# Shared instance for user_profiles
+# ------------------------------
+_coalescer: Optional[ProfileWriteCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_profile_write_coalescer() -> ProfileWriteCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                from app.api.supabase_db import update_user_settings, patch_user_character
+
+                _coalescer = ProfileWriteCoalescer(update_user_settings, patch_user_character)
+                atexit.register(_coalescer.stop)
+                register_collector("profile_writes_pending", lambda: len(_coalescer._pending))
+                register_collector("profile_write_events_total", stats_collector(_coalescer.stats), kind="counter")
+                register_memory_report("profile_writes.pending", lambda: [_coalescer._pending, _coalescer._inflight])
+    if has_app_context() and _coalescer._app is None:
+        _coalescer._app = current_app._get_current_object()
+    if _coalescer.window_s > 0:
+        _coalescer._ensure_thread()  # Also adopts journal rows left by a crashed worker
+    return _coalescer
@@ -4,15 +4,17 @@ Manages the creation and scheduling of tasks within ClickUp.
 """
 
 import os
-import httpx
 from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from dotenv import load_dotenv
 
+from app.functions.clickup_client import ClickUpClient
+from app.functions.schedule_materializer import ScheduleMaterializer, ScheduleMaterializationError
+
 # Load API keys from environment
 load_dotenv()
 CLICKUP_API_KEY = os.getenv("CLICKUP_API_KEY")
-BASE_URL = "https://api.clickup.com/api/v2"
+BASE_URL = os.getenv("CLICKUP_BASE_URL", "https://api.clickup.com/api/v2")  # Override for a local stand-in server
 
 # Pydantic models for task management
 class Subtask(BaseModel):
@@ -46,35 +48,21 @@ class ScheduleClickUpTool:
     """A tool to create and manage ClickUp schedules."""
 
     def __init__(self):
-        self.headers = {"Authorization": CLICKUP_API_KEY, "Content-Type": "application/json"}
+        # One client per tool: shares the per-token rate limiter with every other ClickUp caller
+        self.client = ClickUpClient(api_key=CLICKUP_API_KEY, base_url=BASE_URL)
 
     async def create_folder(self, space_id: str, folder_name: str):
         """Create a new folder in ClickUp."""
-        url = f"{BASE_URL}/space/{space_id}/folder"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json={"name": folder_name}, headers=self.headers)
-        if response.status_code == 200:
-            return response.json().get("id")
-        raise Exception(f"Error creating folder: {response.json()}")
+        return await self.client.create_folder(space_id, folder_name)
 
     async def create_list(self, folder_id: str, list_name: str):
         """Create a new list inside a folder."""
-        url = f"{BASE_URL}/folder/{folder_id}/list"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json={"name": list_name}, headers=self.headers)
-        if response.status_code == 200:
-            return response.json().get("id")
-        raise Exception(f"Error creating list: {response.json()}")
+        return await self.client.create_list(folder_id, list_name)
 
     async def create_task(self, list_id: str, task: Task):
         """Create a task in a ClickUp list."""
-        url = f"{BASE_URL}/list/{list_id}/task"
-        payload = task.dict(exclude_unset=True)
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=self.headers)
-        if response.status_code == 200:
-            return response.json().get("id")
-        raise Exception(f"Error creating task: {response.json()}")
+        payload = task.dict(exclude_unset=True, exclude={"subtasks", "depends_on"})
+        return await self.client.create_task(list_id, payload)
 
     async def create_schedule(self, data: dict):
         """
@@ -84,13 +72,11 @@ class ScheduleClickUpTool:
         try:
             schedule = Schedule(**data)
             space_id = os.getenv("CLICKUP_SPACE_ID")
-            folder_id = await self.create_folder(space_id, schedule.schedule_name)
-            for task_list in schedule.lists:
-                list_id = await self.create_list(folder_id, task_list.list_name)
-                for task in task_list.tasks:
-                    await self.create_task(list_id, task)
-            return {"status": "success", "message": "Schedule created successfully."}
+            report = await ScheduleMaterializer(client=self.client).materialize(space_id, schedule)
+            return {"status": "success", "message": "Schedule created successfully.", "report": report.as_dict()}
         except ValidationError as e:
             return {"status": "error", "message": str(e)}
+        except ScheduleMaterializationError as e:
+            return {"status": "error", "message": str(e), "report": e.report.as_dict()}
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,55 @@
+# app/tools/various_tool_handlers.py
+
+import logging
+from typing import Any, Dict, Optional
+
+from app.api.tool_registry import register_tool_handler
+from app.functions.schedule_clickup import (
+    Schedule,
+    generate_schedule,
+    process_schedule,
+    transform_llm_output
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLICKUP_SPACE_ID = 90112974722
+
+
+# ------------------------------
+# Long-running tools (background job runner)
+# ------------------------------
+@register_tool_handler("schedule_clickup", background=True)
+def handle_schedule_clickup(tool_call_id: str,
+                            goal: str = "",
+                            timeline: str = "",
+                            resources: str = "",
+                            space_id: Any = DEFAULT_CLICKUP_SPACE_ID,
+                            schedule: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Handler for schedule_clickup tool.
+    Generates a schedule using an LLM and integrates it with ClickUp.
+    Runs on the background job runner: the LLM call plus the ClickUp writes take
+    far longer than Vapi's tool timeout. A ready-made `schedule` skips generation.
+    """
+    try:
+        if schedule:
+            validated_schedule = Schedule.model_validate(schedule)
+        else:
+            prompt = f"Goal: {goal}\nTimeline: {timeline}\nResources: {resources}"
+            validated_schedule = transform_llm_output(generate_schedule(prompt))
+        report = process_schedule(space_id=str(space_id), schedule=validated_schedule)
+        return {
+            "tool": "schedule_clickup",
+            "status": "success",
+            "schedule_name": validated_schedule.schedule_name,
+            "message": f"Schedule '{validated_schedule.schedule_name}' successfully created in ClickUp.",
+            "report": report.as_dict()
+        }
+    except Exception as e:
+        logger.error(f"Error in handle_schedule_clickup (tool_call_id {tool_call_id}): {e}", exc_info=True)
+        return {
+            "tool": "schedule_clickup",
+            "status": "error",
+            "message": str(e)
+        }
@@ -0,0 +1,22 @@
+-- migrations/001_session_artifacts.sql
+-- Off-row, compressed storage for end-of-call transcripts and message arrays.
+-- voice_agent_sessions keeps only pointers (sha256) and uncompressed sizes.
+
+create table if not exists public.session_artifacts (
+    sha256        text primary key,             -- sha256 of the uncompressed content
+    kind          text not null,                -- transcript | messages | ...
+    size          bigint not null,              -- uncompressed bytes
+    stored_size   bigint not null,              -- compressed bytes
+    codec         text not null,                -- zstd | gzip
+    content_type  text not null default 'text/plain; charset=utf-8',
+    content_b64   text not null,                -- compressed blob, base64 (ARTIFACT_STORE_BACKEND=supabase)
+    created_at    timestamptz not null default now()
+);
+
+alter table public.voice_agent_sessions
+    add column if not exists transcript_artifact text,
+    add column if not exists transcript_size     bigint,
+    add column if not exists messages_artifact   text,
+    add column if not exists messages_size       bigint;
+
+-- Existing rows: full_transcript stays readable until backfilled; new rows leave it null.
@@ -0,0 +1,25 @@
+-- migrations/002_user_profiles_fk.sql
+-- get_supabase_user_data_by_id fetches users + user_profiles in one PostgREST request
+-- (select=..., user_profiles(...)). Embedding needs a foreign key between the tables;
+-- with user_profiles.user_id unique the profile embeds as a single object.
+
+do $$
+begin
+    if not exists (
+        select 1
+        from pg_constraint
+        where conrelid = 'public.user_profiles'::regclass
+          and confrelid = 'public.users'::regclass
+          and contype = 'f'
+    ) then
+        alter table public.user_profiles
+            add constraint user_profiles_user_id_fkey
+            foreign key (user_id) references public.users (user_id) on delete cascade;
+    end if;
+end
+$$;
+
+create unique index if not exists user_profiles_user_id_key on public.user_profiles (user_id);
+
+-- Make PostgREST pick up the new relationship without a restart
+notify pgrst, 'reload schema';
@@ -0,0 +1,25 @@
+-- migrations/003_user_preferences_view.sql
+-- One row per user with both preference tables joined, so preferences for one or many
+-- users load in a single request (get_user_preferences_bulk: select ... where user_id in (...)).
+-- Values stay raw (null when unset); defaults are applied in PREFERENCE_DEFAULTS.
+
+create or replace view public.user_preferences_view
+with (security_invoker = true) as
+select
+    u.user_id,
+    v.speaking_rate,
+    v.interaction_style,
+    v.explanation_detail_level,
+    v.discussion_depth,
+    c.learning_style,
+    c.reading_pace,
+    c.preferred_complexity_level,
+    c.preferred_interaction_frequency
+from public.users u
+left join public.voice_agent_preferences v on v.user_id = u.user_id
+left join public.cognitive_preferences c on c.user_id = u.user_id;
+
+create index if not exists voice_agent_preferences_user_id_idx on public.voice_agent_preferences (user_id);
+create index if not exists cognitive_preferences_user_id_idx on public.cognitive_preferences (user_id);
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,66 @@
+-- migrations/004_patch_user_character.sql
+-- Applies a batch of edits to user_profiles.character in one call, under the row lock,
+-- so concurrent /character requests can't overwrite each other's changes.
+--
+--   select public.patch_user_character('<user uuid>', '[
+--       {"op": "set",    "key": "alias",  "value": "Nightjar"},
+--       {"op": "append", "key": "powers", "value": "flight"}
+--   ]'::jsonb);
+--
+-- "set" replaces character.<key>; "append" adds value to the character.<key> array unless
+-- an equal element is already there (creating the array if needed).
+-- Returns the updated character, or null if the user has no profile row.
+
+create or replace function public.patch_user_character(p_user_id uuid, p_ops jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_character jsonb;
+    v_op        jsonb;
+    v_key       text;
+    v_current   jsonb;
+begin
+    if jsonb_typeof(p_ops) is distinct from 'array' then
+        raise exception 'patch_user_character: p_ops must be a JSON array';
+    end if;
+
+    select character into v_character
+    from public.user_profiles
+    where user_id = p_user_id
+    for update;
+    if not found then
+        return null;
+    end if;
+    if v_character is null or jsonb_typeof(v_character) <> 'object' then
+        v_character := '{}'::jsonb;
+    end if;
+
+    for v_op in select value from jsonb_array_elements(p_ops) loop
+        v_key := v_op->>'key';
+        if v_key is null or v_key = '' then
+            raise exception 'patch_user_character: every op needs a key';
+        end if;
+
+        if v_op->>'op' = 'set' then
+            v_character := jsonb_set(v_character, array[v_key], coalesce(v_op->'value', 'null'::jsonb), true);
+        elsif v_op->>'op' = 'append' then
+            v_current := v_character->v_key;
+            if v_current is null or jsonb_typeof(v_current) <> 'array' then
+                v_current := '[]'::jsonb;
+            end if;
+            if not exists (select 1 from jsonb_array_elements(v_current) e where e.value = v_op->'value') then
+                v_current := v_current || jsonb_build_array(v_op->'value');
+            end if;
+            v_character := jsonb_set(v_character, array[v_key], v_current, true);
+        else
+            raise exception 'patch_user_character: unknown op %', v_op->>'op';
+        end if;
+    end loop;
+
+    update public.user_profiles set character = v_character where user_id = p_user_id;
+    return v_character;
+end;
+$$;
+
+notify pgrst, 'reload schema';
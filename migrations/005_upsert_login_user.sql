@@ -0,0 +1,51 @@
+-- migrations/005_upsert_login_user.sql
+-- /token login in one round trip: upserts users (by email) and user_profiles (by user_id)
+-- and returns the user_id.
+--
+-- Returning users: provided (non-null) name / verification / picture values overwrite the
+-- stored ones; the password is never touched. current_bg and character are only filled
+-- when the profile has none yet, so a login can't reset a user's customisations.
+
+create unique index if not exists users_email_key on public.users (email);
+
+create or replace function public.upsert_login_user(
+    p_email          text,
+    p_username       text,
+    p_password       text,                 -- placeholder, used only when creating the user
+    p_first_name     text    default null,
+    p_last_name      text    default null,
+    p_email_verified boolean default null,
+    p_picture        text    default null,
+    p_current_bg     text    default 'black',
+    p_character      jsonb   default '{}'::jsonb
+)
+returns uuid
+language plpgsql
+as $$
+declare
+    v_user_id uuid;
+begin
+    insert into public.users as u (username, email, password, email_verified, first_name, last_name)
+    values (p_username, p_email, p_password, coalesce(p_email_verified, false), p_first_name, p_last_name)
+    on conflict (email) do update
+        set username       = coalesce(excluded.username, u.username),
+            email_verified = coalesce(p_email_verified, u.email_verified),
+            first_name     = coalesce(p_first_name, u.first_name),
+            last_name      = coalesce(p_last_name, u.last_name)
+    returning u.user_id into v_user_id;
+
+    insert into public.user_profiles as p (user_id, first_name, last_name, email, profile_picture_url, current_bg, character)
+    values (v_user_id, p_first_name, p_last_name, p_email, p_picture, p_current_bg, p_character)
+    on conflict (user_id) do update
+        set first_name          = coalesce(p_first_name, p.first_name),
+            last_name           = coalesce(p_last_name, p.last_name),
+            email               = coalesce(p_email, p.email),
+            profile_picture_url = coalesce(p_picture, p.profile_picture_url),
+            current_bg          = coalesce(p.current_bg, excluded.current_bg),
+            character           = coalesce(p.character, excluded.character);
+
+    return v_user_id;
+end;
+$$;
+
+notify pgrst, 'reload schema';
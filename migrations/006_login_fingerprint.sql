@@ -0,0 +1,63 @@
+-- migrations/006_login_fingerprint.sql
+-- Fingerprint (sha256) of the login fields last written for a user. upsert_login_user
+-- returns early, without writing, when the caller's fingerprint matches the stored one.
+
+alter table public.users
+    add column if not exists login_fingerprint text;
+
+-- New parameter list: drop the 005 signature so calls aren't ambiguous between overloads
+drop function if exists public.upsert_login_user(text, text, text, text, text, boolean, text, text, jsonb);
+
+create or replace function public.upsert_login_user(
+    p_email          text,
+    p_username       text,
+    p_password       text,                 -- placeholder, used only when creating the user
+    p_first_name     text    default null,
+    p_last_name      text    default null,
+    p_email_verified boolean default null,
+    p_picture        text    default null,
+    p_current_bg     text    default 'black',
+    p_character      jsonb   default '{}'::jsonb,
+    p_fingerprint    text    default null
+)
+returns uuid
+language plpgsql
+as $$
+declare
+    v_user_id     uuid;
+    v_fingerprint text;
+begin
+    if p_fingerprint is not null then
+        select user_id, login_fingerprint into v_user_id, v_fingerprint
+        from public.users
+        where email = p_email;
+        if found and v_fingerprint = p_fingerprint then
+            return v_user_id;  -- Nothing changed since the last login
+        end if;
+    end if;
+
+    insert into public.users as u (username, email, password, email_verified, first_name, last_name, login_fingerprint)
+    values (p_username, p_email, p_password, coalesce(p_email_verified, false), p_first_name, p_last_name, p_fingerprint)
+    on conflict (email) do update
+        set username          = coalesce(excluded.username, u.username),
+            email_verified    = coalesce(p_email_verified, u.email_verified),
+            first_name        = coalesce(p_first_name, u.first_name),
+            last_name         = coalesce(p_last_name, u.last_name),
+            login_fingerprint = coalesce(p_fingerprint, u.login_fingerprint)
+    returning u.user_id into v_user_id;
+
+    insert into public.user_profiles as p (user_id, first_name, last_name, email, profile_picture_url, current_bg, character)
+    values (v_user_id, p_first_name, p_last_name, p_email, p_picture, p_current_bg, p_character)
+    on conflict (user_id) do update
+        set first_name          = coalesce(p_first_name, p.first_name),
+            last_name           = coalesce(p_last_name, p.last_name),
+            email               = coalesce(p_email, p.email),
+            profile_picture_url = coalesce(p_picture, p.profile_picture_url),
+            current_bg          = coalesce(p.current_bg, excluded.current_bg),
+            character           = coalesce(p.character, excluded.character);
+
+    return v_user_id;
+end;
+$$;
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from app.services import admission
+from app.services.admission import Shed, _Gate, admission_scope, admit, hold_for_stream
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    gate = _Gate(limit=1, queue_max=1)
+    monkeypatch.setattr(admission, "_gate", gate)
+    monkeypatch.setattr(admission, "_user_buckets", admission.OrderedDict())
+    monkeypatch.setattr(admission, "QUEUE_WAIT_S", 0.05)
+    return gate
+
+
+def test_gate_sheds_when_the_queue_is_full_or_the_wait_times_out():
+    gate = _Gate(limit=1, queue_max=1)
+    assert gate.acquire(1.0) == 0.0
+    reasons = []
+
+    def wait():
+        try:
+            gate.acquire(0.2)
+        except Shed as shed:
+            reasons.append(shed.reason)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    while gate.queued == 0:
+        time.sleep(0.001)
+    with pytest.raises(Shed) as full:
+        gate.acquire(1.0)
+    assert full.value.reason == "queue_full"
+    waiter.join()
+    assert reasons == ["timeout"]
+    with pytest.raises(Shed) as late:
+        gate.acquire(0.01)
+    assert late.value.reason == "timeout"
+    assert gate.active == 1 and gate.queued == 0
+
+
+def test_gate_admits_waiters_in_order():
+    gate = _Gate(limit=1, queue_max=3)
+    gate.acquire(1.0)
+    order = []
+
+    def wait(name):
+        gate.acquire(2.0)
+        order.append(name)
+        gate.release()
+
+    waiters = []
+    for name in ("first", "second", "third"):
+        waiters.append(threading.Thread(target=wait, args=(name,)))
+        waiters[-1].start()
+        while gate.queued < len(waiters):
+            time.sleep(0.001)
+    gate.release()
+    for waiter in waiters:
+        waiter.join()
+    assert order == ["first", "second", "third"]
+    assert gate.active == 0
+
+
+def test_zero_limit_disables_the_gate():
+    gate = _Gate(limit=0, queue_max=0)
+    assert [gate.acquire(0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert gate.active == 0
+
+
+def test_user_over_rate_is_shed_before_taking_a_slot(gate, monkeypatch):
+    monkeypatch.setattr(admission, "USER_BURST", 1)
+    with admission_scope():
+        admit("u1")
+    with admission_scope():
+        with pytest.raises(Shed) as shed:
+            admit("u1")
+    assert shed.value.reason == "user_rate"
+    assert gate.active == 0
+
+
+def test_scope_releases_the_slot_unless_handed_to_a_stream(gate):
+    with admission_scope():
+        admit("u1")
+        assert gate.active == 1
+    assert gate.active == 0
+
+    with admission_scope():
+        admit("u1")
+        body = hold_for_stream(iter(["a", "b"]))
+    assert gate.active == 1  # Held until the body is written
+    assert list(body) == ["a", "b"]
+    assert gate.active == 0
+
+
+def test_closing_an_unread_stream_releases_the_slot_once(gate):
+    with admission_scope():
+        admit("u1")
+        body = hold_for_stream(iter(["a"]))
+    body.close()
+    body.close()
+    assert gate.active == 0
+
+
+def test_hold_for_stream_without_a_ticket_passes_chunks_through():
+    chunks = iter(["a"])
+    with admission_scope():
+        assert hold_for_stream(chunks) is chunks
@@ -0,0 +1,45 @@
+import pytest
+
+from app.services import filler_stream
+from app.services.filler_stream import FILLER_PHRASES, choose_filler
+
+
+@pytest.fixture
+def mode(monkeypatch):
+    def set_mode(value):
+        monkeypatch.setattr(filler_stream, "FILLER_STREAM_MODE", value)
+    return set_mode
+
+
+def test_off_mode_and_empty_queries_get_no_filler(mode):
+    mode("off")
+    assert choose_filler("How do I start?", {"interaction_style": "friendly"}) is None
+    mode("always")
+    assert choose_filler("   ", {"interaction_style": "friendly"}) is None
+
+
+def test_preference_mode_needs_a_style_with_phrases(mode):
+    mode("preference")
+    assert choose_filler("How do I start?", {"interaction_style": "formal"}) in FILLER_PHRASES["formal"]["question"]
+    assert choose_filler("How do I start?", {"interaction_style": "pirate"}) is None
+    assert choose_filler("How do I start?", {}) is None
+    assert choose_filler("How do I start?", None) is None
+
+
+def test_always_mode_falls_back_to_friendly(mode):
+    mode("always")
+    assert choose_filler("tell me a story", {"interaction_style": "pirate"}) in FILLER_PHRASES["friendly"]["general"]
+    assert choose_filler("tell me a story", None) in FILLER_PHRASES["friendly"]["general"]
+
+
+@pytest.mark.parametrize("value", ["preference", "always"])
+def test_opt_out_styles_never_get_filler(mode, value):
+    mode(value)
+    assert choose_filler("How do I start?", {"interaction_style": "Direct"}) is None
+    assert choose_filler("How do I start?", {"interaction_style": "concise"}) is None
+
+
+def test_topic_picks_habit_phrases_from_keywords(mode):
+    mode("preference")
+    assert choose_filler("tell me about cue design", {"interaction_style": "casual"},
+                         keywords=["cue"]) in FILLER_PHRASES["casual"]["habit"]
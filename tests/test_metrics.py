@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from app.services.metrics import (
+    Histogram,
+    get_counter,
+    get_gauge,
+    get_histogram,
+    register_collector,
+    render_prometheus,
+    stats_collector,
+)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_latency_seconds", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(3.65)
+    assert snapshot["buckets"] == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+
+
+def test_histogram_sums_observations_from_all_threads():
+    histogram = Histogram("test_threads_seconds", buckets=(1.0,))
+    threads = [threading.Thread(target=lambda: [histogram.observe(0.5) for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert histogram.snapshot()["count"] == 8000
+
+
+def test_registry_returns_one_metric_per_name_and_labels():
+    assert get_counter("test_registry_total", {"a": "1", "b": "2"}) is get_counter("test_registry_total", {"b": "2", "a": "1"})
+    assert get_counter("test_registry_total", {"a": "1"}) is not get_counter("test_registry_total", {"a": "2"})
+
+
+def test_render_prometheus():
+    get_histogram("test_render_seconds", {"route": "/x"}, buckets=(0.5,)).observe(0.25)
+    get_counter("test_render_total", {"result": 'say "hi"'}).inc(3)
+    gauge = get_gauge("test_render_active")
+    gauge.inc(2)
+    gauge.dec()
+    register_collector("test_render_events_total", stats_collector({"hits": 2}), kind="counter")
+    register_collector("test_render_broken", lambda: 1 / 0)
+
+    lines = render_prometheus().splitlines()
+    assert "# TYPE test_render_seconds histogram" in lines
+    assert 'test_render_seconds_bucket{route="/x",le="0.5"} 1' in lines
+    assert 'test_render_seconds_bucket{route="/x",le="+Inf"} 1' in lines
+    assert 'test_render_seconds_sum{route="/x"} 0.25' in lines
+    assert 'test_render_seconds_count{route="/x"} 1' in lines
+    assert 'test_render_total{result="say \\"hi\\""} 3' in lines
+    assert "test_render_active 1" in lines
+    assert "# TYPE test_render_events_total counter" in lines
+    assert 'test_render_events_total{event="hits"} 2' in lines
+    assert not any(line.startswith("test_render_broken") or line.endswith("test_render_broken gauge") for line in lines)
@@ -0,0 +1,64 @@
+import threading
+
+from app.services import profiler
+from app.services.profiler import SamplingProfiler
+
+
+def test_collapsed_lists_stacks_by_count():
+    sampler = SamplingProfiler(duration_s=1)
+    sampler.stacks.update({"worker;app:main:1;app:leaf:5": 2, "worker;app:main:1": 5})
+    assert sampler.collapsed() == "worker;app:main:1 5\nworker;app:main:1;app:leaf:5 2\n"
+
+
+def test_collapsed_is_a_newline_when_nothing_was_sampled():
+    assert SamplingProfiler(duration_s=1).collapsed() == "\n"
+
+
+def test_settings_are_clamped(monkeypatch):
+    monkeypatch.setattr(profiler, "MAX_DURATION_S", 5.0)
+    sampler = SamplingProfiler(duration_s=600, interval_s=0)
+    assert sampler.duration_s == 5.0
+    assert sampler.interval_s == 0.001
+    assert SamplingProfiler(duration_s=0).duration_s == 0.1
+
+
+def _spin_until(started: threading.Event, stop: threading.Event) -> None:
+    started.set()
+    while not stop._flag:  # Attribute read, so the leaf frame stays in this function
+        pass
+
+
+def _park(started: threading.Event, stop: threading.Event) -> None:
+    started.set()
+    stop.wait()
+
+
+def _sample_thread(target, include_idle=False):
+    started, stop = threading.Event(), threading.Event()
+    thread = threading.Thread(target=target, args=(started, stop), name="background-job_3")
+    thread.start()
+    started.wait()
+    try:
+        sampler = SamplingProfiler(duration_s=1, include_idle=include_idle)
+        sampler._sample(threading.get_ident(), {thread.ident: thread.name})
+        return sampler
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_sampled_stacks_are_rooted_at_the_thread_prefix():
+    sampler = _sample_thread(_spin_until)
+    assert sampler.samples == 1
+    stacks = [stack for stack in sampler.stacks if stack.startswith("background-job;")]
+    assert len(stacks) == 1
+    frames = stacks[0].split(";")
+    assert frames[-1].startswith(f"{__name__}:_spin_until:")
+    assert all(frame.count(":") >= 2 for frame in frames[1:])
+    assert f"{stacks[0]} 1\n" in sampler.collapsed()
+
+
+def test_idle_threads_are_skipped_unless_requested():
+    assert not any(stack.startswith("background-job;") for stack in _sample_thread(_park).stacks)
+    idle = _sample_thread(_park, include_idle=True)
+    assert any(stack.startswith("background-job;") and ":wait:" in stack for stack in idle.stacks)
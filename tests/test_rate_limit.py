@@ -0,0 +1,42 @@
+import pytest
+
+from app.services import rate_limit
+from app.services.rate_limit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_refill(clock):
+    bucket = TokenBucket(rate_per_s=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock[0] += 0.5  # One token back
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock[0] += 60  # Refill stops at capacity
+    assert bucket.available == 3
+
+
+def test_reserve_queues_callers(clock):
+    bucket = TokenBucket(rate_per_s=4, capacity=1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.25)
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert not bucket.try_acquire()
+
+
+def test_penalize_empties_bucket_for_the_given_time(clock):
+    bucket = TokenBucket(rate_per_s=1, capacity=5)
+    bucket.penalize(3)
+    assert bucket.reserve() == pytest.approx(4)
+    clock[0] += 4
+    assert bucket.available == pytest.approx(0)
+
+
+def test_rejects_non_positive_settings():
+    with pytest.raises(ValueError):
+        TokenBucket(rate_per_s=0, capacity=1)
@@ -0,0 +1,56 @@
+import io
+import json
+import types
+
+import pytest
+
+from app.services import artifact_store
+from app.services import streaming_ingest
+from app.services.streaming_ingest import ingest_json_stream
+
+
+def _ingest(body, monkeypatch, tmp_path, use_ijson=False):
+    monkeypatch.setattr(artifact_store, "ARTIFACT_DIR", tmp_path)
+    if not use_ijson:
+        monkeypatch.setattr(streaming_ingest, "ijson", None)
+    ingested = ingest_json_stream(io.BytesIO(json.dumps(body).encode("utf-8")))
+    ingested.rehydrate()
+    return ingested.payload
+
+
+def test_long_top_level_strings_in_spooled_array(monkeypatch, tmp_path):
+    # Items longer than a read chunk reach the array as several string_part events
+    long_item = "x" * (streaming_ingest.READ_CHUNK_SIZE * 4 + 17)
+    body = {"message": {"type": "status-update",
+                        "messages": [long_item, {"role": "user", "content": "hi"}, "short", long_item + "y"]}}
+    assert _ingest(body, monkeypatch, tmp_path) == body
+
+
+def test_spooled_array_with_nested_items(monkeypatch, tmp_path):
+    body = {"message": {"type": "status-update",
+                        "artifact": {"messages": [{"role": "bot", "message": "a" * 200_000, "tags": [1, 2.5, None]},
+                                                  [], "", True]}}}
+    assert _ingest(body, monkeypatch, tmp_path) == body
+
+
+@pytest.mark.parametrize("raw", [b'}', b'{"message": {}}}', b'{"message": [1, 2}}', b'{"a": 1]', b']'])
+def test_unbalanced_containers_are_value_errors(raw, monkeypatch, tmp_path):
+    monkeypatch.setattr(artifact_store, "ARTIFACT_DIR", tmp_path)
+    monkeypatch.setattr(streaming_ingest, "ijson", None)
+    with pytest.raises(ValueError):
+        ingest_json_stream(io.BytesIO(raw))
+
+
+def test_ijson_errors_are_value_errors(monkeypatch, tmp_path):
+    class JSONError(Exception):
+        pass
+
+    def basic_parse(stream, use_float=False):
+        yield "start_map", None
+        raise JSONError("Incomplete JSON content")
+
+    fake_ijson = types.SimpleNamespace(JSONError=JSONError, basic_parse=basic_parse)
+    monkeypatch.setattr(artifact_store, "ARTIFACT_DIR", tmp_path)
+    monkeypatch.setattr(streaming_ingest, "ijson", fake_ijson)
+    with pytest.raises(ValueError):
+        ingest_json_stream(io.BytesIO(b'{"message": '))
@@ -0,0 +1,101 @@
+import copy
+import json
+import time
+
+import pytest
+
+from app.functions import get_custom_llm_streaming as streaming
+from app.functions.get_custom_llm_streaming import _boundary_cut, generate_streaming_response, rechunk_for_tts
+
+
+class _Delta:
+    def __init__(self, content=None, tool_calls=None):
+        self.content = content
+        self.tool_calls = tool_calls
+
+
+class _Choice:
+    def __init__(self, delta, finish_reason=None):
+        self.delta = delta
+        self.finish_reason = finish_reason
+
+
+class _Chunk:
+    """Just enough of openai's ChatCompletionChunk for the re-chunker."""
+
+    def __init__(self, content=None, finish_reason=None, tool_calls=None):
+        self.choices = [_Choice(_Delta(content, tool_calls), finish_reason)]
+
+    def model_copy(self, deep=False):
+        return copy.deepcopy(self) if deep else copy.copy(self)
+
+    def model_dump_json(self):
+        choice = self.choices[0]
+        return json.dumps({"content": choice.delta.content, "finish_reason": choice.finish_reason})
+
+
+def _contents(chunks):
+    return [chunk.choices[0].delta.content for chunk in chunks]
+
+
+@pytest.fixture(autouse=True)
+def _no_delay_flush(monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_RECHUNK_MAX_DELAY_S", 60.0)
+    monkeypatch.setattr(streaming, "SSE_RECHUNK_MIN_CHARS", 10)
+
+
+@pytest.mark.parametrize("text, cut", [
+    ("Hello there, how are you", 12),
+    ("Short, text", 0),  # Boundary before SSE_RECHUNK_MIN_CHARS
+    ("It costs 3.", 0),  # A trailing boundary may still continue ("3.14")
+    ("It costs 3.14 today. And", 20),
+    ("First sentence. Second one. Third", 27),
+])
+def test_boundary_cut(text, cut):
+    assert _boundary_cut(text) == cut
+
+
+def test_text_deltas_merge_on_boundaries():
+    deltas = ["Hel", "lo there", ", how", " are", " you? ", "Fine"]
+    out = list(rechunk_for_tts(iter([_Chunk(d) for d in deltas] + [_Chunk(finish_reason="stop")])))
+    assert _contents(out) == ["Hello there,", " how are you?", " Fine", None]
+    assert out[-1].choices[0].finish_reason == "stop"
+
+
+def test_tool_calls_flush_the_buffer_and_pass_through():
+    tool_call = _Chunk(tool_calls=[{"id": "call_1"}])
+    out = list(rechunk_for_tts(iter([_Chunk("Let me check"), tool_call, _Chunk("Done")])))
+    assert _contents(out) == ["Let me check", None, "Done"]
+    assert out[1] is tool_call
+
+
+def test_buffered_text_is_sent_after_the_max_delay(monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_RECHUNK_MAX_DELAY_S", 0.01)
+
+    def slow():
+        yield _Chunk("Thinking")
+        time.sleep(0.2)
+        yield _Chunk(" more")
+
+    started = time.monotonic()
+    stream = rechunk_for_tts(slow())
+    assert _contents([next(stream)]) == ["Thinking"]
+    assert time.monotonic() - started < 0.15
+    assert _contents(list(stream)) == [" more"]
+
+
+def test_upstream_errors_are_raised_after_flushing():
+    def failing():
+        yield _Chunk("Partial text")
+        raise RuntimeError("upstream closed")
+
+    stream = rechunk_for_tts(failing())
+    assert _contents([next(stream)]) == ["Partial text"]
+    with pytest.raises(RuntimeError, match="upstream closed"):
+        next(stream)
+
+
+def test_generate_streaming_response_writes_sse_frames(monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_RECHUNK_ENABLED", False)
+    frames = list(generate_streaming_response(iter([_Chunk("Hi")])))
+    assert frames == ['data: {"content": "Hi", "finish_reason": null}\n\n']
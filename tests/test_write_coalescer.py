@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+from app.services import write_coalescer
+from app.services.write_coalescer import ProfileWriteCoalescer, merge_character_ops
+
+
+@pytest.fixture(autouse=True)
+def _no_app_context(monkeypatch):
+    monkeypatch.setattr(write_coalescer, "has_app_context", lambda: False)
+
+
+def _coalescer(tmp_path, settings_ok=True):
+    writes = []
+
+    def apply_settings(user_id, settings):
+        writes.append(("settings", user_id, dict(settings)))
+        return settings_ok
+
+    def apply_character_ops(user_id, ops):
+        writes.append(("character", user_id, list(ops)))
+        return True
+
+    coalescer = ProfileWriteCoalescer(apply_settings, apply_character_ops, window_s=60, max_delay_s=60,
+                                      db_path=str(tmp_path / "writes.db"))
+    coalescer._ensure_thread = lambda: None  # Tests flush explicitly
+    return coalescer, writes
+
+
+def _journal_rows(coalescer, where="1 = 1"):
+    conn = sqlite3.connect(coalescer._db_path)
+    try:
+        return conn.execute(f"SELECT user_id, kind, dead FROM pending_profile_writes WHERE {where}").fetchall()
+    finally:
+        conn.close()
+
+
+def test_merge_character_ops():
+    ops = [{"op": "set", "key": "name", "value": "A"},
+           {"op": "append", "key": "goals", "value": "run"},
+           {"op": "set", "key": "name", "value": "B"},
+           {"op": "append", "key": "goals", "value": "run"},
+           {"op": "append", "key": "goals", "value": "read"}]
+    assert merge_character_ops(ops) == [{"op": "append", "key": "goals", "value": "run"},
+                                        {"op": "set", "key": "name", "value": "B"},
+                                        {"op": "append", "key": "goals", "value": "read"}]
+
+
+def test_updates_coalesce_into_one_write_per_user(tmp_path):
+    coalescer, writes = _coalescer(tmp_path)
+    coalescer.submit_settings("u1", {"current_bg": "red"})
+    coalescer.submit_settings("u1", {"current_bg": "blue", "theme": "dark"})
+    coalescer.submit_character_ops("u1", [{"op": "set", "key": "name", "value": "Ana"}])
+    assert coalescer.overlay("u1", {"current_bg": "white"}, lambda character, ops: {"ops": ops})["current_bg"] == "blue"
+
+    coalescer.flush()
+    assert writes == [("settings", "u1", {"current_bg": "blue", "theme": "dark"}),
+                      ("character", "u1", [{"op": "set", "key": "name", "value": "Ana"}])]
+    assert not coalescer.has_pending("u1")
+    assert _journal_rows(coalescer) == []
+
+
+def test_adopted_rows_go_under_newer_pending_updates(tmp_path):
+    coalescer, writes = _coalescer(tmp_path)
+    conn = coalescer._connect()
+    conn.execute("INSERT INTO pending_profile_writes (user_id, kind, payload, owner, heartbeat) "
+                 "VALUES ('u1', 'settings', ?, 'dead-worker', 0)", (json.dumps({"current_bg": "red", "theme": "dark"}),))
+    conn.commit()
+    conn.close()
+    coalescer.submit_settings("u1", {"current_bg": "blue"})
+
+    coalescer._heartbeat_and_recover()
+    coalescer.flush()
+    assert writes == [("settings", "u1", {"current_bg": "blue", "theme": "dark"})]
+    assert coalescer.stats["recovered"] == 1
+    assert _journal_rows(coalescer) == []
+
+
+def test_failing_write_is_dead_lettered_not_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_coalescer, "MAX_WRITE_ATTEMPTS", 2)
+    coalescer, writes = _coalescer(tmp_path, settings_ok=False)
+    coalescer.submit_settings("u1", {"current_bg": "red"})
+
+    coalescer.flush()
+    assert coalescer.has_pending("u1")  # Retried after a backoff
+    coalescer.flush()
+    assert len(writes) == 2
+    assert not coalescer.has_pending("u1")
+    assert coalescer.stats["dead_lettered"] == 1
+    assert _journal_rows(coalescer) == [("u1", "settings", 1)]
+
+    # Dead letters are not adopted again by the recovery sweep
+    coalescer._last_heartbeat = 0.0
+    monkeypatch.setattr(write_coalescer.time, "time", lambda: time.monotonic() + 10 ** 6)
+    coalescer._heartbeat_and_recover()
+    assert not coalescer.has_pending("u1")
+
+
+def test_window_zero_writes_through(tmp_path):
+    coalescer, writes = _coalescer(tmp_path)
+    coalescer.window_s = 0
+    assert coalescer.submit_settings("u1", {"current_bg": "red"}) is True
+    assert writes == [("settings", "u1", {"current_bg": "red"})]